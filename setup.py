@@ -37,6 +37,7 @@ setup(
     },
     install_requires=[
         'six>=1.5,<2',
+        'futures>=3,<4; python_version < "3.2"',
     ],
     extras_require={
         'dev': [
@@ -52,6 +53,9 @@ setup(
             'tox>=2,<3',
             'flake8>=2.5.0,<3',
         ],
+        'pyarrow': [
+            'pyarrow>=6',
+        ],
     },
     test_suite='nose.collector',
 )
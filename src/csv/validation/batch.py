@@ -0,0 +1,38 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+from schema import Schema
+
+
+__all__ = (
+    'validate_many',
+)
+
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def validate_many(schema, sources, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Validates sources concurrently in a thread pool.
+
+    Every source is validated by its own validator instance, with its own
+    logger, failures, and validator state, so results never mix. Threads
+    help most with I/O-bound loaders (and with CPU-bound validation on
+    free-threaded Python builds).
+
+    :param schema: ``Schema`` or ``BaseFileValidator`` subclass
+    :param sources: Iterable of loaders
+    :param max_workers: Number of threads
+    :returns: List of ``Result``, in the order of ``sources``
+    :rtype: list
+    """
+    if not isinstance(schema, Schema):
+        schema = Schema(schema)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(schema.run, sources))
@@ -0,0 +1,132 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import sys
+import time
+import collections
+
+
+__all__ = (
+    'Progress',
+    'Budget',
+    'BudgetTracker',
+    'current_rss',
+    'traced_memory',
+)
+
+
+Progress = collections.namedtuple('Progress', 'rows, bytes, seconds, reason')
+
+DEFAULT_CHECK_EVERY = 1000
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes.
+
+    Reads ``/proc/self/statm`` where available, and falls back to the peak
+    resident set size reported by ``getrusage``.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # KiB
+
+
+def traced_memory():
+    """
+    Returns the memory allocated by Python, as traced by ``tracemalloc``.
+
+    Returns ``0`` unless ``tracemalloc`` is tracing.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return 0
+    return tracemalloc.get_traced_memory()[0]
+
+
+class Budget(object):
+    """
+    Resource limits for one validation run.
+
+    Budgets are checked every ``check_every`` rows, so checking is cheap;
+    runs may overshoot a budget by up to that many rows.
+
+    :param deadline: Wall-clock seconds the run may take
+    :param max_memory: Bytes of memory, as measured by ``memory``
+    :param max_bytes: Bytes of input the run may read (characters of text
+        loaders)
+    :param memory: Function returning the memory in use, e.g.
+        ``current_rss`` or ``traced_memory``
+    """
+
+    def __init__(self, deadline=None, max_memory=None, max_bytes=None,
+                 check_every=DEFAULT_CHECK_EVERY, memory=current_rss):
+        self.deadline = deadline
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self.check_every = check_every
+        self.memory = memory
+
+    def start(self):
+        """ Returns a tracker for a run starting now """
+        return BudgetTracker(self)
+
+    def __repr__(self):
+        return "{}(deadline={}, max_memory={}, max_bytes={})".format(
+            self.__class__.__name__, self.deadline, self.max_memory,
+            self.max_bytes)
+
+
+class BudgetTracker(object):
+    """ Tracks one run against a ``Budget`` """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.started = time.time()
+        self.bytes = 0
+        self.reason = None
+
+    def count(self, lines):
+        """ Yields lines, counting their length against ``max_bytes`` """
+        for line in lines:
+            self.bytes += len(line)
+            yield line
+
+    def limit(self, rows):
+        """ Yields rows until a budget is exceeded """
+        every = self.budget.check_every
+        for idx, row in enumerate(rows, 1):
+            yield row
+            if not idx % every and self.exceeded():
+                return
+
+    def exceeded(self):
+        """ Checks the budgets, recording the reason a budget is exceeded """
+        budget = self.budget
+        if budget.deadline is not None and \
+                time.time() - self.started > budget.deadline:
+            self.reason = 'deadline of {}s exceeded'.format(budget.deadline)
+        elif budget.max_bytes is not None and self.bytes > budget.max_bytes:
+            self.reason = 'input budget of {} bytes exceeded'.format(
+                budget.max_bytes)
+        elif budget.max_memory is not None and \
+                budget.memory() > budget.max_memory:
+            self.reason = 'memory budget of {} bytes exceeded'.format(
+                budget.max_memory)
+        return self.reason is not None
+
+    def progress(self, rows):
+        return Progress(rows, self.bytes, time.time() - self.started,
+                        self.reason)
@@ -0,0 +1,35 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import six
+
+
+__all__ = (
+    'DEFAULT_ENCODING',
+    'to_text',
+    'to_bytes',
+)
+
+
+DEFAULT_ENCODING = 'utf-8'
+
+
+def to_text(value, encoding=DEFAULT_ENCODING):
+    """
+    Decodes bytes for display; other values are returned unchanged.
+
+    On Python 2, byte strings are already native strings and are returned
+    unchanged.
+    """
+    if six.PY3 and isinstance(value, six.binary_type):
+        return value.decode(encoding, 'replace')
+    return value
+
+
+def to_bytes(value, encoding=DEFAULT_ENCODING):
+    """ Encodes text to bytes; other values are returned unchanged """
+    if isinstance(value, six.text_type):
+        return value.encode(encoding)
+    return value
@@ -0,0 +1,133 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import re
+import csv
+import json
+import tempfile
+import threading
+import collections
+
+
+from compat import to_text
+
+
+__all__ = (
+    'Dialect',
+    'detect_dialect',
+    'DialectCache',
+)
+
+
+Dialect = collections.namedtuple('Dialect', 'delimiter, quotechar')
+
+DEFAULT_DIALECT = Dialect(',', '"')
+DEFAULT_DELIMITERS = ',;|\t'
+DEFAULT_PREFIX_SIZE = 64 * 1024
+
+
+def detect_dialect(sample, delimiters=DEFAULT_DELIMITERS):
+    """
+    Detects the delimiter and quote character of a prefix of a CSV source.
+
+    The last line of the sample is ignored, as it may be cut short. Sources
+    the ``csv.Sniffer`` cannot decide on get the delimiter among
+    ``delimiters`` that splits every sampled line into the same, largest,
+    number of fields, or the default dialect.
+
+    :param sample: Text or bytes
+    :rtype: Dialect
+    """
+    lines = to_text(sample).splitlines()
+    if len(lines) > 1:
+        lines = lines[:-1]
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return DEFAULT_DIALECT
+    try:
+        sniffed = csv.Sniffer().sniff('\n'.join(lines), delimiters)
+        return Dialect(sniffed.delimiter, sniffed.quotechar or '"')
+    except csv.Error:
+        pass
+    best, fields = DEFAULT_DIALECT.delimiter, 1
+    for delimiter in delimiters:
+        counts = set(len(record) for record in
+                     csv.reader(lines, delimiter=delimiter))
+        count = counts.pop() if len(counts) == 1 else 0
+        if count > fields:
+            best, fields = delimiter, count
+    return Dialect(best, DEFAULT_DIALECT.quotechar)
+
+
+class DialectCache(object):
+    """
+    Detected dialects by source pattern or partner.
+
+    Detection reads a prefix of ``prefix_size`` bytes of the first source of
+    each key; later sources with the same key reuse the result. The default
+    key is the source path with runs of digits in the file name replaced, so
+    e.g. the daily files ``feed-20160101.csv`` and ``feed-20160102.csv``
+    share a dialect.
+
+    :param path: If given, a JSON file the cache is loaded from and saved to,
+        so detections persist across processes
+    """
+
+    def __init__(self, path=None, prefix_size=DEFAULT_PREFIX_SIZE,
+                 delimiters=DEFAULT_DELIMITERS):
+        self.path = path
+        self.prefix_size = prefix_size
+        self.delimiters = delimiters
+        self.lock = threading.Lock()
+        self.dialects = {}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.dialects = {key: Dialect(*map(str, value))
+                                 for key, value in json.load(f).items()}
+
+    def key(self, source):
+        """ Returns the default key of a loader: its source pattern """
+        directory, name = os.path.split(
+            str(getattr(source, 'source', source)))
+        return os.path.join(directory, re.sub(r'\d+', '#', name))
+
+    def detect(self, source, key=None):
+        """ Returns the cached dialect for ``key``, detecting it once """
+        key = self.key(source) if key is None else key
+        with self.lock:
+            dialect = self.dialects.get(key)
+        if dialect is None:
+            dialect = detect_dialect(source.head(self.prefix_size),
+                                     self.delimiters)
+            with self.lock:
+                self.dialects[key] = dialect
+                self.save()
+        return dialect
+
+    def discard(self, key):
+        """ Forgets the dialect for ``key``, e.g. when it did not match """
+        with self.lock:
+            if self.dialects.pop(key, None) is not None:
+                self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        fd, saving = tempfile.mkstemp(
+            prefix=os.path.basename(self.path) + '.',
+            dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.dialects, f)
+        getattr(os, 'replace', os.rename)(saving, self.path)
+
+    def __contains__(self, key):
+        return key in self.dialects
+
+    def __len__(self):
+        return len(self.dialects)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.dialects)
@@ -0,0 +1,256 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import uuid
+import sqlite3
+import weakref
+import itertools
+import threading
+import collections
+
+
+import six
+
+
+from compat import to_text
+from exceptions import ValidationConfigurationException
+
+
+__all__ = (
+    'FailureRecord',
+    'InMemoryFailureStore',
+    'SQLiteFailureStore',
+)
+
+
+FailureRecord = collections.namedtuple(
+    'FailureRecord', 'field, line, validator, message, value')
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_LOG_LIMIT = 30
+
+
+def _line_failures():
+    return collections.defaultdict(list)
+
+
+class InMemoryFailureStore(collections.defaultdict):
+    """
+    Keeps validation failures in memory, by field name and line.
+
+    This is the default failure store. It is a nested dictionary of lists of
+    exceptions, e.g. ``failures['field'][line]``.
+    """
+
+    log_limit = None  # Lines with failures logged per field, all if None
+
+    def __init__(self):
+        super(InMemoryFailureStore, self).__init__(_line_failures)
+
+    def add(self, field_name, line, exc, validator=None, value=None):
+        self[field_name][line].append(exc)
+
+    def flush(self):
+        pass
+
+    def line_count(self, field_name):
+        """ Returns the number of lines with failures on a field """
+        return len(self.get(field_name, ()))
+
+    def iterfailures(self, lines_per_field=None):
+        """
+        Yields ``(field name, line, errors)`` grouped by field, for at most
+        ``lines_per_field`` lines of each field
+        """
+        for field_name, field_failure in six.iteritems(self):
+            for line, errors in itertools.islice(six.iteritems(field_failure),
+                                                 lines_per_field):
+                yield field_name, line, errors
+
+
+class SQLiteFailureStore(object):
+    """
+    Writes validation failures to a SQLite database.
+
+    Failures are buffered and inserted in batches of ``batch_size`` with
+    ``executemany``, one transaction per batch, so memory stays bounded no
+    matter how dirty the source is. Each record holds the field, line,
+    validator, message, and failing value. The database may be queried after
+    the run without re-validating. Only the first ``log_limit`` lines with
+    failures of each field are logged; the rest stay in the database.
+
+    Records are kept by ``run``, a new id unless given, and the store only
+    sees the records of its run: a database keeps the failures of earlier
+    runs, and a store opened with the ``run`` of an earlier one replaces
+    them. Only one store of a process may have a database open at a time.
+    Set as the ``failure_store`` of a ``BaseFileValidator``, e.g. with
+    ``functools.partial(SQLiteFailureStore, '/path/to/failures.db')``.
+
+    :raises ValidationConfigurationException: If another store has the
+        database open
+    """
+
+    open_stores = weakref.WeakValueDictionary()  # Stores by database path
+    open_lock = threading.Lock()
+
+    def __init__(self, path=':memory:', batch_size=DEFAULT_BATCH_SIZE,
+                 log_limit=DEFAULT_LOG_LIMIT, run=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.log_limit = log_limit
+        self.run = run or uuid.uuid4().hex
+        self._batch = []
+        self._indexed = False
+        self._key = None if path in (':memory:', '') \
+            else os.path.abspath(path)
+        if self._key is not None:
+            with self.open_lock:
+                if self.open_stores.get(self._key) is not None:
+                    raise ValidationConfigurationException(
+                        'Failure store {} is already open'.format(path))
+                self.open_stores[self._key] = self
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA synchronous = OFF')
+        with self.connection:
+            columns = [column[1] for column in self.connection.execute(
+                'PRAGMA table_info(failures)')]
+            if columns and 'run' not in columns:  # Written without runs
+                self.connection.execute('DROP TABLE failures')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS failures (id INTEGER PRIMARY KEY, '
+                'run TEXT, field TEXT, line, validator TEXT, message TEXT, '
+                'value TEXT)')
+            self.connection.execute('DELETE FROM failures WHERE run = ?',
+                                    (self.run,))
+
+    def add(self, field_name, line, exc, validator=None, value=None):
+        self._batch.append((
+            self.run, field_name, line,
+            validator.__class__.__name__ if validator is not None else None,
+            str(exc), to_text(value)))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Inserts buffered failures """
+        if self._batch:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT INTO failures (run, field, line, validator, '
+                    'message, value) VALUES (?, ?, ?, ?, ?, ?)', self._batch)
+            self._batch = []
+
+    def query(self, sql, parameters=()):
+        """ Runs a query after flushing and indexing the failures """
+        self.flush()
+        if not self._indexed:
+            with self.connection:
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS failures_run_field_line '
+                    'ON failures (run, field, line)')
+            self._indexed = True
+        return self.connection.execute(sql, parameters)
+
+    def __len__(self):
+        return self.query('SELECT COUNT(*) FROM failures WHERE run = ?',
+                          (self.run,)).fetchone()[0]
+
+    def __bool__(self):
+        return self.query('SELECT 1 FROM failures WHERE run = ? LIMIT 1',
+                          (self.run,)).fetchone() is not None
+
+    __nonzero__ = __bool__
+
+    def fields(self):
+        """ Returns the names of fields with failures """
+        return [field for field, in self.query(
+            'SELECT DISTINCT field FROM failures WHERE run = ? '
+            'ORDER BY field', (self.run,))]
+
+    def line_count(self, field_name):
+        """ Returns the number of lines with failures on a field """
+        return self.query(
+            'SELECT COUNT(DISTINCT line) FROM failures '
+            'WHERE run = ? AND field = ?',
+            (self.run, field_name)).fetchone()[0]
+
+    def top_values(self, field_name, limit=10):
+        """
+        Returns the most frequent failing values of a field.
+
+        :returns: List of ``(value, count)`` tuples, most frequent first
+        :rtype: list
+        """
+        return self.query(
+            'SELECT value, COUNT(*) AS n FROM failures '
+            'WHERE run = ? AND field = ? '
+            'GROUP BY value ORDER BY n DESC, value LIMIT ?',
+            (self.run, field_name, limit)).fetchall()
+
+    def row_range(self, start, stop):
+        """
+        Returns failures on lines ``start`` (inclusive) to ``stop``.
+
+        :rtype: list of ``FailureRecord``
+        """
+        return [FailureRecord(*record) for record in self.query(
+            'SELECT field, line, validator, message, value '
+            'FROM failures WHERE run = ? AND line >= ? AND line < ? '
+            'ORDER BY line, id', (self.run, start, stop))]
+
+    def iterfailures(self, page_size=DEFAULT_PAGE_SIZE,
+                     lines_per_field=None):
+        """
+        Yields ``(field name, line, messages)`` grouped by field and line,
+        for at most ``lines_per_field`` lines of each field.
+
+        Failures are read in pages of ``page_size`` records, so the whole
+        store is never loaded into memory.
+        """
+        select = 'SELECT field, line, id, message FROM failures WHERE run = ? '
+        order = ' ORDER BY field, line, id LIMIT ?'
+        page = self.query(select + order, (self.run, page_size)).fetchall()
+        group, messages, lines = None, [], 0
+        while True:
+            for field_name, line, idx, message in page:
+                if (field_name, line) != group:
+                    if group is not None:
+                        yield group[0], group[1], messages
+                    lines = lines + 1 if group and group[0] == field_name \
+                        else 1
+                    group, messages = (field_name, line), []
+                    if lines_per_field is not None and \
+                            lines > lines_per_field:
+                        break
+                messages.append(message)
+            else:
+                if len(page) < page_size:
+                    break
+                field_name, line, idx = page[-1][:3]
+                page = self.query(
+                    select + 'AND (field > ? OR (field = ? AND (line > ? OR '
+                    '(line = ? AND id > ?))))' + order,
+                    (self.run, field_name, field_name, line, line, idx,
+                     page_size)).fetchall()
+                continue
+            # Skip the other lines of a field over its limit
+            group = None
+            page = self.query(select + 'AND field > ?' + order,
+                              (self.run, field_name, page_size)).fetchall()
+        if group is not None:
+            yield group[0], group[1], messages
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+        if self._key is not None:
+            with self.open_lock:
+                if self.open_stores.get(self._key) is self:
+                    del self.open_stores[self._key]
+
+    def __repr__(self):
+        return "{}('{}')".format(self.__class__.__name__, self.path)
@@ -0,0 +1,225 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import sys
+import threading
+import collections
+
+
+import six
+
+
+from compat import DEFAULT_ENCODING
+from exceptions import LoaderException
+from loaders import Loader
+from schema import Schema
+
+
+__all__ = (
+    'FeedBuffer',
+    'FeedLoader',
+    'FeedSession',
+)
+
+
+DEFAULT_BUFFER_SIZE = 4 << 20
+
+
+class FeedBuffer(object):
+    """
+    Bounded buffer of lines between a producer and a validator thread.
+
+    Holds at most about ``max_size`` bytes (or characters) of lines: ``put``
+    blocks while adding a chunk would exceed it, unless the buffer is empty.
+    Once the reader ``abandon``-s the buffer, lines put are discarded.
+    """
+
+    def __init__(self, max_size=DEFAULT_BUFFER_SIZE):
+        self.max_size = max_size
+        self.chunks = collections.deque()  # ``(lines, size)`` tuples
+        self.size = 0
+        self.closed = False  # No more lines will be put
+        self.abandoned = False  # No more lines will be read
+        self.waiting = False  # ``put`` waits for room
+        self.condition = threading.Condition()
+
+    def put(self, lines, size):
+        """ Adds a list of lines of ``size`` in total, waiting for room """
+        with self.condition:
+            while self.size and self.size + size > self.max_size and \
+                    not self.abandoned:
+                self.waiting = True
+                self.condition.notify_all()
+                self.condition.wait()
+            self.waiting = False
+            if not self.abandoned:
+                self.chunks.append((lines, size))
+                self.size += size
+                self.condition.notify_all()
+
+    def get(self):
+        """ Returns the next list of lines, or ``None`` once closed """
+        with self.condition:
+            while not self.chunks and not self.closed:
+                self.condition.wait()
+            if not self.chunks:
+                return None
+            lines, size = self.chunks.popleft()
+            self.size -= size
+            self.condition.notify_all()
+            return lines
+
+    def peek(self, size):
+        """
+        Returns the lines buffered once ``size`` was buffered, the buffer is
+        full, or it is closed, without removing them
+        """
+        with self.condition:
+            while self.size < size and not self.closed and \
+                    not self.waiting and not self.abandoned:
+                self.condition.wait()
+            return [line for lines, _ in self.chunks for line in lines]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def abandon(self):
+        with self.condition:
+            self.abandoned = True
+            self.chunks.clear()
+            self.size = 0
+            self.condition.notify_all()
+
+
+class FeedLoader(Loader):
+    """ Streams the lines of a ``FeedBuffer``, once """
+
+    def __init__(self, source, buffer, binary=False,
+                 encoding=DEFAULT_ENCODING):
+        super(FeedLoader, self).__init__(source)
+        self.buffer = buffer
+        self.binary = binary
+        self.encoding = encoding
+
+    def open(self):
+        return list(self.stream())
+
+    def stream(self):
+        try:
+            while True:
+                lines = self.buffer.get()
+                if lines is None:
+                    return
+                for line in lines:
+                    yield line
+        finally:
+            self.buffer.abandon()  # Lines fed from now on are not read
+
+    def head(self, size):
+        lines = self.buffer.peek(size)
+        return (b'' if self.binary else '').join(lines)
+
+    def __repr__(self):
+        return "{}('{}')".format(self.__class__.__name__, self.source)
+
+
+class FeedSession(object):
+    """
+    Validates data pushed in chunks, e.g. read from a socket, a message
+    queue or a database cursor, without a file.
+
+    Chunks of bytes or text are split into lines, which a validator reads in
+    a thread as soon as they are complete, so records spanning chunks and
+    quoted fields spanning lines are parsed as from a file. ``feed`` blocks
+    while ``buffer_size`` bytes wait to be validated, so memory use stays
+    bounded when data arrives faster than it is validated, and lines may
+    not be longer than ``buffer_size``::
+
+        >>> session = FeedSession(schema, name='orders.csv')
+        >>> for chunk in iter(lambda: sock.recv(65536), b''):
+        ...     session.feed(chunk)
+        >>> result = session.close()
+
+    Rows fed after validation stopped, e.g. on a wrong header, are
+    discarded.
+
+    :param schema: ``Schema`` or ``BaseFileValidator`` subclass
+    :param name: Name of the source in logs
+    :param encoding: Encoding of chunks of bytes
+    """
+
+    def __init__(self, schema, name='<feed>', buffer_size=DEFAULT_BUFFER_SIZE,
+                 encoding=DEFAULT_ENCODING):
+        self.schema = schema if isinstance(schema, Schema) else Schema(schema)
+        self.name = name
+        self.encoding = encoding
+        self.buffer = FeedBuffer(buffer_size)
+        self.partial = []  # Pieces of the last line, until its end is fed
+        self.partial_size = 0
+        self.validator = None
+        self.thread = None
+        self.result = None
+        self.error = None
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of bytes or text, waiting for room in the buffer.
+
+        :raises LoaderException: If the last line fed, without its line
+            ending, is longer than ``buffer_size``
+        """
+        if not chunk:
+            return
+        if self.thread is None:
+            self.start(isinstance(chunk, six.binary_type))
+        newline = b'\n' if isinstance(chunk, six.binary_type) else '\n'
+        end = chunk.rfind(newline) + 1
+        if end:
+            lines = chunk[:end - 1].split(newline)
+            if self.partial:  # Joined once, when the line ends
+                lines[0] = chunk[:0].join(self.partial) + lines[0]
+            self.buffer.put([line + newline for line in lines],
+                            self.partial_size + end)
+            self.partial, self.partial_size = [], 0
+        if end < len(chunk):
+            self.partial.append(chunk[end:])
+            self.partial_size += len(chunk) - end
+            if self.partial_size > self.buffer.max_size:
+                raise LoaderException(
+                    "Line longer than the buffer size ({}) fed to {}".format(
+                        self.buffer.max_size, self.name))
+
+    def close(self):
+        """ Validates the rest of the data, returning the ``Result`` """
+        if self.thread is None:
+            self.start(False)
+        if self.partial:
+            self.buffer.put([self.partial[0][:0].join(self.partial)],
+                            self.partial_size)
+            self.partial, self.partial_size = [], 0
+        self.buffer.close()
+        self.thread.join()
+        if self.error is not None:
+            six.reraise(*self.error)
+        return self.result
+
+    def start(self, binary):
+        loader = FeedLoader(self.name, self.buffer, binary, self.encoding)
+        self.validator = self.schema.validator(loader)
+        self.thread = threading.Thread(target=self.run,
+                                       name='FeedSession({})'.format(
+                                           self.name))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.result = self.validator()
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            self.buffer.abandon()
@@ -0,0 +1,343 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import marshal
+import operator
+import itertools
+import sqlite3
+import hashlib
+import tempfile
+
+
+import six
+
+
+from compat import DEFAULT_ENCODING, to_bytes
+from structure import count_fields
+
+
+__all__ = (
+    'row_hashes',
+    'iterraw',
+    'iterbatches',
+    'PreviousRun',
+    'RowAligner',
+    'RowWriter',
+)
+
+
+STATE_FORMAT_VERSION = '1'
+STATE_BLOCK_SIZE = 10000
+DEFAULT_WINDOW = 10000
+BATCH_SIZE = 1000
+PROBE_SIZE = 8
+
+HASH_NAME = 'blake2b-64' if hasattr(hashlib, 'blake2b') else 'md5-64'
+
+
+def row_hashes(records):
+    """
+    Returns 8-byte hashes of the raw text of records, stable across runs
+    """
+    if records and isinstance(records[0], six.text_type):
+        records = [raw.encode(DEFAULT_ENCODING) for raw in records]
+    if HASH_NAME == 'md5-64':
+        md5 = hashlib.md5
+        return [md5(raw).digest()[:8] for raw in records]
+    blake2b = hashlib.blake2b
+    return [blake2b(raw, digest_size=8).digest() for raw in records]
+
+
+def iterraw(lines, delimiter=',', quotechar='"'):
+    """
+    Groups lines into the raw text of records, skipping blank lines.
+
+    A record continues on the next line while one of its quoted fields is
+    open, as ``csv.reader`` reads it.
+
+    :param lines: Iterable of lines of bytes or text, with line endings;
+        ``delimiter`` and ``quotechar`` must be of the same type
+    """
+    newlines = to_bytes('\r\n') \
+        if isinstance(delimiter, six.binary_type) else '\r\n'
+    pending = None
+    for line in lines:
+        if pending is not None:
+            pending.append(line)
+            if quotechar not in line:
+                continue
+            line = line[:0].join(pending)
+        if quotechar in line and count_fields(
+                line.rstrip(newlines), delimiter,
+                quotechar)[1] == 'unterminated':
+            if pending is None:
+                pending = [line]
+            continue
+        pending = None
+        if line.rstrip(newlines):
+            yield line
+    if pending is not None:
+        yield pending[0][:0].join(pending)
+
+
+def iterbatches(lines, delimiter=',', quotechar='"', size=BATCH_SIZE):
+    """
+    Yields lists of the raw text of records, as grouped by ``iterraw``.
+
+    Batches of lines without quote characters or blank lines are records
+    already, and are passed through without a Python loop over their lines.
+    """
+    lines = iter(lines)
+    newlines = to_bytes('\r\n') \
+        if isinstance(delimiter, six.binary_type) else '\r\n'
+    blank = (newlines[1:] * 2, newlines[1:] + newlines)
+    while True:
+        batch = list(itertools.islice(lines, size))
+        if not batch:
+            return
+        joined = batch[0][:0].join(batch)
+        if quotechar not in joined and blank[0] not in joined and \
+                blank[1] not in joined and batch[0].rstrip(newlines):
+            yield batch
+            continue
+
+        records = list(iterraw(batch, delimiter, quotechar))
+        while records and count_fields(
+                records[-1].rstrip(newlines), delimiter,
+                quotechar)[1] == 'unterminated':
+            line = next(lines, None)  # The last record continues
+            if line is None:
+                break
+            records[-1] += line
+        if records:
+            yield records
+
+
+class PreviousRun(object):
+    """
+    Row hashes and state stored by the last run, read from SQLite.
+
+    A missing store, or one written with another ``signature`` (the schema
+    and dialect of the run), reads as a run without rows.
+
+    :ivar failed: Set of the rows that failed validation
+    """
+
+    def __init__(self, path, signature):
+        self.failed = set([])
+        self.connection = None
+        if not os.path.exists(path):
+            return
+        try:
+            connection = sqlite3.connect(path)
+            meta = dict(connection.execute('SELECT name, value FROM meta'))
+        except sqlite3.DatabaseError:
+            return
+        if meta != {'version': STATE_FORMAT_VERSION, 'hash': HASH_NAME,
+                    'signature': signature}:
+            connection.close()
+            return
+        self.connection = connection
+        self.failed.update(row for row, in connection.execute(
+            'SELECT row FROM failed'))
+
+    def blocks(self):
+        """
+        Yields ``(hashes, states)`` tuples of the blocks of rows, in order,
+        where ``states`` is ``None`` if no state was stored
+        """
+        if self.connection is None:
+            return
+        for hashes, states in self.connection.execute(
+                'SELECT hashes, states FROM blocks ORDER BY start'):
+            hashes = bytes(hashes)
+            yield ([hashes[idx:idx + 8] for idx in range(0, len(hashes), 8)],
+                   None if states is None else marshal.loads(bytes(states)))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class RowAligner(object):
+    """
+    Matches the records of a new version of a file to the rows of the last
+    version, in order.
+
+    Rows of the last version are read ahead in a window of at least
+    ``window`` rows. A new record matches the next unmatched previous row
+    with the same hash in the window; previous rows skipped over were
+    deleted or changed. New records without a match were inserted or
+    changed. After more than ``window`` records in a row without a match,
+    the window grows by a row per record, to find the rows following a long
+    deletion.
+
+    :param blocks: Iterable of ``(hashes, states)`` tuples, as read by
+        ``PreviousRun.blocks``
+    """
+
+    def __init__(self, blocks, window=DEFAULT_WINDOW):
+        self.blocks = iter(blocks)
+        self.window = window
+        self.hashes = []  # Hashes of buffered rows, from row ``base``
+        self.states = []
+        self.base = 0
+        self.position = 0  # Index of the next unmatched row in ``hashes``
+        self.index = {}  # Hash to first buffered row, as of the last fill
+        self.misses = 0
+        self.exhausted = False
+
+    def fill(self, size):
+        """ Reads ahead until ``size`` unmatched rows are buffered """
+        while len(self.hashes) - self.position < size and \
+                not self.exhausted:
+            block = next(self.blocks, None)
+            if block is None:
+                self.exhausted = True
+                break
+            hashes, states = block
+            self.hashes.extend(hashes)
+            self.states.extend(states or [None] * len(hashes))
+            rows = range(self.base + len(self.hashes) - 1, self.base - 1, -1)
+            self.index = dict(zip(reversed(self.hashes), rows))
+
+    def align(self, digests):
+        """
+        Matches a batch of hashes, returning the matching row of each, or
+        ``None``. The states of the rows stay available until the next
+        batch.
+        """
+        # Drop the rows matched or skipped by previous batches
+        del self.hashes[:self.position]
+        del self.states[:self.position]
+        self.base += self.position
+        self.position = 0
+
+        matches, idx, probe = [], 0, PROBE_SIZE
+        while idx < len(digests):
+            # Match runs of rows in the same order in bulk
+            count = min(probe, len(digests) - idx)
+            self.fill(max(self.window, count))
+            position = self.position
+            if position == len(self.hashes):  # No rows left to match
+                self.misses += len(digests) - idx
+                matches.extend([None] * (len(digests) - idx))
+                break
+            equal = list(map(operator.eq, digests[idx:idx + count],
+                             self.hashes[position:position + count]))
+            run = equal.index(False) if False in equal else len(equal)
+            if run:
+                matches.extend(range(self.base + position,
+                                     self.base + position + run))
+                self.position += run
+                self.misses = 0
+                idx += run
+                probe = probe * 2 if run == count else PROBE_SIZE
+                continue
+            matches.append(self.match(digests[idx]))
+            idx += 1
+        return matches
+
+    def match(self, digest):
+        """ Matches one hash, returning the matching row or ``None`` """
+        size = self.window + max(self.misses - self.window, 0)
+        self.fill(size)
+        hashes, position = self.hashes, self.position
+        if position < len(hashes) and hashes[position] == digest:
+            self.position = position + 1
+            self.misses = 0
+            return self.base + position
+
+        row = self.index.get(digest)
+        if row is not None and row < self.base + position:
+            try:  # The first buffered row with the hash was matched already
+                row = self.base + hashes.index(digest, position)
+            except ValueError:
+                row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.position = row - self.base + 1
+        self.misses = 0
+        return row
+
+    def state(self, row):
+        """ Returns the stored state of a row matched in this batch """
+        return self.states[row - self.base]
+
+
+class RowWriter(object):
+    """
+    Writes the row hashes and state of a run to a new SQLite database,
+    replacing the database of the last run when committed.
+
+    Rows are written in blocks: the hashes of a block are packed into one
+    value, and the states of its rows, if any, into another.
+    """
+
+    def __init__(self, path, signature, block_size=STATE_BLOCK_SIZE):
+        self.path = path
+        self.signature = signature
+        self.block_size = block_size
+        fd, self.building = tempfile.mkstemp(
+            prefix=os.path.basename(path) + '.',
+            dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        self.connection = sqlite3.connect(self.building)
+        self.connection.execute(
+            'CREATE TABLE blocks (start INTEGER PRIMARY KEY, hashes BLOB, '
+            'states BLOB)')
+        self.connection.execute('CREATE TABLE failed (row INTEGER)')
+        self.connection.execute(
+            'CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+        self.rows = 0
+        self.hashes = []
+        self.states = []
+        self.failed = []
+
+    def extend(self, digests, failed, states=None):
+        """
+        Adds a batch of rows.
+
+        :param digests: Hashes of the rows
+        :param failed: Indexes in the batch of rows that failed validation
+        :param states: State of each row, or ``None``
+        """
+        self.failed.extend((self.rows + idx,) for idx in failed)
+        self.hashes.extend(digests)
+        self.states.extend(states or [None] * len(digests))
+        self.rows += len(digests)
+        if len(self.hashes) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.hashes:
+            states = None
+            if any(state is not None for state in self.states):
+                states = sqlite3.Binary(marshal.dumps(self.states, 2))
+            self.connection.execute(
+                'INSERT INTO blocks VALUES (?, ?, ?)',
+                (self.rows - len(self.hashes),
+                 sqlite3.Binary(b''.join(self.hashes)), states))
+        self.connection.executemany('INSERT INTO failed VALUES (?)',
+                                    self.failed)
+        self.hashes, self.states, self.failed = [], [], []
+
+    def commit(self):
+        self.flush()
+        self.connection.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('version', STATE_FORMAT_VERSION),
+            ('hash', HASH_NAME),
+            ('signature', self.signature),
+        ])
+        self.connection.commit()
+        self.connection.close()
+        getattr(os, 'replace', os.rename)(self.building, self.path)
+
+    def abort(self):
+        self.connection.close()
+        os.remove(self.building)
@@ -3,7 +3,20 @@
 #
 
 
+import io
+import os
+import re
+import socket
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+
+import six
 from six import StringIO, BytesIO, string_types, binary_type
+from six.moves import http_client
+from six.moves.urllib.parse import urlsplit, urlunsplit
+from compat import DEFAULT_ENCODING
 from exceptions import LoaderException
 
 
@@ -13,15 +26,29 @@ __all__ = (
     'StringLoader',
 
     'LocalFileLoader',
+    'BinaryFileLoader',
+
+    'ConnectionPool',
+    'HTTPLoader',
 )
 
 
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_HTTP_WORKERS = 4
+DEFAULT_HTTP_TIMEOUT = 30
+DEFAULT_MAX_LINE_SIZE = 4 << 20
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
 class Loader(object):
     """ Base class for file loaders """
 
     loader = NotImplemented
     loader_args = None
     loader_kwargs = None
+    seekable = False
+    binary = False  # Streams lines of bytes rather than text
+    encoding = DEFAULT_ENCODING
 
     def __init__(self, source):
         """ Initializes loader mechanism """
@@ -36,6 +63,75 @@ class Loader(object):
 
         raise NotImplementedError("%s.open()" % self.__class__.__name__)
 
+    def stream(self):
+        """
+        Returns an iterator over the lines of the source.
+
+        Implementations may override this method to read lazily, so callers
+        that stop early (e.g. after the header) do not read the whole source.
+        Iterators with a ``close`` method must be closed by the caller.
+        """
+
+        return iter(self.open())
+
+    def stream_at(self, start=0):
+        """
+        Returns an iterator over the lines of the source from the line
+        boundary at byte offset ``start``.
+
+        The ``position`` attribute of the iterator is the byte offset after
+        the last line read, and ``close`` releases it. Lines are read with
+        their original line endings.
+
+        Seekable implementations must override this method.
+        """
+
+        raise NotImplementedError("%s.stream_at()" % self.__class__.__name__)
+
+    def head(self, size):
+        """
+        Returns about the first ``size`` bytes of the source.
+
+        Complete lines are read from ``stream`` until at least ``size``
+        characters were read. Implementations may override this method to
+        read exactly ``size`` bytes.
+        """
+
+        lines, length = [], 0
+        stream = self.stream()
+        try:
+            for line in stream:
+                lines.append(line)
+                length += len(line)
+                if length >= size:
+                    break
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+        return (b'' if self.binary else '').join(lines)
+
+    def size(self):
+        """
+        Returns the size of the source in bytes.
+
+        Seekable implementations must override this method.
+        """
+
+        raise NotImplementedError("%s.size()" % self.__class__.__name__)
+
+    def readlines_at(self, offsets):
+        """
+        Reads the first complete line starting at or after each byte offset.
+
+        Returns a list of ``(position, line)`` tuples, where ``position`` is
+        the byte offset the line starts at. Offset ``0`` reads the first line.
+
+        Seekable implementations must override this method.
+        """
+
+        raise NotImplementedError(
+            "%s.readlines_at()" % self.__class__.__name__)
+
     def __repr__(self):
         """
         Implementations may override this method to produce pretty output.
@@ -73,6 +169,8 @@ class LocalFileLoader(Loader):
     loader = open
     loader_args = ['r', ]
     loader_kwargs = {}
+    seekable = True
+    encoding = DEFAULT_ENCODING
 
     def open(self):
         try:
@@ -84,5 +182,360 @@ class LocalFileLoader(Loader):
                 'Unable to load local file. Got:\n{}'.format(str(exc))
             )
 
+    def stream(self):
+        try:
+            f = self.loader(self.source, *self.loader_args,
+                            **self.loader_kwargs)
+        except Exception as exc:
+            raise LoaderException(
+                'Unable to load local file. Got:\n{}'.format(str(exc))
+            )
+        return iterlines(f)
+
+    def stream_at(self, start=0):
+        try:
+            f = self.loader(self.source, 'rb')
+        except Exception as exc:
+            raise LoaderException(
+                'Unable to load local file. Got:\n{}'.format(str(exc))
+            )
+        encoding = self.encoding if six.PY3 and not self.binary else None
+        return PositionedLines(f, start, encoding)
+
+    def head(self, size):
+        try:
+            with self.loader(self.source, 'rb') as f:
+                prefix = f.read(size)
+        except Exception as exc:
+            raise LoaderException(
+                'Unable to load local file. Got:\n{}'.format(str(exc))
+            )
+        if six.PY3 and not self.binary:
+            prefix = prefix.decode(self.encoding, 'replace')
+        return prefix
+
+    def size(self):
+        return os.path.getsize(self.source)
+
+    def readlines_at(self, offsets):
+        lines = []
+        try:
+            with self.loader(self.source, 'rb') as f:
+                for offset in offsets:
+                    f.seek(max(offset - 1, 0))
+                    if offset:
+                        f.readline()  # Skip to the next line boundary
+                    position = f.tell()
+                    line = f.readline()
+                    if line:
+                        lines.append((position, line))
+        except Exception as exc:
+            raise LoaderException(
+                'Unable to load local file. Got:\n{}'.format(str(exc))
+            )
+        if six.PY3 and not self.binary:
+            lines = [(offset, raw.decode(self.encoding))
+                     for offset, raw in lines]
+        return lines
+
     def __repr__(self):
         return "{}('{}')".format(self.__class__.__name__, str(self.source))
+
+
+class BinaryFileLoader(LocalFileLoader):
+    """
+    Loads lines of bytes from a local file path
+
+    Validators parse and validate the bytes directly, decoding only values
+    that end up in reports.
+    """
+
+    loader_args = ['rb', ]
+    binary = True
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP connections to one host, reused across requests
+
+    :param scheme: ``'http'`` or ``'https'``
+    :param netloc: Host, with an optional port
+    :param size: Maximum number of idle connections kept open
+    """
+
+    def __init__(self, scheme, netloc, size=DEFAULT_HTTP_WORKERS,
+                 timeout=DEFAULT_HTTP_TIMEOUT):
+        self.connection_class = http_client.HTTPSConnection \
+            if scheme == 'https' else http_client.HTTPConnection
+        self.netloc = netloc
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, path, headers=None):
+        """
+        Sends a request on an idle or new connection.
+
+        A request failing on an idle connection, which the server may have
+        closed in the meantime, is retried once on a new connection.
+
+        :returns: Tuple of ``(connection, response)``; the connection must
+            be handed back with ``release`` once the response is read
+        """
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        while True:
+            reused = connection is not None
+            if not reused:
+                connection = self.connection_class(self.netloc,
+                                                   timeout=self.timeout)
+                with self.lock:
+                    self.opened += 1
+            try:
+                connection.request(method, path, headers=headers or {})
+                return connection, connection.getresponse()
+            except (http_client.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                connection = None
+
+    def release(self, connection, response):
+        """
+        Keeps a connection for reuse if its response was read completely,
+        and closes it otherwise.
+        """
+        if not response.isclosed() or response.will_close:
+            connection.close()
+            return
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """ Closes the idle connections """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def __repr__(self):
+        return "{}('{}')".format(self.__class__.__name__, self.netloc)
+
+
+class HTTPLoader(Loader):
+    """
+    Loads from an HTTP or HTTPS URL, without writing to disk
+
+    The body is read over keep-alive connections pooled per host. If the
+    server honours ``Range`` requests, the body is fetched in chunks of
+    ``chunk_size`` bytes, up to ``max_workers`` at a time, and fed to the
+    parser in order. Otherwise it is streamed from a single response. Lines
+    may not be longer than ``max_line_size`` bytes.
+
+    :param source: URL
+    :param headers: Extra request headers, e.g. for authorization
+    :param pool: ``ConnectionPool``; loaders share one per host by default
+    """
+
+    chunk_size = DEFAULT_CHUNK_SIZE
+    max_workers = DEFAULT_HTTP_WORKERS
+    timeout = DEFAULT_HTTP_TIMEOUT
+    max_line_size = DEFAULT_MAX_LINE_SIZE
+    encoding = DEFAULT_ENCODING
+
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def __init__(self, source, headers=None, pool=None):
+        super(HTTPLoader, self).__init__(source)
+        parts = urlsplit(source)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise LoaderException(
+                'Unable to load URL. Got:\n{}'.format(source))
+        self.path = urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        self.headers = dict(headers or {})
+        self.pool = pool or self.connection_pool(parts.scheme, parts.netloc)
+
+    @classmethod
+    def connection_pool(cls, scheme, netloc):
+        """ Returns the pool shared by loaders of one host """
+        with cls.pools_lock:
+            key = (scheme, netloc)
+            if key not in cls.pools:
+                cls.pools[key] = ConnectionPool(
+                    scheme, netloc, cls.max_workers, cls.timeout)
+            return cls.pools[key]
+
+    def request(self, start=None, stop=None, validator=None):
+        """
+        Requests the body, or the bytes in ``[start, stop)`` of it.
+
+        :param validator: ``ETag`` or ``Last-Modified`` value the resource
+            must still have for a range to be served
+        :returns: Tuple of ``(connection, response)``
+        """
+        headers = dict(self.headers)
+        if start is not None:
+            headers['Range'] = 'bytes={}-{}'.format(start, stop - 1)
+            if validator:
+                headers['If-Range'] = validator
+        try:
+            connection, response = self.pool.request('GET', self.path,
+                                                     headers)
+        except (http_client.HTTPException, socket.error) as exc:
+            raise LoaderException(
+                'Unable to load URL. Got:\n{}'.format(str(exc)))
+        if response.status not in (200, 206, 416):
+            response.read()
+            self.pool.release(connection, response)
+            raise LoaderException(
+                'Unable to load URL. Got:\n{} {}'.format(
+                    response.status, response.reason))
+        return connection, response
+
+    def read_range(self, start, stop, validator):
+        """ Returns the bytes in ``[start, stop)`` of the body """
+        connection, response = self.request(start, stop, validator)
+        block = response.read()
+        self.pool.release(connection, response)
+        if response.status != 206:
+            raise LoaderException(
+                'Unable to load URL. Got:\n{} changed while it was '
+                'read'.format(self.source))
+        return block
+
+    def iterblocks(self):
+        """ Yields the body in blocks of bytes, in order """
+        connection, response = self.request(0, self.chunk_size)
+        if response.status == 416:  # Empty body
+            response.read()
+            self.pool.release(connection, response)
+            return
+        match = CONTENT_RANGE.match(
+            response.getheader('Content-Range') or '') \
+            if response.status == 206 else None
+        if match is None:
+            try:
+                for block in iter(lambda: response.read(self.chunk_size),
+                                  b''):
+                    yield block
+            finally:
+                self.pool.release(connection, response)
+            return
+
+        block = response.read()
+        self.pool.release(connection, response)
+        yield block
+        total = int(match.group(3))
+        validator = response.getheader('ETag') or \
+            response.getheader('Last-Modified')
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = collections.deque()
+        try:
+            for start in range(self.chunk_size, total, self.chunk_size):
+                pending.append(executor.submit(
+                    self.read_range, start,
+                    min(start + self.chunk_size, total), validator))
+                if len(pending) >= self.max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def open(self):
+        return list(self.stream())
+
+    def stream(self):
+        for line in splitlines(self.iterblocks(), self.max_line_size):
+            if six.PY3 and not self.binary:
+                line = line.decode(self.encoding)
+            yield line
+
+    def head(self, size):
+        connection, response = self.request(0, size)
+        prefix = response.read(size)
+        self.pool.release(connection, response)
+        if response.status == 416:  # Empty body
+            prefix = b''
+        if six.PY3 and not self.binary:
+            prefix = prefix.decode(self.encoding, 'replace')
+        return prefix
+
+    def __repr__(self):
+        return "{}('{}')".format(self.__class__.__name__, self.source)
+
+
+def splitlines(blocks, max_size=None):
+    """
+    Yields the lines of a sequence of blocks of bytes, with endings.
+
+    The pieces of a line spanning blocks are joined once, when it ends.
+
+    :raises LoaderException: If a line spans more than ``max_size`` bytes
+        of blocks without ending
+    """
+    pieces, size = [], 0
+    for block in blocks:
+        lines = block.split(b'\n')
+        rest = lines.pop()
+        if lines and pieces:
+            lines[0] = b''.join(pieces + [lines[0]])
+            pieces, size = [], 0
+        for line in lines:
+            yield line + b'\n'
+        if rest:
+            pieces.append(rest)
+            size += len(rest)
+            if max_size is not None and size > max_size:
+                raise LoaderException(
+                    'Unable to load URL. Got:\nLine longer than {} '
+                    'bytes'.format(max_size))
+    if pieces:
+        yield b''.join(pieces)
+
+
+class PositionedLines(object):
+    """
+    Iterates over the lines of a binary file object from byte offset
+    ``start``, decoding them if an ``encoding`` is given, and closes it when
+    done
+
+    ``position`` is the byte offset after the last line read.
+    """
+
+    def __init__(self, f, start=0, encoding=None):
+        self.position = start
+        self.lines = self.iterlines(f, start, encoding)
+
+    def iterlines(self, f, start, encoding):
+        with f:
+            f.seek(start)
+            if encoding is None:
+                for line in f:
+                    self.position += len(line)
+                    yield line
+            else:
+                for line in io.TextIOWrapper(f, encoding, newline=''):
+                    self.position += len(line.encode(encoding))
+                    yield line
+
+    def __iter__(self):
+        return self.lines
+
+    def close(self):
+        self.lines.close()
+
+
+def iterlines(f):
+    """ Yields the lines of a file object, closing it when done """
+    with f:
+        for line in f:
+            yield line
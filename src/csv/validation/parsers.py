@@ -0,0 +1,232 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import io
+import csv
+import itertools
+
+
+import six
+
+
+from compat import DEFAULT_ENCODING, to_text, to_bytes
+from exceptions import ValidationConfigurationException
+from structure import ends_quoted
+
+
+__all__ = (
+    'binary_reader',
+    'csv_parser',
+    'split_parser',
+    'arrow_parser',
+    'get_parser',
+    'PARSERS',
+    'STREAMING_PARSERS',
+)
+
+
+ARROW_BLOCK_SIZE = 1 << 20
+
+
+def binary_reader(lines, delimiter=',', quotechar='"',
+                  encoding=DEFAULT_ENCODING):
+    """
+    Splits lines of bytes into records of bytes fields.
+
+    Lines without a quote character, the common case for machine-generated
+    feeds, are split directly without decoding. Quoted records, including
+    quoted fields spanning several lines, are parsed by the ``csv`` module,
+    decoded on Python 3 so that bytes that do not decode are kept as they
+    are, then their fields are encoded back to bytes.
+
+    :param lines: Iterable of lines of bytes
+    :returns: Generator of lists of bytes fields
+    """
+    delimiter = to_bytes(delimiter, encoding)
+    quotechar = to_bytes(quotechar, encoding)
+    text_delimiter = to_text(delimiter, encoding)
+    text_quotechar = to_text(quotechar, encoding)
+
+    def parse(record):
+        if six.PY2:
+            return csv.reader([record], delimiter=delimiter,
+                              quotechar=quotechar)
+        return ([field.encode(encoding, 'surrogateescape')
+                 for field in fields]
+                for fields in csv.reader(
+                    [record.decode(encoding, 'surrogateescape')],
+                    delimiter=text_delimiter, quotechar=text_quotechar))
+
+    pending = None
+    for line in lines:
+        if pending is not None:
+            line = pending + line
+            pending = None
+        if quotechar not in line:
+            line = line.rstrip(b'\r\n')
+            yield line.split(delimiter) if line else []
+        elif ends_quoted(line.rstrip(b'\r\n'), delimiter, quotechar):
+            pending = line  # A quoted field continues on the next line
+        else:
+            for record in parse(line):
+                yield record
+    if pending is not None:
+        for record in parse(pending):
+            yield record
+
+
+def csv_parser(lines, delimiter=',', quotechar='"', binary=False,
+               encoding=DEFAULT_ENCODING):
+    """
+    Parses records with the ``csv`` module, or ``binary_reader`` for lines
+    of bytes on Python 3.
+
+    :returns: Iterator of lists of fields
+    """
+    if binary and six.PY3:
+        return binary_reader(lines, delimiter=delimiter, quotechar=quotechar,
+                             encoding=encoding)
+    return csv.reader(lines, delimiter=delimiter, quotechar=quotechar)
+
+
+def split_parser(lines, delimiter=',', quotechar='"', binary=False,
+                 encoding=DEFAULT_ENCODING):
+    """
+    Splits lines on the delimiter, without looking for quotes.
+
+    Only for sources known to have no quoted fields, such as trusted
+    machine-generated feeds: quote characters are kept in fields, and
+    quoted delimiters and line breaks split fields and records.
+
+    :returns: Generator of lists of fields
+    """
+    if binary:
+        delimiter, newlines = to_bytes(delimiter, encoding), b'\r\n'
+    else:
+        newlines = '\r\n'
+    return (line.split(delimiter) if line else []
+            for line in (line.rstrip(newlines) for line in lines))
+
+
+def arrow_parser(lines, delimiter=',', quotechar='"', binary=False,
+                 encoding=DEFAULT_ENCODING):
+    """
+    Parses records with the multi-threaded CSV reader of ``pyarrow``.
+
+    The first line, the header, is parsed by ``csv_parser`` and sets the
+    number of fields; the rest of the lines are read in blocks of columns,
+    as strings, or as bytes for lines of bytes. Records with another number
+    of fields are skipped by ``pyarrow`` and parsed by ``csv_parser`` in
+    their place, so they are counted as width mismatches as with the other
+    parsers. Text lines are encoded to UTF-8 for ``pyarrow``.
+
+    :returns: Generator of lists of fields
+    :raises ValidationConfigurationException: If ``pyarrow`` is not
+        installed
+    """
+    try:
+        import pyarrow
+        from pyarrow import csv as arrow_csv
+    except ImportError:
+        raise ValidationConfigurationException(
+            "The 'pyarrow' parser requires pyarrow to be installed")
+
+    def parse(text):
+        """ Parses a record ``pyarrow`` skipped """
+        if binary:
+            text = to_bytes(text, 'utf-8')
+        return next(csv_parser([text], delimiter, quotechar, binary,
+                               encoding), [])
+
+    def records():
+        first = next(rest, None)
+        if first is None:
+            return
+        header = next(csv_parser([first], delimiter, quotechar, binary,
+                                 encoding), [])
+        yield header
+        second = next(rest, None)
+        if second is None:  # No records; pyarrow raises on empty files
+            return
+        names = ['f{}'.format(idx) for idx in range(len(header))]
+        kind = pyarrow.binary() if binary else pyarrow.string()
+        skipped = {}  # Text of records of another width, by number from 1
+
+        def skip(row):
+            skipped[row.number] = row.text
+            return 'skip'
+
+        reader = arrow_csv.open_csv(
+            LineStream(itertools.chain([second], rest), 'utf-8'),
+            read_options=arrow_csv.ReadOptions(
+                column_names=names, block_size=ARROW_BLOCK_SIZE),
+            parse_options=arrow_csv.ParseOptions(
+                delimiter=to_text(delimiter), quote_char=to_text(quotechar),
+                newlines_in_values=True, invalid_row_handler=skip),
+            convert_options=arrow_csv.ConvertOptions(
+                column_types=dict.fromkeys(names, kind),
+                strings_can_be_null=False, quoted_strings_can_be_null=False))
+
+        # Rows are skipped while their block is parsed, before it is read
+        number = 0
+        for batch in reader:
+            columns = [column.to_pylist() for column in batch.columns]
+            for record in six.moves.zip(*columns):
+                number += 1
+                while number in skipped:
+                    yield parse(skipped.pop(number))
+                    number += 1
+                yield list(record)
+        for number in sorted(skipped):
+            yield parse(skipped[number])
+
+    rest = iter(lines)
+    return records()
+
+
+PARSERS = {
+    'csv': csv_parser,
+    'split': split_parser,
+    'pyarrow': arrow_parser,
+}
+STREAMING_PARSERS = frozenset(['csv', 'split'])  # Never read ahead a line
+
+
+def get_parser(name):
+    """ Returns the parser registered as ``name`` in ``PARSERS`` """
+    try:
+        return PARSERS[name]
+    except KeyError:
+        raise ValidationConfigurationException(
+            "Unknown parser {!r}; expected one of: {}".format(
+                name, ', '.join(sorted(PARSERS))))
+
+
+class LineStream(io.RawIOBase):
+    """ Reads an iterable of lines of text or bytes as a binary file """
+
+    def __init__(self, lines, encoding=DEFAULT_ENCODING):
+        self.lines = iter(lines)
+        self.encoding = encoding
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer)
+        chunks, length = [self.pending], len(self.pending)
+        while length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            line = to_bytes(line, self.encoding)
+            chunks.append(line)
+            length += len(line)
+        data = b''.join(chunks)
+        count = min(size, len(data))
+        buffer[:count] = data[:count]
+        self.pending = data[count:]
+        return count
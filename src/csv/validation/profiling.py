@@ -0,0 +1,220 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import sys
+import time
+import random
+import signal
+import threading
+import collections
+
+
+__all__ = (
+    'Profile',
+    'Profiler',
+    'StackSampler',
+    'SignalSampler',
+    'ThreadSampler',
+)
+
+
+DEFAULT_INTERVAL = 0.01
+
+
+def frame_label(code):
+    """ Returns the name of a function in collapsed stacks """
+    return '{} ({}:{})'.format(code.co_name,
+                               os.path.basename(code.co_filename),
+                               code.co_firstlineno)
+
+
+class Profile(object):
+    """
+    Stacks sampled during a validation run.
+
+    :ivar stacks: Number of samples per collapsed stack, from the outermost
+        frame to the innermost, separated by ``;``
+    :ivar interval: Seconds between samples
+    :ivar clock: Time between samples: ``cpu`` or ``wall``
+    :ivar path: File the stacks were written to, if any
+    """
+
+    def __init__(self, stacks, interval, clock='wall', path=None):
+        self.stacks = stacks
+        self.interval = interval
+        self.clock = clock
+        self.path = path
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def collapsed(self):
+        """
+        Returns the stacks as lines of collapsed stacks, as read by
+        ``flamegraph.pl``, speedscope or inferno
+        """
+        return ['{} {}'.format(stack, count)
+                for stack, count in sorted(self.stacks.items())]
+
+    def write(self, path):
+        """ Writes the collapsed stacks to a file """
+        with open(path, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+        self.path = path
+
+    def __repr__(self):
+        return "{}(samples={}, interval={}, clock={})".format(
+            self.__class__.__name__, self.samples, self.interval, self.clock)
+
+
+class Profiler(object):
+    """
+    Sampling profiler of validation runs.
+
+    Samples the stack of the validating thread every ``interval`` seconds.
+    On the main thread, a ``SIGPROF`` timer samples every ``interval``
+    seconds of CPU time, where the thread is interrupted; other threads are
+    sampled every ``interval`` seconds of wall-clock time from a separate
+    thread, which can only sample when the validating thread releases the
+    GIL, e.g. to read its source, and so overcounts reads.
+
+    Only the frames of the run are kept, so the overhead is one short stack
+    walk per sample, and profiling may stay on in production for a ``rate``
+    of the runs.
+
+    :param interval: Seconds between samples
+    :param rate: Fraction of the runs profiled
+    :param directory: Directory the collapsed stacks of each profiled run
+        are written to, if any
+    :param signals: Sample the main thread with a ``SIGPROF`` timer, unless
+        another ``SIGPROF`` handler is installed
+    :param seed: Seed of the choice of the runs profiled
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, rate=1.0, directory=None,
+                 signals=True, seed=None):
+        self.interval = interval
+        self.rate = rate
+        self.directory = directory
+        self.signals = signals and hasattr(signal, 'setitimer')
+        self.random = random.Random(seed)
+
+    def start(self, name='validation'):
+        """
+        Returns a sampler of the calling thread for a run starting now, or
+        ``None`` if the run is not profiled
+        """
+        if self.rate < 1.0 and self.random.random() >= self.rate:
+            return None
+        root = sys._getframe(1)
+        if self.signals and signal.getsignal(signal.SIGPROF) in \
+                (signal.SIG_DFL, None):
+            try:
+                return SignalSampler(self, name, root)
+            except ValueError:  # Not the main thread
+                pass
+        return ThreadSampler(self, name, root)
+
+    def __repr__(self):
+        return "{}(interval={}, rate={})".format(
+            self.__class__.__name__, self.interval, self.rate)
+
+
+class StackSampler(object):
+    """
+    Counts the stacks of one run until stopped.
+
+    Stacks are counted by their code objects, and only named when stopped.
+
+    :param root: Outermost frame kept in stacks
+    """
+
+    clock = NotImplemented  # Time between samples: ``cpu`` or ``wall``
+
+    def __init__(self, profiler, name, root):
+        self.profiler = profiler
+        self.name = name
+        self.root = root
+        self.counts = collections.defaultdict(int)
+
+    def sample(self, frame):
+        root, codes = self.root, []
+        while frame is not None:
+            codes.append(frame.f_code)
+            if frame is root:
+                break
+            frame = frame.f_back
+        if codes:
+            self.counts[tuple(codes)] += 1
+
+    def stop(self):
+        """ Stops sampling, returning the ``Profile`` of the run """
+        self.root = None
+        labels, stacks = {}, collections.defaultdict(int)
+        for codes, count in self.counts.items():
+            for code in codes:
+                if code not in labels:
+                    labels[code] = frame_label(code)
+            stacks[';'.join(labels[code] for code in reversed(codes))] += \
+                count
+        profile = Profile(dict(stacks), self.profiler.interval, self.clock)
+        directory = self.profiler.directory
+        if directory is not None:
+            profile.write(os.path.join(directory, '{}-{}-{}.folded'.format(
+                self.name, int(time.time() * 1000), os.getpid())))
+        return profile
+
+
+class SignalSampler(StackSampler):
+    """
+    Samples the main thread on a ``SIGPROF`` timer.
+
+    Raises ``ValueError`` off the main thread.
+    """
+
+    clock = 'cpu'
+
+    def __init__(self, profiler, name, root):
+        super(SignalSampler, self).__init__(profiler, name, root)
+        self.previous = signal.signal(signal.SIGPROF, self.handle)
+        signal.siginterrupt(signal.SIGPROF, False)  # Restart reads
+        signal.setitimer(signal.ITIMER_PROF, profiler.interval,
+                         profiler.interval)
+
+    def handle(self, signum, frame):
+        self.sample(frame)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous or signal.SIG_DFL)
+        return super(SignalSampler, self).stop()
+
+
+class ThreadSampler(StackSampler):
+    """ Samples a thread from a separate thread """
+
+    clock = 'wall'
+
+    def __init__(self, profiler, name, root):
+        super(ThreadSampler, self).__init__(profiler, name, root)
+        self.ident = threading.current_thread().ident
+        self.done = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name='StackSampler({})'.format(name))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        interval, current_frames = self.profiler.interval, sys._current_frames
+        while not self.done.wait(interval):
+            self.sample(current_frames().get(self.ident))
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        return super(ThreadSampler, self).stop()
@@ -0,0 +1,179 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import io
+import os
+import csv
+import sqlite3
+import tempfile
+
+
+import six
+
+
+from compat import DEFAULT_ENCODING
+from exceptions import ValidationConfigurationException
+
+
+__all__ = (
+    'ReferenceIndex',
+)
+
+
+INDEX_SUFFIX = '.idx.sqlite'
+INDEX_FORMAT_VERSION = '2'
+INDEX_BATCH_SIZE = 10000
+
+
+class ReferenceIndex(object):
+    """
+    Persistent on-disk index of one column of a reference CSV file.
+
+    The index is a small SQLite database stored next to the reference file
+    (or at ``index_path``). It is built once and reused by later runs; the
+    size and modification time of the reference file are recorded in the
+    index, and the index is rebuilt automatically when they change.
+
+    Lookups go straight to the on-disk B-tree, so memory use does not grow
+    with the size of the reference set. Keys are stored as text decoded with
+    ``encoding``; byte string lookups are decoded the same way.
+    """
+
+    def __init__(self, reference, column, index_path=None, delimiter=',',
+                 encoding=DEFAULT_ENCODING):
+        self.reference = reference
+        self.column = column
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.index_path = index_path or reference + INDEX_SUFFIX
+        self._connection = None
+
+    def signature(self):
+        """ Returns the metadata that identifies the indexed reference """
+        stat = os.stat(self.reference)
+        return {
+            'version': INDEX_FORMAT_VERSION,
+            'size': str(stat.st_size),
+            'mtime': repr(stat.st_mtime),
+            'column': self.column,
+            'delimiter': self.delimiter,
+            'encoding': self.encoding,
+        }
+
+    def is_current(self):
+        """ Checks if the on-disk index matches the reference file """
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            connection = sqlite3.connect(self.index_path)
+            try:
+                meta = dict(connection.execute(
+                    'SELECT name, value FROM meta').fetchall())
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError:
+            return False
+        return meta == self.signature()
+
+    def open_reference(self):
+        """ Opens the reference file for the ``csv`` module """
+        if six.PY2:
+            return open(self.reference, 'rb')
+        return io.open(self.reference, 'r', encoding=self.encoding,
+                       newline='')
+
+    def decode(self, value):
+        """ Decodes a byte string key with the index encoding """
+        if isinstance(value, six.binary_type):
+            return value.decode(self.encoding)
+        return value
+
+    def build(self):
+        """
+        Builds the index from the reference file.
+
+        The index is written to a temporary file and moved into place, so
+        concurrent readers never see a half-built index.
+        """
+        signature = self.signature()
+        fd, building = tempfile.mkstemp(
+            prefix=os.path.basename(self.index_path) + '.',
+            dir=os.path.dirname(os.path.abspath(self.index_path)))
+        os.close(fd)
+        connection = sqlite3.connect(building)
+        try:
+            connection.execute(
+                'CREATE TABLE keys (key TEXT PRIMARY KEY) WITHOUT ROWID')
+            connection.execute(
+                'CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+            with self.open_reference() as f:
+                reader = csv.reader(f, delimiter=self.delimiter)
+                headers = [self.decode(header) for header in next(reader, [])]
+                if self.decode(self.column) not in headers:
+                    raise ValidationConfigurationException(
+                        "Reference '{}' has no column '{}'".format(
+                            self.reference, self.column))
+                idx = headers.index(self.decode(self.column))
+                batch = []
+                for record in reader:
+                    if len(record) > idx:
+                        batch.append((self.decode(record[idx]),))
+                    if len(batch) >= INDEX_BATCH_SIZE:
+                        connection.executemany(
+                            'INSERT OR IGNORE INTO keys VALUES (?)', batch)
+                        batch = []
+                connection.executemany(
+                    'INSERT OR IGNORE INTO keys VALUES (?)', batch)
+            connection.executemany(
+                'INSERT INTO meta VALUES (?, ?)', signature.items())
+            connection.commit()
+        except Exception:
+            connection.close()
+            os.remove(building)
+            raise
+        connection.close()
+        getattr(os, 'replace', os.rename)(building, self.index_path)
+
+    def open(self):
+        """ Opens the index, building or rebuilding it when stale """
+        if self._connection is None:
+            if not self.is_current():
+                self.build()
+            self._connection = sqlite3.connect(self.index_path)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __copy__(self):
+        """ Returns an unopened index over the same reference """
+        return self.__class__(self.reference, self.column,
+                              index_path=self.index_path,
+                              delimiter=self.delimiter,
+                              encoding=self.encoding)
+
+    def __getstate__(self):
+        """ Pickles an unopened index over the same reference """
+        state = dict(self.__dict__)
+        state['_connection'] = None
+        return state
+
+    def __contains__(self, key):
+        try:
+            key = self.decode(key)
+        except UnicodeDecodeError:
+            return False
+        cursor = self.open().execute(
+            'SELECT 1 FROM keys WHERE key = ?', (key,))
+        return cursor.fetchone() is not None
+
+    def __len__(self):
+        return self.open().execute('SELECT COUNT(*) FROM keys').fetchone()[0]
+
+    def __repr__(self):
+        return "{}('{}', '{}')".format(self.__class__.__name__,
+                                       self.reference, self.column)
@@ -0,0 +1,133 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import array
+import struct
+import tempfile
+
+
+from exceptions import LoaderException
+
+
+__all__ = (
+    'RowIndex',
+    'RowIndexer',
+)
+
+
+MAGIC = b'CSVRIDX1'
+HEADER = struct.Struct('<8sQQQQd')  # Magic, every, rows, count, size, mtime
+DEFAULT_INDEX_EVERY = 1000
+
+try:
+    OFFSET_TYPECODE = array.array('Q').typecode
+except ValueError:  # Python 2
+    OFFSET_TYPECODE = 'L'
+
+
+class RowIndex(object):
+    """
+    Byte offsets of every ``every``-th row of a local file
+
+    Rows are numbered from ``0`` after the header, as by validation, and
+    row ``k * every`` starts at ``offsets[k]``, or at blank lines there. The
+    size and modification time of the file are kept to tell when the index
+    is stale.
+
+    :param every: Rows between indexed rows
+    :param offsets: Byte offsets of the indexed rows
+    :param rows: Number of rows of the file
+    """
+
+    def __init__(self, every=DEFAULT_INDEX_EVERY, offsets=(), rows=0,
+                 size=0, mtime=0.0):
+        self.every = every
+        self.offsets = array.array(OFFSET_TYPECODE, offsets)
+        self.rows = rows
+        self.size = size
+        self.mtime = mtime
+
+    def locate(self, row):
+        """
+        Returns ``(row, offset)`` of the last indexed row at or before
+        ``row``, or ``(0, None)`` if no row is indexed.
+        """
+        if not self.offsets:
+            return 0, None
+        slot = min(max(row, 0) // self.every, len(self.offsets) - 1)
+        return slot * self.every, self.offsets[slot]
+
+    def stamp(self, path):
+        """ Records the size and modification time of the indexed file """
+        stat = os.stat(path)
+        self.size, self.mtime = stat.st_size, stat.st_mtime
+
+    def matches(self, path):
+        """ Checks that the file did not change since it was indexed """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime) == (self.size, self.mtime)
+
+    def save(self, path):
+        """ Writes the index to a sidecar file, atomically """
+        fd, saving = tempfile.mkstemp(
+            prefix=os.path.basename(path) + '.',
+            dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.every, self.rows,
+                                len(self.offsets), self.size, self.mtime))
+            f.write(struct.pack('<{}Q'.format(len(self.offsets)),
+                                *self.offsets))
+        getattr(os, 'replace', os.rename)(saving, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Reads an index written by ``save`` """
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(HEADER.size)
+                magic, every, rows, count, size, mtime = HEADER.unpack(header)
+                if magic != MAGIC:
+                    raise ValueError('not a row index')
+                offsets = struct.unpack('<{}Q'.format(count),
+                                        f.read(count * 8))
+        except (IOError, OSError, EOFError, ValueError, struct.error) as exc:
+            raise LoaderException(
+                'Unable to load row index. Got:\n{}'.format(str(exc)))
+        return cls(every, offsets, rows, size, mtime)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return "{}(every={}, rows={})".format(self.__class__.__name__,
+                                              self.every, self.rows)
+
+
+class RowIndexer(object):
+    """
+    Builds a ``RowIndex`` while a source is parsed.
+
+    Rows must be parsed from ``lines``, an iterator such as
+    ``Loader.stream_at`` returns, whose ``position`` is the byte offset
+    after the last line read. Parsers must not read ahead of the record they
+    return, as ``csv.reader`` and ``binary_reader`` do not.
+    """
+
+    def __init__(self, every=DEFAULT_INDEX_EVERY):
+        self.index = RowIndex(every)
+
+    def rows(self, rows, lines):
+        """ Yields ``(line, row)`` tuples, indexing every ``every``-th """
+        every, offsets = self.index.every, self.index.offsets
+        start = lines.position  # After the header
+        for line, row in rows:
+            if not line % every:
+                offsets.append(start)
+            start = lines.position
+            yield line, row
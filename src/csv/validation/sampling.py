@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import math
+import collections
+
+
+from exceptions import ValidationConfigurationException
+
+
+__all__ = (
+    'Estimate',
+    'SampleResult',
+    'z_score',
+    'wilson_interval',
+    'reservoir_sample',
+    'bernoulli_sample',
+    'offset_sample',
+)
+
+
+Estimate = collections.namedtuple(
+    'Estimate', 'field, validator, failures, sampled, rate, low, high')
+SampleResult = collections.namedtuple('SampleResult', 'rows, estimates, log')
+
+
+def z_score(confidence):
+    """
+    Returns the two-sided standard normal quantile for a confidence level.
+
+    :param confidence: Confidence level, e.g. ``0.95``
+    :type confidence: float
+    :rtype: float
+    """
+    if not 0 < confidence < 1:
+        raise ValidationConfigurationException(
+            'Confidence must be between 0 and 1, got {}'.format(confidence))
+    target = 1 - (1 - confidence) / 2.0
+    low, high = 0.0, 10.0
+    for _ in range(64):
+        mid = (low + high) / 2.0
+        if 0.5 * (1 + math.erf(mid / math.sqrt(2))) < target:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2.0
+
+
+def wilson_interval(failures, sampled, confidence=0.95):
+    """
+    Wilson score interval for a failure rate observed in a sample.
+
+    :returns: Tuple of ``(rate, low, high)``
+    :rtype: tuple
+    """
+    if not sampled:
+        return 0.0, 0.0, 1.0
+    z = z_score(confidence)
+    rate = float(failures) / sampled
+    denominator = 1 + z * z / sampled
+    center = (rate + z * z / (2 * sampled)) / denominator
+    margin = z * math.sqrt(
+        rate * (1 - rate) / sampled + z * z / (4 * sampled * sampled)
+    ) / denominator
+    return rate, max(0.0, center - margin), min(1.0, center + margin)
+
+
+def reservoir_sample(iterable, size, rng):
+    """
+    Chooses ``size`` items uniformly at random in a single pass.
+
+    :returns: List of ``(index, item)`` tuples in input order
+    :rtype: list
+    """
+    reservoir = []
+    for idx, item in enumerate(iterable):
+        if idx < size:
+            reservoir.append((idx, item))
+        else:
+            slot = rng.randint(0, idx)
+            if slot < size:
+                reservoir[slot] = (idx, item)
+    return sorted(reservoir, key=lambda pair: pair[0])
+
+
+def bernoulli_sample(iterable, rate, rng):
+    """
+    Keeps each item independently with probability ``rate``.
+
+    :returns: Generator of ``(index, item)`` tuples
+    """
+    for idx, item in enumerate(iterable):
+        if rng.random() < rate:
+            yield idx, item
+
+
+def offset_sample(start, stop, size, rng):
+    """
+    Draws ``size`` sorted byte offsets uniformly from ``[start, stop)``.
+
+    Offsets are resolved by the loader to the first line starting at or after
+    each offset, which weights lines by the length of the line before them;
+    estimates are approximate when line lengths vary widely.
+
+    :rtype: list
+    """
+    if stop <= start:
+        return []
+    return sorted(rng.randrange(start, stop) for _ in range(size))
@@ -0,0 +1,385 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import sys
+import json
+import pickle
+import inspect
+import tempfile
+import importlib
+import collections
+
+
+import six
+import pkg_resources
+
+
+from compat import DEFAULT_ENCODING
+from exceptions import ValidationConfigurationException
+from validation import close_stream, SimpleCSVFileValidator
+from validators import (
+    BaseValidator,
+    IntVal,
+    FloatVal,
+    BoolVal,
+    RangeVal,
+    EnumVal,
+    UniqueVal,
+    RegexVal,
+    EmptyVal,
+    AnyVal,
+    ForeignKeyVal,
+    DateTimeVal,
+)
+
+
+__all__ = (
+    'Schema',
+    'validate_schemas',
+    'compile_schema',
+    'load_schema',
+    'load_schemas',
+    'VALIDATORS',
+    'VALIDATOR_MODULES',
+)
+
+
+SCHEMA_CACHE_VERSION = 1
+SCHEMA_CACHE_SUFFIX = '.compiled'
+SCHEMA_EXTENSIONS = ('.json', '.yaml', '.yml')
+RESERVED_OPTIONS = frozenset(['validators', 'logger'])
+CACHE_ERRORS = (IOError, OSError, EOFError, ValueError, TypeError,
+                AttributeError, ImportError, pickle.UnpicklingError)
+
+# Validators named in schema files; others are given by dotted path
+VALIDATORS = {
+    validator.__name__: validator
+    for validator in (IntVal, FloatVal, BoolVal, RangeVal, EnumVal,
+                      UniqueVal, RegexVal, EmptyVal, AnyVal, ForeignKeyVal,
+                      DateTimeVal)
+}
+
+# Modules (and their submodules) of validators named by dotted path; other
+# modules named in schema files are never imported
+VALIDATOR_MODULES = set([BaseValidator.__module__])
+
+try:
+    PACKAGE_VERSION = pkg_resources.get_distribution('csv.validation').version
+except pkg_resources.DistributionNotFound:  # Run from a source tree
+    PACKAGE_VERSION = None
+
+
+class Schema(object):
+    """
+    Validation schema compiled once from a ``BaseFileValidator`` subclass.
+
+    Building validators (compiling patterns, building enumeration sets,
+    opening reference indexes) is done once, when the schema is created. Each
+    run then gets validators spawned from the compiled ones and its own
+    logger, so runs never see each other's failures, duplicates, or logs::
+
+        >>> schema = Schema(YourFirstValidator)
+        >>> for path in paths:
+        ...     result = schema.run(LocalFileLoader(path))
+    """
+
+    def __init__(self, validator_class):
+        self.validator_class = validator_class
+        self.validators = {
+            field: list(value) or [validator_class.default_validator()]
+            for field, value in six.iteritems(validator_class.validators)
+        }
+
+    def validator(self, source):
+        """ Returns a validator for ``source`` with isolated run state """
+        return self.validator_class(source, validators=self.validators)
+
+    def run(self, source):
+        """ Validates ``source`` and returns its ``Result`` """
+        return self.validator(source)()
+
+    __call__ = run
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__,
+                               self.validator_class.__name__)
+
+
+def validate_schemas(schemas, source):
+    """
+    Validates one source against several schemas in a single parse.
+
+    The header is read once and checked by every schema; each parsed record
+    is then fanned out to the validators of every schema whose header checks
+    passed, so triaging a file costs about one parse plus the validators.
+    Schemas with a different delimiter, quote character or parser need
+    their own parse. Budgets are not applied.
+
+    :param schemas: Sequence or mapping of ``Schema`` objects or
+        ``SimpleCSVFileValidator`` subclasses
+    :param source: Loader, streamed once per dialect
+    :returns: ``Result`` per schema, as a list in the order of ``schemas``
+        or as a dictionary with the keys of ``schemas``
+    """
+    keys = list(schemas) if isinstance(schemas, dict) else None
+    validators = [
+        (schema if isinstance(schema, Schema) else Schema(schema))
+        .validator(source)
+        for schema in ([schemas[key] for key in keys] if keys else schemas)
+    ]
+
+    # Validators sharing a dialect and parser share a parse
+    outcomes, dialects = {}, collections.OrderedDict()
+    for validator in validators:
+        validator.logger.log("\nValidating {}(source={})".format(
+            validator.__class__.__name__, source))
+        validator.resolve_dialect()
+        if validator.check_structure and not validator.validate_structure():
+            outcomes[id(validator)] = False
+        else:
+            dialects.setdefault((validator.delimiter, validator.quotechar,
+                                 validator.parser), []).append(validator)
+    for group in dialects.values():
+        outcomes.update(zip(map(id, group), _validate_group(group, source)))
+
+    results = [validator.Result(outcomes[id(validator)], validator.log)
+               for validator in validators]
+    return dict(zip(keys, results)) if keys else results
+
+
+def _validate_group(validators, source):
+    first = validators[0]
+    active = []
+    stream = source.stream()
+    try:
+        reader = first.reader(stream)
+        fieldnames = first.read_headers(reader)
+        active = [validator for validator in validators
+                  if validator.check_headers(fieldnames)]
+        if active:
+            builders = [(validator.validate_row, validator.row_builder())
+                        for validator in active]
+            line = -1
+            for line, record in first.iterrecords(reader, fieldnames):
+                for validate_row, build in builders:
+                    validate_row(line, build(record))
+            for validator in active:
+                validator.rows = line + 1
+                validator.width_mismatches = first.width_mismatches
+                validator.first_width_mismatch = first.first_width_mismatch
+    finally:
+        close_stream(stream)
+    return [validator.finish() if validator in active else False
+            for validator in validators]
+
+
+def compile_schema(spec, name='Schema', base=SimpleCSVFileValidator):
+    """
+    Compiles a schema declared as data into a validator class.
+
+    ``spec`` maps ``columns`` to lists of validators. Each validator is a
+    name in ``VALIDATORS`` or a dotted path to a class, or a mapping of one
+    such name to its arguments: a list of positional arguments, a mapping of
+    keyword arguments, or a single argument. Other keys set attributes of
+    the class, such as ``delimiter`` or ``short_circuit``::
+
+        {"delimiter": ";",
+         "columns": {"id": ["IntVal", "UniqueVal"],
+                     "kind": [{"EnumVal": [["a", "b"]]}],
+                     "code": [{"RegexVal": {"pattern": "^[A-Z]{3}$"}}]}}
+
+    :param name: Name of the class, unless ``spec`` has a ``name``
+    :raises ValidationConfigurationException: If the schema is invalid
+    """
+    name, attributes = schema_attributes(spec, name, base)
+    return type(name, (base,), attributes)
+
+
+def schema_attributes(spec, name, base):
+    """ Returns the class name and attributes declared by a schema """
+    if not isinstance(spec, dict) or \
+            not isinstance(spec.get('columns'), dict):
+        raise ValidationConfigurationException(
+            "Schema {} has no 'columns' mapping".format(name))
+    spec = native_strings(spec)
+    name = str(spec.get('name', name))
+    attributes = {}
+    for option, value in six.iteritems(spec):
+        if option in ('name', 'columns'):
+            continue
+        if option.startswith('_') or option in RESERVED_OPTIONS or \
+                not hasattr(base, option) or callable(getattr(base, option)):
+            raise ValidationConfigurationException(
+                "Unknown option {!r} in schema {}".format(option, name))
+        if option == 'ignored_fields':
+            value = frozenset(value)
+        attributes[str(option)] = value
+    attributes['validators'] = {
+        column: [build_validator(item, name, column) for item in items or []]
+        for column, items in six.iteritems(spec['columns'])
+    }
+    return name, attributes
+
+
+def native_strings(data):
+    """
+    Converts the text of schema data to native strings: on Python 2, JSON
+    and YAML text is ``unicode``, while dialects and fields are bytes.
+    """
+    if isinstance(data, dict):
+        return {native_strings(key): native_strings(value)
+                for key, value in six.iteritems(data)}
+    if isinstance(data, list):
+        return [native_strings(value) for value in data]
+    if six.PY2 and isinstance(data, six.text_type):
+        return data.encode(DEFAULT_ENCODING)
+    return data
+
+
+def build_validator(item, schema, column):
+    """ Builds a validator declared in a schema """
+    if isinstance(item, six.string_types):
+        validator_name, arguments = item, None
+    elif isinstance(item, dict) and len(item) == 1:
+        (validator_name, arguments), = item.items()
+    else:
+        raise ValidationConfigurationException(
+            "Invalid validator {!r} on column {!r} of schema {}".format(
+                item, column, schema))
+    validator_class = resolve_validator(validator_name)
+    try:
+        if arguments is None:
+            return validator_class()
+        elif isinstance(arguments, dict):
+            return validator_class(**{str(key): value for key, value
+                                      in six.iteritems(arguments)})
+        elif isinstance(arguments, list):
+            return validator_class(*arguments)
+        return validator_class(arguments)
+    except (TypeError, ValueError) as exc:
+        raise ValidationConfigurationException(
+            "Invalid arguments of {} on column {!r} of schema {}: {}".format(
+                validator_name, column, schema, exc))
+
+
+def resolve_validator(name):
+    """
+    Returns the validator class of a name or dotted path.
+
+    Dotted paths must name ``BaseValidator`` subclasses in
+    ``VALIDATOR_MODULES``, so schema files can neither import other modules
+    nor call other functions with their arguments.
+    """
+    if name in VALIDATORS:
+        return VALIDATORS[name]
+    module, _, attribute = name.rpartition('.')
+    if module and not any(module == allowed or
+                          module.startswith(allowed + '.')
+                          for allowed in VALIDATOR_MODULES):
+        raise ValidationConfigurationException(
+            "Validator {!r} is not in VALIDATOR_MODULES".format(name))
+    if module:
+        try:
+            validator_class = getattr(importlib.import_module(module),
+                                      attribute)
+        except (ImportError, AttributeError):
+            pass
+        else:
+            if inspect.isclass(validator_class) and \
+                    issubclass(validator_class, BaseValidator):
+                return validator_class
+            raise ValidationConfigurationException(
+                "{!r} is not a validator class".format(name))
+    raise ValidationConfigurationException(
+        "Unknown validator {!r}".format(name))
+
+
+def read_schema_file(path):
+    """ Reads the data of a JSON or YAML schema file """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValidationConfigurationException(
+                "Schema {} requires PyYAML to be installed".format(path))
+        return yaml.safe_load(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def load_schema(path, cache_path=None):
+    """
+    Loads a ``Schema`` from a JSON or YAML schema file (see
+    ``compile_schema``), named after the file unless it has a ``name``.
+
+    The compiled schema, with resolved validator classes, compiled
+    patterns and enumeration sets, is pickled next to the file (or at
+    ``cache_path``) and loaded from there until the size or modification
+    time of the file, or the version of Python or of this package, changes.
+    Caches that cannot be written are skipped.
+    Caches are unpickled, so they must be as trusted as code.
+    """
+    cache_path = cache_path or path + SCHEMA_CACHE_SUFFIX
+    stat = os.stat(path)
+    stamp = (SCHEMA_CACHE_VERSION, PACKAGE_VERSION, sys.version_info[0],
+             stat.st_size, stat.st_mtime)
+    compiled = read_schema_cache(cache_path, stamp)
+    if compiled is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+        compiled = schema_attributes(read_schema_file(path), name,
+                                     SimpleCSVFileValidator)
+        write_schema_cache(cache_path, stamp, compiled)
+    name, attributes = compiled
+    return Schema(type(name, (SimpleCSVFileValidator,), attributes))
+
+
+def load_schemas(directory, cache_dir=None):
+    """
+    Loads the schema files of a directory, as ``load_schema`` does.
+
+    :param cache_dir: Directory of the compiled schemas, if not next to
+        the schema files
+    :returns: Dictionary of ``Schema`` objects keyed by file name without
+        its extension
+    """
+    schemas = {}
+    for filename in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(filename)
+        if extension.lower() not in SCHEMA_EXTENSIONS:
+            continue
+        cache_path = os.path.join(cache_dir, filename + SCHEMA_CACHE_SUFFIX) \
+            if cache_dir else None
+        schemas[stem] = load_schema(os.path.join(directory, filename),
+                                    cache_path)
+    return schemas
+
+
+def read_schema_cache(path, stamp):
+    """ Returns a compiled schema cached for ``stamp``, or ``None`` """
+    try:
+        with open(path, 'rb') as f:
+            cached_stamp, compiled = pickle.load(f)
+    except CACHE_ERRORS:
+        return None
+    return compiled if cached_stamp == stamp else None
+
+
+def write_schema_cache(path, stamp, compiled):
+    """ Writes a compiled schema atomically, skipping unwritable caches """
+    try:
+        fd, writing = tempfile.mkstemp(
+            prefix=os.path.basename(path) + '.',
+            dir=os.path.dirname(os.path.abspath(path)))
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((stamp, compiled), f, pickle.HIGHEST_PROTOCOL)
+        getattr(os, 'replace', os.rename)(writing, path)
+    except (IOError, OSError, TypeError, AttributeError,
+            pickle.PicklingError):  # E.g. validators that cannot be pickled
+        os.remove(writing)
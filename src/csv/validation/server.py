@@ -0,0 +1,310 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import json
+import stat
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+
+
+from compat import DEFAULT_ENCODING
+from exceptions import LoaderException
+from loaders import Loader, LocalFileLoader
+from schema import Schema
+
+
+__all__ = (
+    'RequestBodyLoader',
+    'ValidationService',
+    'ValidationRequestHandler',
+    'make_server',
+    'serve',
+)
+
+
+DEFAULT_ADDRESS = ('127.0.0.1', 8765)
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 64
+
+
+class RequestBodyLoader(Loader):
+    """
+    Streams lines of bytes from an HTTP request body
+
+    Reads no more than ``length`` bytes, so the connection can be reused for
+    the next request.
+    """
+
+    binary = True
+    encoding = DEFAULT_ENCODING
+
+    def __init__(self, source, length):
+        super(RequestBodyLoader, self).__init__(source)
+        self.remaining = length
+
+    def open(self):
+        return list(self.stream())
+
+    def stream(self):
+        while self.remaining > 0:
+            line = self.source.readline(self.remaining)
+            if not line:
+                break
+            self.remaining -= len(line)
+            yield line
+
+    def drain(self):
+        """ Discards the unread rest of the body """
+        for _ in self.stream():
+            pass
+
+    def __repr__(self):
+        return "{}('<request body>')".format(self.__class__.__name__)
+
+
+class ValidationService(object):
+    """
+    Validates sources against named schemas compiled once, at start-up.
+
+    Jobs run in a pool of ``max_workers`` threads. At most ``queue_size``
+    further jobs wait for a worker; jobs beyond that are rejected, so a busy
+    service answers quickly rather than piling up work.
+
+    :param schemas: Mapping of names to ``Schema`` objects or
+        ``BaseFileValidator`` subclasses
+    :param root: Directory of the local files that may be validated; without
+        it, only request bodies are validated
+    """
+
+    def __init__(self, schemas, max_workers=DEFAULT_MAX_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, root=None,
+                 loader=LocalFileLoader):
+        self.schemas = {
+            name: schema if isinstance(schema, Schema) else Schema(schema)
+            for name, schema in six.iteritems(schemas)
+        }
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.root = os.path.realpath(root) if root else None
+        self.loader = loader
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max_workers + queue_size)
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stats = {
+            'pending': 0,
+            'completed': 0,
+            'invalid': 0,
+            'rejected': 0,
+            'errors': 0,
+            'rows': 0,
+            'seconds': 0.0,
+        }
+
+    def count(self, **deltas):
+        with self.lock:
+            for name, delta in six.iteritems(deltas):
+                self.stats[name] += delta
+
+    def path_loader(self, path):
+        """ Returns a loader for a local path, checking it is allowed """
+        if self.root is None:
+            raise LoaderException(
+                'Local files may not be validated without a root')
+        real = os.path.realpath(path)
+        if os.path.commonprefix([real, self.root + os.sep]) != \
+                self.root + os.sep:
+            raise LoaderException(
+                "'{}' is outside of '{}'".format(path, self.root))
+        return self.loader(path)
+
+    def acquire(self):
+        """ Reserves a worker or queue slot, returning False when full """
+        if not self.slots.acquire(False):
+            self.count(rejected=1)
+            return False
+        self.count(pending=1)
+        return True
+
+    def run(self, name, source):
+        """
+        Validates ``source`` with the ``name`` schema in the worker pool.
+
+        A slot must be reserved with ``acquire`` first; it is released when
+        the job is done.
+
+        :returns: JSON-friendly result dictionary
+        :rtype: dict
+        """
+        try:
+            return self.executor.submit(self.validate, name, source).result()
+        finally:
+            self.count(pending=-1)
+            self.slots.release()
+
+    def validate(self, name, source):
+        start = time.time()
+        try:
+            validator = self.schemas[name].validator(source)
+            result = validator()
+        except Exception:
+            self.count(errors=1)
+            raise
+        seconds = time.time() - start
+        self.count(completed=1, invalid=int(result.validation is False),
+                   rows=validator.rows, seconds=seconds)
+        return {
+            'schema': name,
+            'source': repr(source),
+            'validation': result.validation,
+            'complete': result.complete,
+            'progress': result.progress and result.progress._asdict(),
+            'log': result.log,
+            'rows': validator.rows,
+            'seconds': seconds,
+        }
+
+    def health(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            'status': 'ok',
+            'schemas': sorted(self.schemas),
+            'max_workers': self.max_workers,
+            'queue_size': self.queue_size,
+            'uptime': time.time() - self.started,
+            'stats': stats,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class ValidationRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    HTTP interface of a ``ValidationService``
+
+    ``GET /health``
+        Service status and statistics.
+    ``POST /validate/<schema>?path=<path>``
+        Validates a local file under the ``root`` of the service.
+    ``POST /validate/<schema>``
+        Validates the CSV request body, streamed as it is read.
+
+    Both validation requests answer with the ``Result`` as JSON.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # Headers and body are written separately; without TCP_NODELAY each
+        # response on a kept-alive connection waits for a delayed ACK
+        self.disable_nagle_algorithm = \
+            self.server.address_family != getattr(socket, 'AF_UNIX', None)
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self.respond(200, self.server.service.health())
+        else:
+            self.respond(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        name = url.path[len('/validate/'):] \
+            if url.path.startswith('/validate/') else None
+        body = RequestBodyLoader(
+            self.rfile, int(self.headers.get('Content-Length') or 0))
+        try:
+            if name not in service.schemas:
+                return self.respond(
+                    404, {'error': "No schema '{}'".format(name)})
+            paths = parse_qs(url.query).get('path')
+            try:
+                source = service.path_loader(paths[0]) if paths else body
+            except LoaderException as exc:
+                return self.respond(400, {'error': str(exc)})
+            if not service.acquire():
+                return self.respond(
+                    503, {'error': 'Validation queue is full'})
+            try:
+                self.respond(200, service.run(name, source))
+            except LoaderException as exc:
+                self.respond(400, {'error': str(exc)})
+            except Exception as exc:
+                self.respond(500, {'error': '{}: {}'.format(
+                    exc.__class__.__name__, exc)})
+        finally:
+            body.drain()
+
+    def respond(self, status, document):
+        payload = json.dumps(document).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn,
+                              socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(schemas, address=DEFAULT_ADDRESS, verbose=False, **kwargs):
+    """
+    Creates a validation server, ready to ``serve_forever``.
+
+    :param schemas: Mapping of names to ``Schema`` objects or
+        ``BaseFileValidator`` subclasses
+    :param address: ``(host, port)`` to listen on over TCP, or the path of a
+        Unix socket
+    :param kwargs: Passed on to ``ValidationService``
+    """
+    if isinstance(address, six.string_types):
+        if os.path.exists(address) and \
+                stat.S_ISSOCK(os.stat(address).st_mode):
+            os.remove(address)  # Stale socket of a previous server
+        server = ThreadingUnixHTTPServer(address, ValidationRequestHandler)
+    else:
+        server = ThreadingHTTPServer(address, ValidationRequestHandler)
+    server.service = ValidationService(schemas, **kwargs)
+    server.verbose = verbose
+    return server
+
+
+def serve(schemas, address=DEFAULT_ADDRESS, verbose=True, **kwargs):
+    """ Runs a validation server until interrupted """
+    server = make_server(schemas, address, verbose=verbose, **kwargs)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
@@ -0,0 +1,205 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import json
+import shutil
+import tempfile
+import multiprocessing
+
+
+import six
+
+
+from exceptions import ValidationException, LoaderException
+from loaders import LocalFileLoader
+
+
+__all__ = (
+    'ShardLoader',
+    'shard_ranges',
+    'validate_shard',
+    'merge_shards',
+    'validate_sharded',
+)
+
+
+class ShardLoader(LocalFileLoader):
+    """
+    Loads the header and one byte range of a local file
+
+    A line belongs to the shard its first byte falls in, so a set of
+    contiguous ranges covers every line of the file exactly once. Quoted
+    fields spanning several lines must not straddle a range boundary.
+    """
+
+    def __init__(self, source, start, stop):
+        super(ShardLoader, self).__init__(source)
+        self.start = start
+        self.stop = stop
+
+    def open(self):
+        try:
+            with self.loader(self.source, 'rb') as f:
+                lines = [f.readline()]
+                header_end = f.tell()
+                if self.start > header_end:
+                    f.seek(self.start - 1)
+                    f.readline()  # Skip the line straddling the boundary
+                position = f.tell()
+                while position < self.stop:
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+                    position += len(line)
+        except Exception as exc:
+            raise LoaderException(
+                'Unable to load local file shard. Got:\n{}'.format(str(exc))
+            )
+        if six.PY3 and not self.binary:
+            lines = [raw.decode(self.encoding) for raw in lines]
+        return lines
+
+    def stream(self):
+        return iter(self.open())
+
+    def __repr__(self):
+        return "{}('{}'[{}:{}])".format(self.__class__.__name__,
+                                        str(self.source), self.start,
+                                        self.stop)
+
+
+def shard_ranges(path, shards):
+    """
+    Splits a local file into contiguous byte ranges.
+
+    :param path: Path of the file to split
+    :param shards: Number of ranges
+    :returns: List of ``(start, stop)`` byte offsets
+    :rtype: list
+    """
+    size = os.path.getsize(path)
+    step = max(1, -(-size // shards))
+    return [(start, min(size, start + step))
+            for start in range(0, max(size, 1), step)]
+
+
+def validate_shard(validator_class, loader, shard_path):
+    """
+    Validates one shard and writes its partial results to ``shard_path``.
+
+    :returns: The shard path
+    """
+    validator = validator_class(loader)
+    validation = validator.validate()
+    state = {
+        'source': repr(loader),
+        'validation': validation,
+        'rows': validator.rows,
+        'log': list(validator.logger.logs),
+        'failures': [
+            [field_name, line, [str(error) for error in errors]]
+            for field_name, line, errors in validator.failures.iterfailures()
+        ],
+        'validators': {
+            field_name: [instance.serialize() for instance in validators]
+            for field_name, validators in six.iteritems(validator.validators)
+        },
+    }
+    validator.logger.clear()
+    with open(shard_path, 'w') as f:
+        json.dump(state, f)
+    return shard_path
+
+
+def merge_shards(validator_class, shard_paths, source):
+    """
+    Merges partial results written by ``validate_shard`` into one ``Result``.
+
+    Shards must be given in file order. Row numbers are offset by the rows of
+    the preceding shards, and duplicates of ``UniqueVal`` keys found across
+    shards are reported on the row of their first occurrence in the shard
+    that repeated them.
+    """
+    validator = validator_class(source)
+    validator.logger.log("\nValidating {}(source={})".format(
+        validator.__class__.__name__, source))
+
+    for shard_path in shard_paths:
+        with open(shard_path, 'r') as f:
+            state = json.load(f)
+
+        # Header checks are identical for every shard, report them once
+        if not state['validation'] and not state['failures'] and \
+                not state['rows']:
+            for msg in state['log'][1:]:
+                validator.logger.log(msg)
+            return validator.Result(False, validator.log)
+
+        for field_name, line, messages in state['failures']:
+            for msg in messages:
+                validator.failures.add(field_name, line + validator.rows,
+                                       ValidationException(msg))
+
+        for field_name, states in six.iteritems(state['validators']):
+            for instance, partial in zip(validator.validators[field_name],
+                                         states):
+                shared = instance.merge(partial) or {}
+                for key in sorted(shared, key=shared.get):
+                    validator.failures.add(
+                        field_name, validator.rows + shared[key],
+                        ValidationException(
+                            "'{}' is already in the column "
+                            "(found in an earlier shard)".format(key[0])),
+                        instance, key[0])
+
+        validator.rows += state['rows']
+
+    validation = validator.finish()
+    return validator.Result(validation, validator.log)
+
+
+def _validate_shard_task(args):
+    validator_class, path, start, stop, shard_path = args
+    return validate_shard(validator_class, ShardLoader(path, start, stop),
+                          shard_path)
+
+
+def validate_sharded(validator_class, path, shards=None, processes=None,
+                     workdir=None):
+    """
+    Validates a local file in shards using worker processes.
+
+    Each worker validates one byte range of the file and writes its partial
+    results to a shard file; the shard files are then merged into a single
+    ``Result``. Worker processes stand in for separate machines: the shard
+    files are the only state exchanged.
+
+    :param validator_class: ``BaseFileValidator`` subclass to validate with
+    :param path: Path of the local file
+    :param shards: Number of shards (defaults to the number of CPUs)
+    :param processes: Number of worker processes (defaults to ``shards``)
+    :param workdir: Directory for shard files (defaults to a temporary one)
+    :returns: Merged ``Result``
+    """
+    shards = shards or multiprocessing.cpu_count()
+    cleanup = workdir is None
+    workdir = workdir or tempfile.mkdtemp()
+    tasks = [
+        (validator_class, path, start, stop,
+         os.path.join(workdir, 'shard-{}.json'.format(number)))
+        for number, (start, stop) in enumerate(shard_ranges(path, shards))
+    ]
+    pool = multiprocessing.Pool(processes or shards)
+    try:
+        shard_paths = pool.map(_validate_shard_task, tasks)
+        return merge_shards(validator_class, shard_paths,
+                            LocalFileLoader(path))
+    finally:
+        pool.close()
+        pool.join()
+        if cleanup:
+            shutil.rmtree(workdir)
@@ -0,0 +1,171 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import math
+import struct
+import hashlib
+
+
+from compat import to_bytes
+
+
+__all__ = (
+    'SpaceSaving',
+    'HyperLogLog',
+    'BoundedValueTracker',
+)
+
+
+DEFAULT_TOP_K = 30
+DEFAULT_PRECISION = 12
+
+
+class SpaceSaving(object):
+    """
+    Space-Saving heavy hitters summary with a fixed number of counters.
+
+    Tracks at most ``capacity`` values. When a new value arrives and all
+    counters are in use, the value with the smallest count is replaced and
+    the new value inherits its count (recorded as the possible
+    overestimate, ``error``). Any value occurring more than ``n / capacity``
+    times in a stream of ``n`` values is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity=DEFAULT_TOP_K):
+        self.capacity = capacity
+        self.counters = {}  # value: [count, error]
+
+    def add(self, value, count=1):
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [count, 0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[value] = [floor + count, floor]
+
+    def most_common(self, n=None):
+        """
+        Returns ``(value, count)`` tuples, most frequent first.
+
+        Counts may overestimate by at most the replaced counter's count.
+        """
+        ranked = sorted(self.counters.items(),
+                        key=lambda item: (-item[1][0], repr(item[0])))
+        return [(value, counter[0]) for value, counter in ranked[:n]]
+
+    def merge(self, other):
+        """ Merges another summary's counters into this one """
+        for value, (count, error) in other.counters.items():
+            self.add(value, count)
+
+    def __len__(self):
+        return len(self.counters)
+
+
+class HyperLogLog(object):
+    """
+    HyperLogLog distinct count estimator.
+
+    Uses ``2 ** precision`` one-byte registers (4 KiB for the default
+    precision of 12) for a standard error of about ``1.04 / sqrt(2 **
+    precision)``, i.e. 1.6%. Values are hashed with MD5 of their ``repr``,
+    so registers from different processes can be merged.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        digest = hashlib.md5(to_bytes(repr(value))).digest()
+        hashed, = struct.unpack('>Q', digest[:8])
+        idx = hashed >> (64 - self.precision)
+        remainder = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 1
+        while rank <= 64 - self.precision and \
+                not remainder & 0x8000000000000000:
+            remainder <<= 1
+            rank += 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def estimate(self):
+        """ Returns the estimated number of distinct values added """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -register
+                                  for register in self.registers)
+        zeros = self.registers.count(b'\0')  # count(0) fails on Python 2
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(float(m) / zeros)  # Linear counting
+        return raw
+
+    def merge(self, other):
+        """ Merges another estimator with the same precision into this one """
+        self.registers = bytearray(
+            max(mine, theirs)
+            for mine, theirs in zip(self.registers, other.registers))
+
+
+class BoundedValueTracker(object):
+    """
+    Fixed-memory replacement for the set of invalid values of a validator.
+
+    Keeps the ``top_k`` most frequent values with their counts (Space-Saving)
+    and an approximate count of distinct values (HyperLogLog). Iterating
+    yields the most frequent values first and ``len`` returns the estimated
+    number of distinct values.
+    """
+
+    def __init__(self, top_k=DEFAULT_TOP_K, precision=DEFAULT_PRECISION):
+        self.top = SpaceSaving(top_k)
+        self.distinct = HyperLogLog(precision)
+        self.total = 0
+
+    def add(self, value):
+        self.top.add(value)
+        self.distinct.add(value)
+        self.total += 1
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def most_common(self, n=None):
+        return self.top.most_common(n)
+
+    def serialize(self, dump=lambda value: value):
+        return {
+            'top': [[dump(value), count]
+                    for value, count in self.top.most_common()],
+            'registers': list(self.distinct.registers),
+            'total': self.total,
+        }
+
+    def merge(self, state, load=lambda value: value):
+        for value, count in state['top']:
+            self.top.add(load(value), count)
+        other = HyperLogLog(self.distinct.precision)
+        other.registers = bytearray(state['registers'])
+        self.distinct.merge(other)
+        self.total += state['total']
+
+    def __iter__(self):
+        return iter([value for value, _ in self.top.most_common()])
+
+    def __len__(self):
+        return int(round(self.distinct.estimate())) if self.total else 0
+
+    def __bool__(self):
+        return self.total > 0
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "{}(top={}, distinct~{})".format(
+            self.__class__.__name__, self.most_common(), len(self))
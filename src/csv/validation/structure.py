@@ -0,0 +1,316 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import collections
+import multiprocessing
+
+
+import six
+from six import BytesIO
+
+
+from compat import to_bytes
+
+
+__all__ = (
+    'StructuralError',
+    'Scan',
+    'count_fields',
+    'ends_quoted',
+    'StructureScanner',
+    'scan_lines',
+    'scan_file',
+)
+
+
+StructuralError = collections.namedtuple(
+    'StructuralError', 'row, offset, kind, message')
+Scan = collections.namedtuple('Scan', 'rows, errors, error_count, complete')
+
+DEFAULT_ERROR_LIMIT = 100
+MIN_CHUNK_SIZE = 1 << 20
+BLOCK_SIZE = 1 << 18
+
+
+def count_fields(record, delimiter, quotechar):
+    """
+    Counts the fields of one record, checking its quoting.
+
+    :returns: Tuple of ``(fields, kind, position)``, where ``kind`` is
+        ``None`` for a well-formed record, ``'quote'`` for a quote character
+        inside an unquoted field or after a closing quote, or
+        ``'unterminated'`` for a quoted field that is not closed;
+        ``position`` is the offset of the problem in the record
+    :rtype: tuple
+    """
+    fields, position, size = 1, 0, len(record)
+    while True:
+        if record.startswith(quotechar, position):
+            end = position + 1
+            while True:
+                end = record.find(quotechar, end)
+                if end == -1:
+                    return fields, 'unterminated', position
+                if not record.startswith(quotechar, end + 1):
+                    break
+                end += 2  # Escaped (doubled) quote character
+            position = end + 1
+            if position == size:
+                return fields, None, None
+            if not record.startswith(delimiter, position):
+                return fields, 'quote', end
+        else:
+            end = record.find(delimiter, position)
+            stray = record.find(quotechar, position,
+                                size if end == -1 else end)
+            if stray != -1:
+                return fields, 'quote', stray
+            if end == -1:
+                return fields, None, None
+            position = end
+        position += len(delimiter)
+        fields += 1
+
+
+def ends_quoted(record, delimiter, quotechar):
+    """
+    Checks whether a record ends inside a quoted field, so it continues on
+    the next line.
+
+    As by ``csv.reader``, quote characters open a quoted field at the start
+    of a field only, and are literal elsewhere.
+    """
+    position = 0
+    while True:
+        if record.startswith(quotechar, position):
+            end = position + 1
+            while True:
+                end = record.find(quotechar, end)
+                if end == -1:
+                    return True
+                if not record.startswith(quotechar, end + 1):
+                    break
+                end += 2  # Escaped (doubled) quote character
+            position = end + 1
+        end = record.find(delimiter, position)
+        if end == -1:
+            return False
+        position = end + len(delimiter)
+
+
+class StructureScanner(object):
+    """
+    Checks the structure of records fed to it in lines or blocks.
+
+    Lines without quote characters are checked by counting delimiters; only
+    lines with quote characters are parsed. A record continues on the next
+    line while one of its quoted fields is open. The first record is the
+    header, unless its ``width`` (number of fields) is given. Blank lines are
+    skipped and rows are numbered from ``0``, as by validation.
+
+    :param delimiter: Delimiter, of the same type (bytes or text) as lines
+    :param offset: Offset of the first line, for reporting
+    :param limit: Maximum number of errors kept (all are counted)
+    """
+
+    def __init__(self, delimiter=',', quotechar='"', width=None, offset=0,
+                 limit=DEFAULT_ERROR_LIMIT):
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.width = width
+        self.limit = limit
+        self.newlines = to_bytes('\r\n') \
+            if isinstance(delimiter, six.binary_type) else '\r\n'
+        self.errors = []
+        self.error_count = 0
+        self.rows = 0
+        self.pieces = None  # Lines of a record with an open quoted field
+        self.start = offset
+        self.position = offset
+
+    def feed_block(self, block):
+        """
+        Checks a block of complete lines of bytes.
+
+        Blocks without quote characters, in which every line has the
+        expected number of delimiters, are checked without a Python loop
+        over their lines.
+        """
+        if self.pieces is None and self.width and self.width > 1 and \
+                self.quotechar not in block:
+            lines = block.split(b'\n')
+            if not lines[-1]:
+                lines.pop()
+            delimiter = self.delimiter
+            counts = [line.count(delimiter) for line in lines]
+            if counts.count(self.width - 1) == len(counts):
+                self.rows += len(counts)
+                self.position += len(block)
+                return
+        self.feed(BytesIO(block))
+
+    def feed(self, lines):
+        """ Checks lines, with line endings """
+        delimiter, quotechar = self.delimiter, self.quotechar
+        width, rows, position = self.width, self.rows, self.position
+        for line in lines:
+            if self.pieces is None:
+                self.start = position
+                position += len(line)
+                if quotechar not in line:
+                    if not line.strip():
+                        continue
+                    fields, kind, at = line.count(delimiter) + 1, None, None
+                else:
+                    fields, kind, at = count_fields(
+                        line.rstrip(self.newlines), delimiter, quotechar)
+                    if kind == 'unterminated':
+                        self.pieces = [line]
+                        continue  # A quoted field continues on the next line
+            else:
+                position += len(line)
+                self.pieces.append(line)
+                if quotechar not in line:
+                    continue
+                fields, kind, at = count_fields(
+                    line[:0].join(self.pieces).rstrip(self.newlines),
+                    delimiter, quotechar)
+                if kind == 'unterminated':
+                    continue
+                self.pieces = None
+
+            if width is None:
+                width = self.width = fields
+                continue
+            if kind is not None or fields != width:
+                self.error(rows, fields, kind, at)
+            rows += 1
+        self.rows, self.position = rows, position
+
+    def error(self, row, fields, kind, at):
+        self.error_count += 1
+        if len(self.errors) >= self.limit:
+            return
+        if kind == 'quote':
+            message = 'stray quote character'
+        elif kind == 'unterminated':
+            message = 'quoted field is not closed'
+        else:
+            kind, at = 'width', 0
+            message = '{} field(s), expected {}'.format(fields, self.width)
+        self.errors.append(
+            StructuralError(row, self.start + at, kind, message))
+
+    def finish(self):
+        """ Returns the ``Scan``, reporting a record left open as an error """
+        complete = self.pieces is None
+        if not complete:
+            self.error(self.rows, None, 'unterminated', 0)
+        return Scan(self.rows, self.errors, self.error_count, complete)
+
+
+def scan_lines(lines, delimiter=',', quotechar='"', width=None, offset=0,
+               limit=DEFAULT_ERROR_LIMIT):
+    """
+    Checks the structure of records read from lines.
+
+    :param lines: Iterable of lines of bytes or text, with line endings;
+        ``delimiter`` and ``quotechar`` must be of the same type
+    :rtype: Scan
+    """
+    scanner = StructureScanner(delimiter, quotechar, width, offset, limit)
+    scanner.feed(lines)
+    return scanner.finish()
+
+
+def iterblocks(f, start, stop, size=BLOCK_SIZE):
+    """
+    Yields blocks of the complete lines of a binary file starting in
+    ``[start, stop)``
+    """
+    f.seek(start)
+    position = start
+    while position < stop:
+        block = f.read(min(size, stop - position))
+        if not block:
+            break
+        if not block.endswith(b'\n'):
+            block += f.readline()
+        position += len(block)
+        yield block
+
+
+def line_start(f, offset):
+    """ Returns the offset of the first line starting at or after offset """
+    f.seek(offset - 1)
+    f.readline()
+    return f.tell()
+
+
+def _scan_chunk(args):
+    path, start, stop, width, delimiter, quotechar, limit = args
+    scanner = StructureScanner(delimiter, quotechar, width, start, limit)
+    with open(path, 'rb') as f:
+        for block in iterblocks(f, start, stop):
+            scanner.feed_block(block)
+    return scanner.finish()
+
+
+def scan_file(path, delimiter=',', quotechar='"', start=0, stop=None,
+              processes=None, limit=DEFAULT_ERROR_LIMIT):
+    """
+    Checks the structure of the records of a local file.
+
+    Only rows whose first byte falls in ``[start, stop)`` are checked, after
+    the header; the default is the whole file. With ``processes`` greater
+    than one, chunks of the range are scanned in parallel, each assuming it
+    starts on a record boundary. If a chunk ends inside a quoted field, that
+    assumption may not hold and the range is scanned again serially.
+
+    :returns: ``Scan`` with rows numbered from the first row checked and
+        byte offsets in the file
+    :rtype: Scan
+    """
+    delimiter, quotechar = to_bytes(delimiter), to_bytes(quotechar)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        body = f.tell()
+        stop = os.path.getsize(path) if stop is None else stop
+        if start > body:
+            body = line_start(f, start)
+        width = count_fields(header.rstrip(b'\r\n'), delimiter, quotechar)[0]
+
+        chunks = [(body, stop)]
+        if processes and processes > 1 and stop - body > MIN_CHUNK_SIZE:
+            step = max(MIN_CHUNK_SIZE, -(-(stop - body) // processes))
+            bounds = sorted(set(
+                [body, stop] + [min(line_start(f, offset), stop)
+                                for offset in range(body + step, stop, step)]))
+            chunks = [(low, high) for low, high in zip(bounds, bounds[1:])
+                      if low < high]
+
+    tasks = [(path, low, high, width, delimiter, quotechar, limit)
+             for low, high in chunks]
+    if len(tasks) == 1:
+        return _scan_chunk(tasks[0])
+
+    pool = multiprocessing.Pool(min(processes, len(tasks)))
+    try:
+        scans = pool.map(_scan_chunk, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    if not all(scan.complete for scan in scans[:-1]):
+        return _scan_chunk((path, body, stop, width, delimiter, quotechar,
+                            limit))
+
+    errors, error_count, rows = [], 0, 0
+    for scan in scans:
+        errors.extend(error._replace(row=error.row + rows)
+                      for error in scan.errors)
+        error_count += scan.error_count
+        rows += scan.rows
+    return Scan(rows, errors[:limit], error_count, scans[-1].complete)
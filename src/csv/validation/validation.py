@@ -3,24 +3,82 @@
 #
 
 
-import csv
+import os
 import six
+import math
+import random
+import itertools
+import operator
 import collections
 
 
 from ..logger import SimpleLogger
-from exceptions import ValidationException
-from validators import EmptyVal
+from exceptions import ValidationException, ValidationConfigurationException
+from compat import to_text, to_bytes
+from dialects import DEFAULT_PREFIX_SIZE, detect_dialect
+from failures import InMemoryFailureStore
+from incremental import (
+    DEFAULT_WINDOW,
+    row_hashes,
+    iterbatches,
+    PreviousRun,
+    RowAligner,
+    RowWriter,
+)
+from parsers import get_parser, STREAMING_PARSERS
+from rowindex import RowIndex, RowIndexer
+from structure import scan_file
+from validators import (
+    EmptyVal,
+    AnyVal,
+    BaseTypeValidator,
+    FAILURE_COUNT_INITIALIZE,
+)
+from sampling import (
+    Estimate,
+    SampleResult,
+    wilson_interval,
+    reservoir_sample,
+    bernoulli_sample,
+    offset_sample,
+)
 
 
 __all__ = (
     'DEFAULT_DELIMITER',
     'DEFAULT_VALIDATOR',
+    'Result',
     'BaseFileValidator',
     'SimpleCSVFileValidator',
 )
 
 
+class Result(collections.namedtuple('Result', 'validation, log')):
+    """
+    Outcome and log of a validation run.
+
+    Runs stopped by a ``budget`` are not ``complete``; their ``progress``
+    tells how far they got, and their ``validation`` is ``None`` unless
+    failures were found before they stopped. Runs sampled by a ``profiler``
+    have a ``profile``.
+    """
+
+    complete = True
+    progress = None
+    profile = None
+
+    def stopped(self, progress):
+        """ Marks the result as incomplete """
+        self.complete = False
+        self.progress = progress
+        return self
+
+    def profiled(self, profile):
+        """ Attaches the ``Profile`` of the run """
+        self.profile = profile
+        return self
+
+
 class BaseFileValidator(object):
     """
     Base class for CSV validators.
@@ -30,6 +88,10 @@ class BaseFileValidator(object):
 
     Implementations must specify the ``validators`` attribute and define the
     ``validate`` function.
+
+    Each instance validates with validators spawned from ``validators`` (or
+    from the ``validators`` argument) and logs to its own logger, so
+    instances are isolated from each other and may run in separate threads.
     """
 
     validators = NotImplemented
@@ -37,31 +99,70 @@ class BaseFileValidator(object):
     default_validator = NotImplemented
     check_duplicate_headers = NotImplemented
     logger = NotImplemented
+    failure_store = InMemoryFailureStore
+    bounded_failures = None  # Top-K invalid values tracked per validator
+    budget = None  # ``Budget`` limiting the resources of a run
+    profiler = None  # ``Profiler`` sampling the stacks of runs
 
-    Result = collections.namedtuple('Result', 'validation, log')
+    Result = Result
 
-    def __init__(self, source):
-        self.failures = collections.defaultdict(
-            lambda: collections.defaultdict(list)  # Need a callable to nest
-        )
+    def __init__(self, source, validators=None):
+        self.failures = self.failure_store()
         self.missing_validators = None
         self.missing_fields = None
+        self.fields = []
+        self.projection = []
+        self.rows = 0
+        self.width_mismatches = 0
+        self.first_width_mismatch = None
+        self.structural_errors = []
+        self.progress = None  # ``Progress`` of a run stopped by the budget
+        self.row_index = None  # ``RowIndex`` of the source
+        self.validator_order = None  # Validators per field, once ordered
+        self.conversions = {}  # Validators sharing casts, per field
+        self.warmup_rows = 0
         self.source = source
 
-        # Set validation to default validators if no validators provided
-        self.validators.update({
-            field: [self.default_validator()]
-            for field, value in six.iteritems(self.validators) if not value
-        })
+        # Spawn validators with run state private to this instance, so
+        # instances may validate concurrently. Fields without validators get
+        # the default validator.
+        self.validators = {
+            field: [validator.spawn() for validator in value] or
+            [self.default_validator()]
+            for field, value in six.iteritems(validators or self.validators)
+        }
+        if self.bounded_failures is not None:
+            for validators_list in six.itervalues(self.validators):
+                for validator in validators_list:
+                    validator.bound(self.bounded_failures)
+
+        # Log to a logger private to this instance
+        if self.logger is not NotImplemented:
+            self.logger = type(self.logger)()
 
     def __call__(self):
-        validation = self.validate()
+        sampler = self.profiler.start(self.__class__.__name__) \
+            if self.profiler is not None else None
+        try:
+            validation = self.validate()
+        finally:
+            profile = sampler.stop() if sampler else None
+        if profile is not None:
+            self.logger.log(
+                "Sampled {} stack(s) every {}s of {} time{}".format(
+                    profile.samples, profile.interval, profile.clock,
+                    ' to {}'.format(profile.path) if profile.path else ''))
         log = self.log
-        return self.Result(validation, log)
+        result = self.Result(validation, log)
+        if self.progress is not None:
+            result = result.stopped(self.progress)
+        if profile is not None:
+            result = result.profiled(profile)
+        return result
 
     @property
     def log(self):
-        outlog = self.logger.logs
+        outlog = list(self.logger.logs)
         self.logger.clear()
         return outlog
 
@@ -82,8 +183,12 @@ class ValidationLogger(SimpleLogger):
 
 
 DEFAULT_DELIMITER = ','
+DEFAULT_QUOTECHAR = '"'
 DEFAULT_VALIDATOR = EmptyVal
 DEFAULT_DISPLAY_LIMIT = 30
+SAMPLE_PROBE_LINES = 100
+UNCONVERTED = object()  # Markers of shared conversions of a field
+CONVERSION_FAILED = object()
 
 
 class SimpleCSVFileValidator(BaseFileValidator):
@@ -91,28 +196,285 @@ class SimpleCSVFileValidator(BaseFileValidator):
 
     validators = {}
     delimiter = DEFAULT_DELIMITER
+    quotechar = DEFAULT_QUOTECHAR
     default_validator = DEFAULT_VALIDATOR
     check_duplicate_headers = True
+    ignored_fields = frozenset()
+    auto_dialect = False  # Detect delimiter and quote character
+    dialect_cache = None  # ``DialectCache`` shared by auto dialect runs
+    check_structure = False  # Check field counts and quoting first
+    structure_processes = None  # Processes scanning chunks in parallel
+    row_index_every = None  # Rows between byte offsets kept in a row index
+    incremental = False  # Validate only rows changed since the last run
+    incremental_window = DEFAULT_WINDOW  # Rows searched for moved rows
+    short_circuit = False  # Stop at the first failure of each field
+    order_warmup = None  # Rows measured before ordering validators by cost
+    parser = 'csv'  # Backend in ``parsers.PARSERS``: csv, split or pyarrow
     logger = ValidationLogger()
 
     def set_validators(self, headers):
         self.validators = {header: [] for header in headers}
 
-    def validate(self):  # noqa: MC0001
+    def validate(self):
         self.logger.log("\nValidating {}(source={})".format(
             self.__class__.__name__, self.source))
+        self.resolve_dialect()
+        if self.check_structure and not self.validate_structure():
+            return False
+        if self.incremental and self.state_path() is not None:
+            if self.budget is not None or self.row_index_every:
+                raise ValidationConfigurationException(
+                    'Incremental runs do not support budgets or row indexes')
+            return self.validate_changes()
+
+        # Header checks read only the first record of the stream
+        indexer = self.row_indexer()
+        stream = self.source.stream_at() if indexer \
+            else self.source.stream()
+        tracker = self.budget.start() if self.budget is not None else None
+        try:
+            reader = self.reader(tracker.count(stream) if tracker
+                                 else stream)
+            fieldnames = self.read_headers(reader)
+            if not self.check_headers(fieldnames):
+                return False
+
+            # Validation algorithm, checking the budget every few rows
+            rows = self.iterrows(reader, fieldnames)
+            if indexer:
+                rows = indexer.rows(rows, stream)
+            if tracker:
+                rows = tracker.limit(rows)
+            line = -1
+            for line, row in rows:
+                self.validate_row(line, row)
+            self.rows = line + 1
+        finally:
+            close_stream(stream)
+        if tracker and tracker.reason:
+            self.progress = tracker.progress(self.rows)
+        elif indexer:
+            indexer.index.rows = self.rows
+            indexer.index.save(self.row_index_path())
+            self.row_index = indexer.index
+
+        return self.finish()
+
+    def validate_headers(self):
+        """
+        Checks the header record without reading the rest of the source.
+
+        Runs the same field name, duplicate header, missing validator, and
+        missing field checks as ``validate``.
+        """
+        self.logger.log("\nValidating headers of {}(source={})".format(
+            self.__class__.__name__, self.source))
+        self.resolve_dialect()
+
+        stream = self.source.stream()
+        try:
+            fieldnames = self.read_headers(self.reader(stream))
+        finally:
+            close_stream(stream)
+
+        if not self.check_headers(fieldnames):
+            return False
+        self.logger.log("Successful header validation\n")
+        return True
+
+    def validate_structure(self):
+        """
+        Checks the field count and quoting of every record of the source.
 
-        reader = csv.DictReader(self.source.open(), delimiter=self.delimiter)
+        Runs a fast scan of local files before any validator, logging the
+        row and byte offset of structural errors. Sources that cannot be
+        read twice are not scanned.
+        """
+        if not self.source.seekable:
+            return True
+        scan = scan_file(self.source.source, self.delimiter, self.quotechar,
+                         start=getattr(self.source, 'start', 0),
+                         stop=getattr(self.source, 'stop', None),
+                         processes=self.structure_processes)
+        self.structural_errors = scan.errors
+        if not scan.error_count:
+            return True
+        self.logger.log("Failed structural validation: {} error(s)".format(
+            scan.error_count))
+        for error in scan.errors[:DEFAULT_DISPLAY_LIMIT]:
+            self.logger.log("  Row {} (byte {}): {}".format(
+                error.row, error.offset, error.message))
+        if scan.error_count > DEFAULT_DISPLAY_LIMIT:
+            self.logger.log("  ({} more suppressed)".format(
+                scan.error_count - DEFAULT_DISPLAY_LIMIT))
+        self.logger.log("Failed validation\n")
+        return False
+
+    def resolve_dialect(self):
+        """
+        Detects the delimiter and quote character when ``auto_dialect`` is
+        set, from a prefix of the source or from the ``dialect_cache``.
+        """
+        if not self.auto_dialect:
+            return
+        if self.dialect_cache is not None:
+            dialect = self.dialect_cache.detect(self.source,
+                                                self.dialect_key())
+        else:
+            dialect = detect_dialect(self.source.head(DEFAULT_PREFIX_SIZE))
+        self.delimiter, self.quotechar = dialect
+        self.logger.log("Detected delimiter {!r} and quote character {!r}"
+                        .format(str(self.delimiter), str(self.quotechar)))
+
+    def dialect_key(self):
+        """
+        Returns the ``dialect_cache`` key of the source.
+
+        Defaults to the source pattern; override to key by e.g. partner.
+        """
+        return self.dialect_cache.key(self.source)
+
+    def row_index_path(self):
+        """
+        Returns the path of the sidecar row index of the source, or ``None``
+        if the source cannot be indexed.
+
+        Defaults to the path of local files with a ``.rowidx`` suffix. Byte
+        ranges of files are not indexed, as their rows are numbered from
+        the start of the range.
+        """
+        if not self.source.seekable or \
+                getattr(self.source, 'stop', None) is not None:
+            return None
+        return '{}.rowidx'.format(self.source.source)
+
+    def row_indexer(self):
+        """ Returns a ``RowIndexer`` if the run should build a row index """
+        if not self.row_index_every or self.row_index_path() is None or \
+                self.parser not in STREAMING_PARSERS:
+            return None
+        indexer = RowIndexer(self.row_index_every)
+        indexer.index.stamp(self.source.source)
+        return indexer
+
+    def load_row_index(self):
+        """
+        Returns the row index of the source, or ``None`` if it has none or
+        the source changed since it was indexed.
+        """
+        path = self.row_index_path()
+        if path is None:
+            return None
+        if self.row_index is None and os.path.exists(path):
+            self.row_index = RowIndex.load(path)
+        if self.row_index is not None and \
+                self.row_index.matches(self.source.source):
+            return self.row_index
+        return None
+
+    def read_rows(self, start, stop):
+        """
+        Reads the rows numbered in ``[start, stop)``, e.g. around a failure.
+
+        Seeks to the last indexed row before ``start`` if the source has a
+        current row index, and reads from the header otherwise.
+
+        :returns: List of ``(line, record)`` tuples, where records are lists
+            of all the fields
+        :rtype: list
+        """
+        self.resolve_dialect()
+        index = self.load_row_index()
+        line, offset = index.locate(start) if index else (0, None)
+        stream = self.source.stream() if offset is None \
+            else self.source.stream_at(offset)
+        rows = []
+        try:
+            reader = self.reader(stream)
+            if offset is None:
+                next(reader, None)  # Skip the header
+            for record in reader:
+                if not record:
+                    continue
+                if line >= stop:
+                    break
+                if line >= start:
+                    rows.append((line, record))
+                line += 1
+        finally:
+            close_stream(stream)
+        return rows
+
+    def reader(self, lines):
+        """
+        Returns an iterator of records (lists of fields) parsed from lines.
+
+        Lines are parsed by the ``parser`` backend. Lines of bytes from
+        binary loaders are parsed into bytes fields without decoding them.
+        """
+        parse = get_parser(self.parser)
+        return parse(lines, delimiter=self.delimiter,
+                     quotechar=self.quotechar, binary=self.source.binary,
+                     encoding=self.source.encoding)
+
+    def read_headers(self, reader):
+        """ Reads the header record, returning field names as text """
+        fieldnames = next(reader, None)
+        if fieldnames and self.source.binary:
+            fieldnames = [to_text(name, self.source.encoding)
+                          for name in fieldnames]
+        return fieldnames
+
+    def iterrows(self, reader, fieldnames):
+        """ Yields ``(line, row)`` tuples of rows of projected columns """
+        build = self.row_builder()
+        for line, record in self.iterrecords(reader, fieldnames):
+            yield line, build(record)
+
+    def iterrecords(self, reader, fieldnames):
+        """
+        Yields ``(line, record)`` tuples of records with all the fields.
+
+        Blank lines are skipped and short records are padded with ``None``,
+        as by ``csv.DictReader``. Records with a different number of fields
+        than the header are counted in ``width_mismatches``.
+        """
+        width = len(fieldnames)
+        line = -1
+        for record in reader:
+            if not record:
+                continue
+            line += 1
+            if len(record) != width:
+                self.mismatched(line, record, width)
+            yield line, record
+
+    def mismatched(self, line, record, width):
+        """ Counts a record of the wrong width, padding short records """
+        self.width_mismatches += 1
+        if self.first_width_mismatch is None:
+            self.first_width_mismatch = line
+        if len(record) < width:
+            record += [None] * (width - len(record))
+
+    def row_builder(self):
+        """ Returns a callable building the row of projected columns """
+        getter = column_getter([idx for idx, _ in self.projection])
+        names = [name for _, name in self.projection]
+        return lambda record: dict(zip(names, getter(record)))
+
+    def check_headers(self, fieldnames):  # noqa: MC0001
+        """ Checks field names against the validators, logging problems """
 
         # Check for fieldnames
-        if not reader.fieldnames:
+        if not fieldnames:
             self.logger.log("Source CSV has no field names")
             return False
 
         # Check for duplicate column names
         if self.check_duplicate_headers and \
-                (len(reader.fieldnames) != len(set(reader.fieldnames))):
-            duplicates = find_duplicates_by_idx(reader.fieldnames)
+                (len(fieldnames) != len(set(fieldnames))):
+            duplicates = find_duplicates_by_idx(fieldnames)
             self.logger.log('Found duplicate column headers:')
             for header, idxs in six.iteritems(duplicates):
                 locations = ", ".join([str(idx) for idx in idxs])
@@ -120,66 +482,626 @@ class SimpleCSVFileValidator(BaseFileValidator):
                                 ', columns: ' + locations)
 
         # Check for missing validators
-        self.missing_validators = set(reader.fieldnames) - set(self.validators)
+        self.missing_validators = set(fieldnames) - set(self.validators)
         if self.missing_validators:
             self.logger.log("Missing validators for:")
             log_missing(self.missing_validators, self.logger)
             return False
 
         # Check for missing fields
-        self.missing_fields = set(self.validators) - set(reader.fieldnames)
+        self.missing_fields = set(self.validators) - set(fieldnames)
         if self.missing_fields:
             self.logger.log("Missing expected fields:")
             log_missing(self.missing_fields, self.logger)
             return False
 
-        # Validation algorithm
-        for line, row in enumerate(reader):
-            for field_name, field in six.iteritems(row):
-                for validator in self.validators[field_name]:
+        self.project(fieldnames)
+        return True
+
+    def project(self, fieldnames):
+        """
+        Selects the columns to validate and the columns rows must contain.
+
+        Columns listed in ``ignored_fields``, and columns whose validators
+        are all ``AnyVal``, are neither validated nor included in rows
+        unless another validator reads them as context. Rows hold every
+        column if a validator does not declare its ``context_fields``.
+        """
+        self.fields = []
+        context = set([])
+        for field_name in unique_items(fieldnames):
+            validators = self.validators[field_name]
+            if field_name in self.ignored_fields or \
+                    all(isinstance(validator, AnyVal)
+                        for validator in validators):
+                continue
+            self.fields.append(field_name)
+            for validator in validators:
+                context.update(context_of(validator, fieldnames))
+
+        self.conversions = {
+            field_name: conversion_plan(self.validators[field_name])
+            for field_name in self.fields
+            if shares_conversion(self.validators[field_name])}
+
+        # The last of duplicate headers wins, as with DictReader
+        positions = {name: idx for idx, name in enumerate(fieldnames)}
+        self.projection = sorted(
+            (positions[name], name)
+            for name in set(self.fields) | context if name in positions
+        )
+
+    def validate_row(self, line, row):
+        """
+        Runs the validators of each projected field in a row, returning
+        whether all of them passed
+        """
+        if self.short_circuit and (self.validator_order is not None or
+                                   not self.order_warmup):
+            return self.validate_cells(line, row)
+
+        passed = True
+        conversions = self.conversions
+        for field_name in self.fields:
+            field = row[field_name]
+            if field_name in conversions:
+                if not self.validate_converted(line, field_name, field, row,
+                                               conversions[field_name]):
+                    passed = False
+                continue
+            for validator in self.validators[field_name]:
+                try:
+                    validator.validate(field, row=row)
+                except ValidationException as exc:
+                    self.failures.add(field_name, line, exc, validator, field)
+                    validator.failure_count += 1
+                    passed = False
+        if self.short_circuit:  # Warming up
+            self.warmup_rows += 1
+            if self.warmup_rows >= self.order_warmup:
+                self.order_validators()
+        return passed
+
+    def validate_cells(self, line, row):
+        """
+        Runs the validators of each projected field in a row until one of
+        them fails, in the order chosen by ``order_validators``. Validators
+        that ``sees_every_value``, such as ``UniqueVal``, always run.
+        """
+        passed = True
+        order = self.validator_order or self.validators
+        conversions = self.conversions
+        for field_name in self.fields:
+            field = row[field_name]
+            if field_name in conversions:
+                if not self.validate_converted(line, field_name, field, row,
+                                               conversions[field_name], True):
+                    passed = False
+                continue
+            failed = False
+            for validator in order[field_name]:
+                if failed and not validator.sees_every_value:
+                    continue
+                try:
+                    validator.validate(field, row=row)
+                except ValidationException as exc:
+                    self.failures.add(field_name, line, exc, validator, field)
+                    validator.failure_count += 1
+                    failed = True
+            if failed:
+                passed = False
+        return passed
+
+    def validate_converted(self, line, field_name, field, row, plan,
+                           short_circuit=False):
+        """
+        Runs validators of a field that share conversions, returning whether
+        all of them passed.
+
+        Each ``conversion`` of the field runs once, and its value is passed
+        to the ``check`` of each validator using it. A field that fails to
+        convert is reported by the first of them only.
+
+        :param plan: List of ``(validator, conversion, check)`` tuples, as
+            returned by ``conversion_plan``
+        """
+        values = {}
+        failed = False
+        for validator, conversion, check in plan:
+            if failed and short_circuit and not validator.sees_every_value:
+                continue
+            try:
+                if conversion is None:
+                    validator.validate(field, row=row)
+                    continue
+                if not validator.converts(field):
+                    continue
+                value = values.get(conversion, UNCONVERTED)
+                if value is UNCONVERTED:
                     try:
-                        validator.validate(field, row=row)
-                    except ValidationException as exc:
-                        self.failures[field_name][line].append(exc)
-                        validator.failure_count += 1
+                        value = values[conversion] = conversion(field)
+                    except ValueError as exc:
+                        values[conversion] = CONVERSION_FAILED
+                        raise validator.conversion_failed(field, exc)
+                if check is not None and value is not CONVERSION_FAILED:
+                    check(value, field, row)
+            except ValidationException as exc:
+                self.failures.add(field_name, line, exc, validator, field)
+                validator.failure_count += 1
+                failed = True
+        return not failed
+
+    def order_validators(self):
+        """
+        Orders the validators of each field for ``short_circuit`` runs,
+        after ``order_warmup`` rows were validated by all of them.
+
+        Validators that ``sees_every_value`` run first, as they run on every
+        field anyway, then validators by their ``cost`` hint per failure in
+        the warm-up rows, so cheap validators that often fail run first. The
+        order only depends on the rows, not on timings, so runs are
+        reproducible.
+        """
+        rows = self.warmup_rows
+
+        def key(item):
+            position, validator = item
+            failures = validator.failure_count - FAILURE_COUNT_INITIALIZE
+            return (not validator.sees_every_value,
+                    validator.cost * (rows + 2.0) / (failures + 1), position)
+
+        self.validator_order = {}
+        for field_name in self.fields:
+            order = [validator for _, validator in sorted(
+                enumerate(self.validators[field_name]), key=key)]
+            self.validator_order[field_name] = order
+            if field_name in self.conversions:
+                self.conversions[field_name] = conversion_plan(order)
+            if len(order) > 1:
+                self.logger.log("Ordered validators of '{}': {}".format(
+                    field_name, ', '.join(validator.__class__.__name__
+                                          for validator in order)))
+
+    def state_path(self):
+        """
+        Returns the path of the row hashes kept by ``incremental`` runs, or
+        ``None`` if the source cannot be validated incrementally.
+
+        Defaults to the path of local files with a ``.rows.sqlite`` suffix.
+        Override to compare a file with a previous version at another path.
+        """
+        if not self.source.seekable or \
+                getattr(self.source, 'stop', None) is not None:
+            return None
+        return '{}.rows.sqlite'.format(self.source.source)
+
+    def state_signature(self, fieldnames):
+        """
+        Returns the schema and dialect identifying comparable runs.
+
+        Rows are only compared with a last run of the same signature, which
+        includes the ``configuration`` of each validator. Override to
+        include other settings that may change.
+        """
+        return repr([
+            self.__class__.__name__, self.source.binary, str(self.delimiter),
+            str(self.quotechar), fieldnames, sorted(self.ignored_fields),
+            sorted((name, [(validator.__class__.__name__,
+                            validator.configuration())
+                           for validator in validators])
+                   for name, validators in six.iteritems(self.validators)),
+        ])
+
+    def validate_changes(self):
+        """
+        Validates only the rows that changed since the last run.
+
+        Records are hashed without being parsed and matched in order with
+        the row hashes stored by the last run. Inserted and changed rows,
+        and rows that failed in the last run, are parsed and validated.
+        Stateful validators, such as ``UniqueVal``, also replay the values
+        the last run stored for unchanged rows, so their results match
+        those of a full run. The row hashes of this run replace those of the
+        last run.
+        """
+        stream = self.source.stream()
+        delimiter, quotechar = self.delimiter, self.quotechar
+        if self.source.binary:
+            delimiter, quotechar = to_bytes(delimiter), to_bytes(quotechar)
+        previous = writer = None
+        changed = 0
+        try:
+            batches = iterbatches(stream, delimiter, quotechar)
+            batch = next(batches, [])
+            fieldnames = self.read_headers(self.reader(batch[:1])) \
+                if batch else None
+            if not self.check_headers(fieldnames):
+                return False
+
+            stateful = [(field_name, validator)
+                        for field_name in self.fields
+                        for validator in self.validators[field_name]
+                        if validator.stateful]
+            columns = sorted(set(
+                [field_name for field_name, _ in stateful] +
+                [name for _, validator in stateful
+                 for name in context_of(validator, fieldnames)]))
+            signature = self.state_signature(fieldnames)
+            previous = PreviousRun(self.state_path(), signature)
+            aligner = RowAligner(previous.blocks(), self.incremental_window)
+            writer = RowWriter(self.state_path(), signature)
+            build, width = self.row_builder(), len(fieldnames)
 
-        # Log validation failures
+            def parse(line, batch, todo):
+                """ Parses and builds the rows of a batch to validate """
+                raws = [batch[idx] for idx in todo]
+                records = list(self.reader(raws))
+                if len(records) != len(raws):  # Parsed across records
+                    records = [next(self.reader([raw]), []) for raw in raws]
+                rows = []
+                for idx, record in zip(todo, records):
+                    if len(record) != width:
+                        self.mismatched(line + idx, record, width)
+                    rows.append(build(record))
+                return rows
+
+            line = 0
+            for batch in itertools.chain([batch[1:]], batches):
+                digests = row_hashes(batch)
+                matches = aligner.align(digests)
+                todo = [idx for idx, match in enumerate(matches)
+                        if match is None or match in previous.failed]
+                changed += len(todo)
+                rows = dict(zip(todo, parse(line, batch, todo)))
+                failed, states = [], None
+                if not stateful:
+                    for idx in todo:
+                        if not self.validate_row(line + idx, rows[idx]):
+                            failed.append(idx)
+                else:
+                    # Unchanged rows replay their stored values, in order
+                    states = []
+                    for idx, match in enumerate(matches):
+                        row = rows.get(idx)
+                        if row is not None:
+                            if not self.validate_row(line + idx, row):
+                                failed.append(idx)
+                            state = tuple(row[name] for name in columns)
+                        else:
+                            state = aligner.state(match)
+                            self.replay_row(line + idx, stateful,
+                                            dict(zip(columns, state)))
+                        states.append(state)
+                writer.extend(digests, failed, states)
+                line += len(batch)
+            self.rows = line
+            writer.commit()
+            writer = None
+        finally:
+            close_stream(stream)
+            if previous is not None:
+                previous.close()
+            if writer is not None:
+                writer.abort()
+
+        self.logger.log("Validated {} changed row(s) of {}".format(
+            changed, self.rows))
+        return self.finish()
+
+    def replay_row(self, line, stateful, row):
+        """ Runs stateful validators on the stored values of a row """
+        for field_name, validator in stateful:
+            field = row[field_name]
+            try:
+                validator.validate(field, row=row)
+            except ValidationException as exc:
+                self.failures.add(field_name, line, exc, validator, field)
+                validator.failure_count += 1
+
+    def sample(self, size=None, rate=None, seed=0, confidence=0.95):
+        """
+        Validates a reproducible random sample of rows.
+
+        Exactly one of ``size`` (number of rows) or ``rate`` (fraction of
+        rows) must be given. Seekable loaders are sampled by seeking to
+        random byte offsets, so only the sampled lines are read; other
+        loaders are read once, using reservoir sampling for ``size`` and
+        Bernoulli sampling for ``rate``. Samples of ``size`` hold that many
+        distinct rows, or every row of smaller sources. Rows of seek samples
+        are keyed in ``failures`` by byte offset instead of row number, and
+        multi-line quoted fields are not supported by seek sampling.
+
+        :returns: ``SampleResult`` with an ``Estimate`` of the failure rate
+            and its Wilson confidence interval per field (``validator`` is
+            ``None``) and per validator
+        """
+        if (size is None) == (rate is None):
+            raise ValidationConfigurationException(
+                'Exactly one of size or rate must be given')
+        self.logger.log("\nSampling {}(source={})".format(
+            self.__class__.__name__, self.source))
+        self.resolve_dialect()
+        rng = random.Random(seed)
+
+        initial = {
+            field_name: [validator.failure_count for validator in validators]
+            for field_name, validators in six.iteritems(self.validators)
+        }
+        stream = None
+        try:
+            if self.source.seekable:
+                rows = self._seek_sample(rng, size, rate)
+            else:
+                stream = self.source.stream()
+                reader = self.reader(stream)
+                fieldnames = self.read_headers(reader)
+                if not self.check_headers(fieldnames):
+                    rows = None
+                else:
+                    rows = (row for _, row in
+                            self.iterrows(reader, fieldnames))
+                    rows = reservoir_sample(rows, size, rng) \
+                        if size is not None \
+                        else bernoulli_sample(rows, rate, rng)
+            if rows is None:
+                return SampleResult(0, [], self.log)
+
+            for line, row in rows:
+                self.validate_row(line, row)
+                self.rows += 1
+        finally:
+            close_stream(stream)
+
+        estimates = []
+        for field_name in sorted(self.validators):
+            counts = [(None, self.failures.line_count(field_name))] + [
+                (validator.__class__.__name__, validator.failure_count - count)
+                for validator, count in zip(self.validators[field_name],
+                                            initial[field_name])
+            ]
+            for name, failures in counts:
+                rate, low, high = wilson_interval(failures, self.rows,
+                                                  confidence)
+                estimates.append(Estimate(field_name, name, failures,
+                                          self.rows, rate, low, high))
+
+        self.logger.log("Sampled {} row(s)".format(self.rows))
+        for estimate in estimates:
+            self.logger.log(
+                "  {}{}: {:.4%} [{:.4%}, {:.4%}] ({}/{})".format(
+                    estimate.field,
+                    ' ' + estimate.validator if estimate.validator else '',
+                    estimate.rate, estimate.low, estimate.high,
+                    estimate.failures, estimate.sampled))
+        return SampleResult(self.rows, estimates, self.log)
+
+    def _seek_sample(self, rng, size, rate):
+        lines = self.source.readlines_at([0, 1])
+        if not lines:
+            self.check_headers(None)
+            return None
+        fieldnames = self.read_headers(self.reader([lines[0][1]]))
+        if not self.check_headers(fieldnames):
+            return None
+        if len(lines) < 2:
+            return []
+
+        header_end = lines[1][0]
+        stop = self.source.size()
+        if size is None:
+            # Estimate the row count from the mean length of probed lines
+            probes = self.source.readlines_at(
+                offset_sample(header_end, stop, SAMPLE_PROBE_LINES, rng))
+            mean = sum(len(line) for _, line in probes) / \
+                float(max(len(probes), 1))
+            size = int(math.ceil(rate * (stop - header_end) / max(mean, 1)))
+
+        lines = dict(self._seek_lines(header_end, stop, size, rng))
+        if rate is None:
+            # Offsets resolving to the same line leave rows missing: draw
+            # again, and choose from a scan of the file once draws collide
+            # more than they find new rows
+            while len(lines) < size:
+                missing = size - len(lines)
+                found = [(position, line) for position, line in
+                         self._seek_lines(header_end, stop, missing, rng)
+                         if position not in lines]
+                lines.update(found)
+                if 2 * len(found) < missing:
+                    break
+            if len(lines) < size:
+                rest = ((position, line) for position, line in
+                        self._scan_lines(header_end)
+                        if position not in lines)
+                lines.update(item for _, item in reservoir_sample(
+                    rest, size - len(lines), rng))
+
+        positions = sorted(lines)
+        rows = self.iterrows(self.reader([lines[position]
+                                          for position in positions]),
+                             fieldnames)
+        return [(position, row) for position, (_, row) in zip(positions, rows)]
+
+    def _seek_lines(self, start, stop, size, rng):
+        """ Reads the non-blank lines at ``size`` random offsets """
+        return [(position, line) for position, line in
+                self.source.readlines_at(offset_sample(start, stop, size, rng))
+                if line.strip()]
+
+    def _scan_lines(self, start):
+        """ Yields ``(position, line)`` tuples of the non-blank lines """
+        stream = self.source.stream_at(start)
+        try:
+            position = stream.position
+            for line in stream:
+                if line.strip():
+                    yield position, line
+                position = stream.position
+        finally:
+            stream.close()
+
+    def finish(self):
+        """ Logs validation failures and returns the validation outcome """
+        self.failures.flush()
+        if self.progress is not None:
+            self.logger.log(
+                "Stopped after {} row(s), {} byte(s), {:.3f}s: {}".format(
+                    *self.progress))
+        mismatched = self.auto_dialect and self.width_mismatches
+        if mismatched:
+            self.logger.log(
+                "{} record(s) have a different number of fields than the "
+                "header, first on line {}; the source does not match "
+                "delimiter {!r}".format(self.width_mismatches,
+                                        self.first_width_mismatch,
+                                        str(self.delimiter)))
+            if self.dialect_cache is not None:
+                self.dialect_cache.discard(self.dialect_key())
         if self.failures:
             self.logger.log("Failed validation\n")
             log_failures(self.failures, self.source, self.logger)
             log_validator_failures(self.validators, self.logger)
             return False
+        elif mismatched:
+            self.logger.log("Failed validation\n")
+            return False
+        elif self.progress is not None:
+            self.logger.log("Incomplete validation\n")
+            return None
         else:
             self.logger.log("Successful validation\n")
             return True
 
 
+def shares_conversion(validators):
+    """ Checks whether validators convert fields with the same callable """
+    conversions = [conversion_of(validator) for validator in validators
+                   if conversion_of(validator) is not None]
+    return len(conversions) != len(set(conversions))
+
+
+def conversion_of(validator):
+    """
+    Returns the ``conversion`` of a validator, or ``None`` if it overrides
+    ``validate`` and so must validate fields itself
+    """
+    if six.get_unbound_function(type(validator).validate) is not \
+            six.get_unbound_function(BaseTypeValidator.validate):
+        return None
+    return validator.conversion
+
+
+def conversion_plan(validators):
+    """
+    Returns ``(validator, conversion, check)`` tuples of validators, where
+    ``check`` is ``None`` if the validator only converts fields
+    """
+    noop = six.get_unbound_function(BaseTypeValidator.check)
+    plan = []
+    for validator in validators:
+        conversion = conversion_of(validator)
+        plan.append((validator, conversion,
+                     None if conversion is None or six.get_unbound_function(
+                         type(validator).check) is noop
+                     else validator.check))
+    return plan
+
+
+def context_of(validator, fieldnames):
+    """ Returns the columns a validator reads from rows """
+    if validator.context_fields is None:
+        return fieldnames
+    return validator.context_fields
+
+
+def column_getter(positions):
+    """ Returns a callable extracting a tuple of columns from a record """
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda record: (record[position],)
+    elif not positions:
+        return lambda record: ()
+    return operator.itemgetter(*positions)
+
+
+def unique_items(items):
+    """ Yields items in order, skipping repeats """
+    seen = set([])
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def close_stream(stream):
+    """ Closes a loader stream if it holds resources """
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        close()
+
+
 def log_failures(failures, source, logger):
-    for field_name, field_failure in six.iteritems(failures):
-        logger.log("\nFailure on field: \"{}\":".format(field_name))
-        for i, (row, errors) in enumerate(six.iteritems(field_failure)):
-            logger.log("  {}:{}".format(source, row))
-            for error in errors:
-                logger.log("    {}".format(error))
+    """
+    Logs failures by field and line, up to the ``log_limit`` lines of each
+    field of the failure store
+    """
+    limit = getattr(failures, 'log_limit', None)
+    rows = failures.iterfailures() if limit is None \
+        else failures.iterfailures(lines_per_field=limit)
+    current = None
+    for field_name, row, errors in rows:
+        if field_name != current:
+            if current is not None and limit is not None:
+                log_suppressed(failures, current, limit, logger)
+            logger.log("\nFailure on field: \"{}\":".format(field_name))
+            current = field_name
+        logger.log("  {}:{}".format(source, row))
+        for error in errors:
+            logger.log("    {}".format(error))
+    if current is not None and limit is not None:
+        log_suppressed(failures, current, limit, logger)
+
+
+def log_suppressed(failures, field_name, limit, logger):
+    count = failures.line_count(field_name)
+    if count > limit:
+        logger.log("  ({} more line(s) with failures in {!r})".format(
+            count - limit, failures))
 
 
 def log_validator_failures(validators, logger):
     for field_name, validators_list in six.iteritems(validators):
         for validator in validators_list:
-            if validator.fails():
+            fails = validator.fails()
+            if fails:
                 logger.log(
                     "  {} failed {} time(s) on field: '{}'".format(
                         validator.__class__.__name__, validator.failure_count,
                         field_name))
-                invalid = list(validator.fails())
-                display = ["'{}'".format(field)
-                           for field in invalid[:DEFAULT_DISPLAY_LIMIT]]
-                hidden = len(invalid[DEFAULT_DISPLAY_LIMIT:])
+                if hasattr(fails, 'most_common'):
+                    common = fails.most_common(DEFAULT_DISPLAY_LIMIT)
+                    display = ["'{}' ({})".format(display_value(field), count)
+                               for field, count in common]
+                    distinct = "    (~{} distinct invalid fields)"
+                else:
+                    display = ["'{}'".format(display_value(field))
+                               for field in itertools.islice(
+                                   fails, DEFAULT_DISPLAY_LIMIT)]
+                    distinct = None
                 logger.log(
                     "    Invalid fields: [{}]".format(", ".join(display)))
-                if hidden:
-                    logger.log(
-                        "    ({} more suppressed)".format(hidden))
+                if distinct:
+                    logger.log(distinct.format(len(fails)))
+                elif len(fails) > len(display):
+                    logger.log("    ({} more suppressed)".format(
+                        len(fails) - len(display)))
+
+
+def display_value(value):
+    """ Decodes bytes values, including inside key tuples, for reports """
+    if isinstance(value, tuple):
+        return tuple(to_text(item) for item in value)
+    return to_text(value)
 
 
 def log_missing(missing_items, logger):
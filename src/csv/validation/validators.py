@@ -4,9 +4,17 @@
 
 
 import re
+import copy
+import datetime
 
 
+import six
+
+
+from compat import DEFAULT_ENCODING, to_text, to_bytes
 from exceptions import ValidationException, ValidationConfigurationException
+from references import ReferenceIndex
+from sketches import BoundedValueTracker, DEFAULT_PRECISION
 
 
 __all__ = (
@@ -16,22 +24,129 @@ __all__ = (
     'IntVal',
     'FloatVal',
     'BoolVal',
+    'RangeVal',
 
     'EnumVal',
     'UniqueVal',
     'RegexVal',
     'EmptyVal',
     'AnyVal',
+    'ForeignKeyVal',
+    'DateTimeVal',
 )
 
 
 FAILURE_COUNT_INITIALIZE = 0
+EMPTY_VALUES = frozenset(['', b''])
+DATETIME_CACHE_SIZE = 10000
+FIXED_WIDTH_DIRECTIVES = {
+    'Y': ('year', 4),
+    'y': ('year', 2),
+    'm': ('month', 2),
+    'd': ('day', 2),
+    'H': ('hour', 2),
+    'M': ('minute', 2),
+    'S': ('second', 2),
+}
+DATETIME_COMPONENTS = (
+    ('year', 1900), ('month', 1), ('day', 1), ('hour', 0), ('minute', 0),
+    ('second', 0),
+)
+ISO_FORMAT = r'%Y-%m-%d(.%H:%M(:%S)?)?\Z'
+
+
+def text_cast_error(cast, field, exc):
+    """ Recreates the cast error of a bytes field from its decoded text """
+    text = to_text(field)
+    if text is not field:
+        try:
+            cast(text)
+        except ValueError as text_exc:
+            return text_exc
+    return exc
+
+
+def describe(value):
+    """ Returns a repr of configuration that does not vary between runs """
+    if isinstance(value, (set, frozenset)):
+        return '{{{}}}'.format(', '.join(sorted(map(describe, value))))
+    if isinstance(value, dict):
+        return '{{{}}}'.format(', '.join(sorted(
+            '{}: {}'.format(describe(key), describe(item))
+            for key, item in six.iteritems(value))))
+    if isinstance(value, (list, tuple)):
+        return '[{}]'.format(', '.join(map(describe, value)))
+    if hasattr(value, 'pattern') and hasattr(value, 'match'):
+        return 're.compile({!r})'.format(value.pattern)
+    if callable(value):
+        return getattr(value, '__name__', value.__class__.__name__)
+    if hasattr(value, '__dict__'):
+        return '{}({})'.format(value.__class__.__name__, describe(
+            {name: item for name, item in six.iteritems(vars(value))
+             if not name.startswith('_')}))
+    return repr(value)
+
+
+def fixed_width_parser(format):
+    """
+    Compiles a ``strptime`` format of fixed-width fields into a parser.
+
+    Formats made of zero-padded numeric directives (``%Y``, ``%y``, ``%m``,
+    ``%d``, ``%H``, ``%M``, ``%S``) and literal text are matched with a
+    regular expression; ISO 8601 layouts are then converted by
+    ``datetime.fromisoformat`` where available. Returns ``None`` for other
+    formats.
+
+    :returns: Function parsing text into a ``datetime``, raising
+        ``ValueError`` for text that does not match the format
+    """
+    pattern, names = [], []
+    for directive, literal in re.findall(r'%(.)|([^%]+)', format):
+        if literal or directive == '%':
+            pattern.append(re.escape(literal or '%'))
+        elif directive in FIXED_WIDTH_DIRECTIVES and \
+                FIXED_WIDTH_DIRECTIVES[directive][0] not in names:
+            name, width = FIXED_WIDTH_DIRECTIVES[directive]
+            pattern.append('([0-9]{%d})' % width)
+            names.append(name)
+        else:
+            return None
+    match = re.compile(''.join(pattern) + r'\Z').match
+    iso = re.match(ISO_FORMAT, format) is not None and \
+        hasattr(datetime.datetime, 'fromisoformat')
+    short_year = '%y' in format
+    order = [(names.index(component) if component in names else None,
+              default)
+             for component, default in DATETIME_COMPONENTS]
+
+    def parse(text):
+        matched = match(text)
+        if matched is None:
+            raise ValueError('does not match')
+        if iso:
+            return datetime.datetime.fromisoformat(text)
+        groups = matched.groups()
+        values = [default if idx is None else int(groups[idx])
+                  for idx, default in order]
+        if short_year:  # As strptime: 69-99 are 1969-1999, 0-68 2000-2068
+            values[0] += 1900 if values[0] >= 69 else 2000
+        return datetime.datetime(*values)
+
+    return parse
 
 
 class BaseValidator(object):
     """ Base class for validators """
 
     failure_count = FAILURE_COUNT_INITIALIZE
+    context_fields = None  # Columns read from ``row``, ``None`` for any
+    stateful = False  # Outcome depends on other rows or external data
+    sees_every_value = False  # Runs after failures, e.g. to track values
+    run_state = ('failure_count',)  # Counters left out of ``configuration``
+    cost = 1  # Relative cost per field, to order ``short_circuit`` runs
+    conversion = None  # Callable converting fields for ``check``
+    top_k = None  # Track all failed values unless bounded
+    distinct_precision = DEFAULT_PRECISION
 
     def validate(self, field, row):
         """
@@ -51,25 +166,156 @@ class BaseValidator(object):
 
         raise NotImplementedError("%s.validate()" % self.__class__.__name__)
 
+    def reset(self):
+        """
+        Clear the run state (failure count and failed fields).
+
+        Implementations holding more state must extend this method,
+        replacing state containers rather than clearing them in place.
+        """
+
+        self.failure_count = FAILURE_COUNT_INITIALIZE
+
+    def configuration(self):
+        """
+        Return a repr of the configuration of the validator.
+
+        Run state, i.e. the ``run_state`` counters and the containers
+        ``reset`` replaces, and private attributes are left out, so the repr
+        only changes with the arguments of the validator.
+        """
+
+        state = getattr(self, '__getstate__', lambda: None)()
+        if state is None:
+            state = vars(self)
+        fresh = copy.copy(self)
+        fresh.reset()
+        run_state = set(name for name, value in six.iteritems(vars(fresh))
+                        if value is not state.get(name, value))
+        run_state.update(self.run_state)
+        return describe({name: value for name, value in six.iteritems(state)
+                         if name not in run_state and
+                         not name.startswith('_')})
+
+    def value_set(self):
+        """
+        Return an empty container for failed fields.
+
+        This is a set, or a fixed-memory ``BoundedValueTracker`` keeping the
+        ``top_k`` most frequent values once the validator is ``bound``.
+        """
+
+        if self.top_k is None:
+            return set([])
+        return BoundedValueTracker(self.top_k, self.distinct_precision)
+
+    def bound(self, top_k, precision=DEFAULT_PRECISION):
+        """
+        Bound the memory used to track failed fields, resetting run state.
+        """
+
+        self.top_k = top_k
+        self.distinct_precision = precision
+        self.reset()
+
+    def spawn(self):
+        """
+        Return a copy sharing configuration but with fresh run state.
+
+        Configuration such as compiled patterns and enumeration sets is
+        shared with the copy, so spawning is much cheaper than construction.
+        """
+
+        instance = copy.copy(self)
+        instance.reset()
+        return instance
+
+    def serialize(self):
+        """
+        Return the validator's run state as JSON-friendly data.
+
+        The state may be combined with the state of other instances of the
+        same validator using ``merge``, e.g. when shards of a file were
+        validated by separate processes.
+        """
+
+        fails = self.fails()
+        if isinstance(fails, BoundedValueTracker):
+            dumped = fails.serialize(self.dump_value)
+        else:
+            dumped = [self.dump_value(value) for value in fails or []]
+        return {
+            'failure_count': self.failure_count,
+            'fails': dumped,
+        }
+
+    def merge(self, state):
+        """
+        Merge serialized state from another instance into this instance.
+        """
+
+        self.failure_count += state['failure_count']
+        fails = self.fails()
+        if isinstance(state['fails'], dict):
+            fails.merge(state['fails'], self.load_value)
+        elif fails is not None:
+            fails.update(self.load_value(value) for value in state['fails'])
+
+    def dump_value(self, value):
+        return value
+
+    def load_value(self, value):
+        return value
+
 
 class BaseTypeValidator(BaseValidator):
-    """ Base class for type validators """
+    """
+    Base class for type validators
+
+    Fields are converted with ``cast`` and the value is passed to ``check``.
+    Validators of a column with the same ``cast`` share its conversion of
+    each field during validation, unless they override ``validate``, and a
+    field that fails to convert is reported by the first of them only.
+    """
+
+    context_fields = ()
+    cost = 2
 
     def __init__(self):
         super(BaseTypeValidator, self).__init__()
-        self.invalid_set = set([])
+        self.invalid_set = self.value_set()
+
+    @property
+    def conversion(self):
+        return self.cast
 
     def validate(self, field, row={}):
-        try:
-            if (field or not self.empty_ok):
-                self.cast(field)
-        except ValueError as exc:
-            self.invalid_set.add(field)
-            raise ValidationException(exc)
+        if self.converts(field):
+            try:
+                value = self.cast(field)
+            except ValueError as exc:
+                raise self.conversion_failed(field, exc)
+            self.check(value, field, row)
+
+    def converts(self, field):
+        """ Checks that a field is converted, as it is not an allowed empty """
+        return bool(field) or not self.empty_ok
+
+    def conversion_failed(self, field, exc):
+        """ Records a field that failed to convert, returning the error """
+        self.invalid_set.add(field)
+        return ValidationException(text_cast_error(self.cast, field, exc))
+
+    def check(self, value, field, row={}):
+        """ Validates the converted value of a field """
 
     def fails(self):
         return self.invalid_set
 
+    def reset(self):
+        super(BaseTypeValidator, self).reset()
+        self.invalid_set = self.value_set()
+
 
 class IntVal(BaseTypeValidator):
 
@@ -95,35 +341,100 @@ class BoolVal(BaseTypeValidator):
         self.cast = bool
 
 
+class RangeVal(BaseTypeValidator):
+    """
+    Validates field is a number between bounds (inclusive)
+
+    ``cast`` converts fields to numbers, sharing the conversion with an
+    ``IntVal`` or ``FloatVal`` of the same column.
+    """
+
+    def __init__(self, min_value=None, max_value=None, cast=float,
+                 empty_ok=False):
+        super(RangeVal, self).__init__()
+        self.min_value = min_value
+        self.max_value = max_value
+        self.cast = cast
+        self.empty_ok = empty_ok
+
+    def check(self, value, field, row={}):
+        if self.min_value is not None and value < self.min_value:
+            self.invalid_set.add(field)
+            raise ValidationException("'{}' is less than {}".format(
+                to_text(field), self.min_value))
+        if self.max_value is not None and value > self.max_value:
+            self.invalid_set.add(field)
+            raise ValidationException("'{}' is greater than {}".format(
+                to_text(field), self.max_value))
+
+
 class EnumVal(BaseValidator):
     """ Validates a field against an enumerated list """
 
+    context_fields = ()
+
     def __init__(self, enum_list=[], empty_ok=False):
         super(EnumVal, self).__init__()
         self.empty_ok = empty_ok
-        self.enum_set = set(enum_list)  # Make enumerations unique
-        self.invalid_enum_set = set([])
-        if empty_ok:
+        self.enum_list = list(enum_list)
+        self.invalid_enum_set = self.value_set()
+        self.build_sets()
+
+    def build_sets(self):
+        self.enum_set = set(self.enum_list)  # Make enumerations unique
+        if self.empty_ok:
             self.enum_set.add('')
+        # Accept bytes fields from binary loaders with a single lookup
+        self.enum_bytes_set = frozenset(to_bytes(enum)
+                                        for enum in self.enum_set)
+        self.enum_lookup = self.enum_set | self.enum_bytes_set
+
+    def __getstate__(self):
+        """ Pickles the configuration; the sets are built again """
+        state = dict(self.__dict__)
+        for name in ('enum_set', 'enum_bytes_set', 'enum_lookup'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        # Built in the same order, the sets list values in the same order
+        self.__dict__.update(state)
+        self.build_sets()
+
+    def __copy__(self):
+        """ Returns a copy sharing the sets """
+        instance = self.__class__.__new__(self.__class__)
+        instance.__dict__.update(self.__dict__)
+        return instance
 
     def validate(self, field, row={}):
-        if field not in self.enum_set:
+        if field not in self.enum_lookup:
             self.invalid_enum_set.add(field)
             raise ValidationException(
-                "'{}' is not in {}".format(field, self.enum_set))
+                "'{}' is not in {}".format(to_text(field), self.enum_set))
 
     def fails(self):
         return self.invalid_enum_set
 
+    def reset(self):
+        super(EnumVal, self).reset()
+        self.invalid_enum_set = self.value_set()
+
 
 class UniqueVal(BaseValidator):
     """ Validates uniqueness in a column """
 
+    stateful = True
+    sees_every_value = True
+    run_state = BaseValidator.run_state + ('rows_seen',)
+    cost = 2
+
     def __init__(self, unique_list=[]):
         super(UniqueVal, self).__init__()
         self.unique_set = set(unique_list)  # Make list unique
-        self.duplicates = set([])
-        self.unique_values = set([])
+        self.duplicates = self.value_set()
+        self.unique_values = {}  # Key to the row it was first seen in
+        self.rows_seen = 0
 
     def validate(self, field, row={}):
         if self.unique_set:
@@ -132,64 +443,280 @@ class UniqueVal(BaseValidator):
                 raise ValidationConfigurationException(extra)
 
         key = tuple([field] + [row[k] for k in self.unique_set])
+        self.rows_seen += 1
         if key not in self.unique_values:
-            self.unique_values.add(key)
+            self.unique_values[key] = self.rows_seen - 1
         else:
             self.duplicates.add(key)
             if self.unique_set:
                 raise ValidationException(
                     "'{}' is already in the column (unique with: {})".format(
-                        field, key[1:]))
+                        to_text(field), tuple(to_text(k) for k in key[1:])))
             else:
                 raise ValidationException(
-                    "'{}' is already in the column".format(field))
+                    "'{}' is already in the column".format(to_text(field)))
 
     def fails(self):
         return self.duplicates
 
+    def reset(self):
+        super(UniqueVal, self).reset()
+        self.duplicates = self.value_set()
+        self.unique_values = {}
+        self.rows_seen = 0
+
+    @property
+    def context_fields(self):
+        return self.unique_set
+
+    def serialize(self):
+        state = super(UniqueVal, self).serialize()
+        state['unique_values'] = [
+            [self.dump_value(key), row]
+            for key, row in six.iteritems(self.unique_values)]
+        state['rows_seen'] = self.rows_seen
+        return state
+
+    def merge(self, state):
+        """
+        Merge serialized state of the rows following the rows of this
+        instance, returning the keys duplicated across instances, mapped to
+        the row of their first occurrence in ``state``.
+        """
+
+        super(UniqueVal, self).merge(state)
+        shared = {}
+        for key, row in state['unique_values']:
+            key = self.load_value(key)
+            if key in self.unique_values:
+                shared[key] = row
+            else:
+                self.unique_values[key] = self.rows_seen + row
+        self.duplicates.update(shared)
+        self.rows_seen += state['rows_seen']
+        self.failure_count += len(shared)
+        return shared
+
+    def dump_value(self, value):
+        return list(value)
+
+    def load_value(self, value):
+        return tuple(value)
+
 
 class RegexVal(BaseValidator):
     """ Validates field against a regular expression """
 
+    context_fields = ()
+    cost = 4
+
     def __init__(self, pattern=r'$a', empty_ok=False):
         super(RegexVal, self).__init__()
-        self.regex = re.compile(pattern)
+        self.regex = re.compile(to_text(pattern))
         self.empty_ok = empty_ok
-        self.regex_failures = set([])
+        self.regex_failures = self.value_set()
+        self._bytes_regex = None
+
+    @property
+    def bytes_regex(self):
+        """ The pattern compiled for bytes fields, using bytes semantics """
+        if self._bytes_regex is None:
+            self._bytes_regex = re.compile(to_bytes(self.regex.pattern),
+                                           self.regex.flags & ~re.UNICODE)
+        return self._bytes_regex
 
     def validate(self, field, row={}):
-        if (field or not self.empty_ok) and not self.regex.match(field):
+        regex = self.bytes_regex if isinstance(field, six.binary_type) \
+            else self.regex
+        if (field or not self.empty_ok) and not regex.match(field):
             self.regex_failures.add(field)
             raise ValidationException(
-                "'{}' does not match pattern /{}/".format(field,
+                "'{}' does not match pattern /{}/".format(to_text(field),
                                                           self.regex.pattern))
 
     def fails(self):
         return self.regex_failures
 
+    def reset(self):
+        super(RegexVal, self).reset()
+        self.regex_failures = self.value_set()
+
 
 class EmptyVal(BaseValidator):
     """ Validates field is always empty """
 
+    context_fields = ()
+
     def __init__(self):
         super(EmptyVal, self).__init__()
-        self.nonempty_values = set([])
+        self.nonempty_values = self.value_set()
 
     def validate(self, field, row={}):
-        if field != '':
+        if field not in EMPTY_VALUES:
             self.nonempty_values.add(field)
             raise ValidationException(
-                "'{}' is not an empty string".format(field))
+                "'{}' is not an empty string".format(to_text(field)))
 
     def fails(self):
         return self.nonempty_values
 
+    def reset(self):
+        super(EmptyVal, self).reset()
+        self.nonempty_values = self.value_set()
+
 
 class AnyVal(BaseValidator):
     """ Ignores validating a field """
 
+    context_fields = ()
+    cost = 0
+
     def validate(self, field, row={}):
         pass
 
     def fails(self):
         pass
+
+
+class ForeignKeyVal(BaseValidator):
+    """
+    Validates field exists in a column of a reference CSV file
+
+    Lookups use a persistent on-disk ``ReferenceIndex`` that is built on
+    first use and rebuilt when the reference file changes.
+    """
+
+    context_fields = ()
+    stateful = True
+    cost = 8
+
+    def __init__(self, reference, column, index_path=None, delimiter=',',
+                 empty_ok=False, encoding=DEFAULT_ENCODING):
+        super(ForeignKeyVal, self).__init__()
+        self.index = ReferenceIndex(reference, column, index_path=index_path,
+                                    delimiter=delimiter, encoding=encoding)
+        self.empty_ok = empty_ok
+        self.missing_keys = self.value_set()
+
+    def validate(self, field, row={}):
+        if (field or not self.empty_ok) and to_text(field) not in self.index:
+            self.missing_keys.add(field)
+            raise ValidationException(
+                "'{}' is not in {}".format(to_text(field), self.index))
+
+    def fails(self):
+        return self.missing_keys
+
+    def reset(self):
+        super(ForeignKeyVal, self).reset()
+        self.missing_keys = self.value_set()
+
+    def spawn(self):
+        instance = super(ForeignKeyVal, self).spawn()
+        instance.index = copy.copy(self.index)  # Connections are not shared
+        return instance
+
+
+class DateTimeVal(BaseValidator):
+    """
+    Validates field is a date or time in a ``strptime`` format
+
+    Fixed-width numeric formats, such as ``%Y-%m-%d`` and
+    ``%Y-%m-%dT%H:%M:%S``, are compiled into a specialized parser (see
+    ``fixed_width_parser``); other formats fall back to
+    ``datetime.strptime``. Outcomes of
+    the first distinct values are cached (values such as dates repeat a
+    lot), in a cache shared by spawned copies.
+
+    ``min_value`` and ``max_value`` bound valid values (inclusive) and may be
+    ``datetime`` or ``date`` objects or text in the format.
+    """
+
+    context_fields = ()
+    cost = 4
+
+    def __init__(self, format='%Y-%m-%d', min_value=None, max_value=None,
+                 empty_ok=False):
+        super(DateTimeVal, self).__init__()
+        self.format = format
+        self.empty_ok = empty_ok
+        self.parser = fixed_width_parser(format) or self.strptime
+        self.min_value = self.bound_value(min_value)
+        self.max_value = self.bound_value(max_value)
+        self.cache = {}
+        self.invalid_dates = self.value_set()
+
+    def strptime(self, text):
+        return datetime.datetime.strptime(text, self.format)
+
+    def __getstate__(self):
+        """ Pickles the configuration; the parser is compiled again """
+        state = dict(self.__dict__)
+        del state['parser']
+        state['cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parser = fixed_width_parser(self.format) or self.strptime
+
+    def __copy__(self):
+        """ Returns a copy sharing the parser and cache """
+        instance = self.__class__.__new__(self.__class__)
+        instance.__dict__.update(self.__dict__)
+        return instance
+
+    def bound_value(self, value):
+        if value is None or isinstance(value, datetime.datetime):
+            return value
+        if isinstance(value, datetime.date):
+            return datetime.datetime(value.year, value.month, value.day)
+        return self.parser(to_text(value))
+
+    def parse(self, field):
+        """
+        Returns the ``datetime`` of a field, or the reason it is invalid.
+        """
+        try:
+            value = self.parser(to_text(field))
+        except ValueError as exc:
+            return "'{}' does not match format '{}' ({})".format(
+                to_text(field), self.format, exc)
+        if self.min_value is not None and value < self.min_value:
+            return "'{}' is before {}".format(to_text(field), self.min_value)
+        if self.max_value is not None and value > self.max_value:
+            return "'{}' is after {}".format(to_text(field), self.max_value)
+        return value
+
+    def parse_batch(self, fields):
+        """
+        Returns the ``datetime`` of each field, or ``None`` where invalid.
+
+        Each distinct value is parsed once.
+        """
+        parsed = {field: self.cached(field) for field in set(fields)}
+        return [value if isinstance(value, datetime.datetime) else None
+                for value in (parsed[field] for field in fields)]
+
+    def cached(self, field):
+        outcome = self.cache.get(field)
+        if outcome is None:
+            outcome = self.parse(field)
+            if len(self.cache) < DATETIME_CACHE_SIZE:
+                self.cache[field] = outcome
+        return outcome
+
+    def validate(self, field, row={}):
+        if self.empty_ok and field in EMPTY_VALUES:
+            return
+        outcome = self.cached(field)
+        if outcome.__class__ is not datetime.datetime:
+            self.invalid_dates.add(field)
+            raise ValidationException(outcome)
+
+    def fails(self):
+        return self.invalid_dates
+
+    def reset(self):
+        super(DateTimeVal, self).reset()
+        self.invalid_dates = self.value_set()
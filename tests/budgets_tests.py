@@ -0,0 +1,91 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation.budgets import Budget, current_rss
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import IntVal, AnyVal
+from csv.validation.loaders import LocalFileLoader
+
+
+ROWS = 5000
+
+
+class IdValidator(SimpleCSVFileValidator):
+    validators = {'id': [IntVal()], 'name': [AnyVal()]}
+
+
+def write(workdir, bad_row=None):
+    path = os.path.join(workdir, 'ids.csv')
+    with open(path, 'w') as f:
+        f.write('id,name\n')
+        for idx in range(ROWS):
+            f.write('{},name-{}\n'.format('x' if idx == bad_row else idx,
+                                          idx))
+    return path
+
+
+def test_validation_without_budget_is_complete():
+    workdir = tempfile.mkdtemp()
+    try:
+        result = IdValidator(LocalFileLoader(write(workdir)))()
+        validation, log = result
+        assert validation, log
+        assert result.complete and result.progress is None
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_input_budget_stops_validation():
+    class BudgetValidator(IdValidator):
+        budget = Budget(max_bytes=10000, check_every=100)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        instance = BudgetValidator(LocalFileLoader(write(workdir)))
+        result = instance()
+        assert result.validation is None, result.log
+        assert not result.complete
+        progress = result.progress
+        assert progress.reason == 'input budget of 10000 bytes exceeded'
+        assert 0 < progress.rows < ROWS and progress.rows % 100 == 0
+        assert 10000 < progress.bytes < 12000, progress
+        assert instance.rows == progress.rows
+        assert result.log[-2].startswith(
+            'Stopped after {} row(s), {} byte(s), '.format(
+                progress.rows, progress.bytes)), result.log
+        assert result.log[-1] == 'Incomplete validation\n'
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_budget_stops_with_failures_found():
+    class DeadlineValidator(IdValidator):
+        budget = Budget(deadline=0, check_every=10)
+
+    class MemoryValidator(IdValidator):
+        budget = Budget(max_memory=1, check_every=10)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir, bad_row=3)
+        result = DeadlineValidator(LocalFileLoader(path))()
+        assert not result.validation
+        assert result.progress.rows == 10, result.progress
+        assert result.progress.reason == 'deadline of 0s exceeded'
+
+        result = MemoryValidator(LocalFileLoader(path))()
+        assert result.progress.reason == \
+            'memory budget of 1 bytes exceeded', result.progress
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_current_rss():
+    assert current_rss() > 0
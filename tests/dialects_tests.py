@@ -0,0 +1,98 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation.dialects import Dialect, detect_dialect, DialectCache
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import IntVal, EnumVal
+from csv.validation.loaders import LocalFileLoader, BinaryFileLoader
+
+
+SEMICOLON_CSV = 'id;name\n1;"a;b"\n2;c\n3;d\n'
+
+
+class PartnerValidator(SimpleCSVFileValidator):
+    validators = {
+        'id': [IntVal()],
+        'name': [EnumVal(['a;b', 'c', 'd'])],
+    }
+    auto_dialect = True
+
+
+def write(workdir, name, content):
+    path = os.path.join(workdir, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def test_detect_dialect():
+    assert detect_dialect(SEMICOLON_CSV) == Dialect(';', '"')
+    assert detect_dialect(b'a|b|c\n1|2|3\n4|5|6\n7|') == Dialect('|', '"')
+    assert detect_dialect('a\tb\n1\t2\n3\t4\n').delimiter == '\t'
+    assert detect_dialect('') == Dialect(',', '"')
+    assert detect_dialect('single\ncolumn\nonly\n') == Dialect(',', '"')
+
+
+def test_validator_detects_dialect():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir, 'partner.csv', SEMICOLON_CSV)
+        validation, log = PartnerValidator(LocalFileLoader(path))()
+        assert validation, log
+        assert "Detected delimiter ';' and quote character '\"'" in log
+        validation, log = PartnerValidator(BinaryFileLoader(path))()
+        assert validation, log
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_dialect_cache_by_source_pattern():
+    workdir = tempfile.mkdtemp()
+    try:
+        cache_path = os.path.join(workdir, 'dialects.json')
+
+        class CachedValidator(PartnerValidator):
+            dialect_cache = DialectCache(cache_path, prefix_size=32)
+
+        first = write(workdir, 'feed-20160101.csv', SEMICOLON_CSV)
+        assert CachedValidator(LocalFileLoader(first))()[0]
+        key = os.path.join(workdir, 'feed-#.csv')
+        assert key in CachedValidator.dialect_cache
+        assert key in DialectCache(cache_path)  # Persisted
+
+        # Dialects loaded from the file parse as detected ones
+        class ReloadedValidator(PartnerValidator):
+            dialect_cache = DialectCache(cache_path)
+
+        validation, log = ReloadedValidator(LocalFileLoader(first))()
+        assert validation, log
+
+        # The next file reuses the dialect instead of detecting it, and
+        # records that do not match the dialect fail validation
+        second = write(workdir, 'feed-20160102.csv',
+                       'id;name\n1;c\n2,c\n3;d\n')
+        validation, log = CachedValidator(LocalFileLoader(second))()
+        assert not validation, log
+        assert "1 record(s) have a different number of fields than the " \
+            "header, first on line 1; the source does not match " \
+            "delimiter ';'" in log, log
+        assert key not in CachedValidator.dialect_cache
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_loader_head():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir, 'partner.csv', SEMICOLON_CSV)
+        assert LocalFileLoader(path).head(7) == 'id;name'
+        assert BinaryFileLoader(path).head(7) == b'id;name'
+    finally:
+        shutil.rmtree(workdir)
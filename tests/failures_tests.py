@@ -0,0 +1,156 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import functools
+
+
+from nose.tools import assert_raises
+from csv.validation.exceptions import (
+    ValidationException,
+    ValidationConfigurationException,
+)
+from csv.validation.failures import SQLiteFailureStore
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import (
+    EnumVal,
+    IntVal,
+    UniqueVal,
+    RegexVal,
+    EmptyVal,
+    AnyVal,
+)
+from csv.validation.loaders import LocalFileLoader
+
+
+BAD_VALIDATION_CSV_FILE = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.bad.validation.csv'
+)
+VALIDATORS = {
+    'unique': [UniqueVal()],
+    'enum': [EnumVal(['WORLD', 'world'])],
+    'int': [IntVal()],
+    'bool': [AnyVal()],
+    'float': [AnyVal()],
+    'empty': [EmptyVal()],
+    'any': [AnyVal()],
+    'regex': [RegexVal(r'^foobar$')],
+}
+
+
+def fill_store(store):
+    validator = IntVal()
+    for line in range(25):
+        for value in ('x', 'y', 'x') if line % 5 == 0 else ('x',):
+            store.add('int', line, ValidationException(value), validator,
+                      value)
+    store.add('enum', 3, ValidationException('z'), EnumVal(), 'z')
+
+
+def test_sqlite_failure_store_queries():
+    store = SQLiteFailureStore(batch_size=7)
+    fill_store(store)
+    assert len(store) == 36, len(store)
+    assert store.fields() == ['enum', 'int'], store.fields()
+    assert store.line_count('int') == 25, store.line_count('int')
+    assert store.top_values('int', limit=2) == [('x', 30), ('y', 5)]
+    records = store.row_range(3, 6)
+    assert [(r.field, r.line) for r in records] == [
+        ('int', 3), ('enum', 3), ('int', 4), ('int', 5), ('int', 5),
+        ('int', 5)], records
+    assert records[1].validator == 'EnumVal', records[1]
+    assert records[1].message == 'z', records[1]
+
+
+def test_sqlite_failure_store_pages_grouped_failures():
+    store = SQLiteFailureStore()
+    fill_store(store)
+    grouped = list(store.iterfailures(page_size=4))
+    assert len(grouped) == 26, grouped
+    assert grouped[0] == ('enum', 3, ['z']), grouped[0]
+    assert grouped[1] == ('int', 0, ['x', 'y', 'x']), grouped[1]
+
+    # Fields over the limit are skipped, across pages
+    for page_size in (2, 4, 100):
+        limited = list(store.iterfailures(page_size=page_size,
+                                          lines_per_field=3))
+        assert limited == grouped[:4], limited
+
+
+def test_sqlite_failure_stores_keep_other_runs():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'failures.db')
+
+        def runs():
+            connection = sqlite3.connect(path)
+            try:
+                return dict(connection.execute(
+                    'SELECT run, COUNT(*) FROM failures GROUP BY run'))
+            finally:
+                connection.close()
+
+        store = SQLiteFailureStore(path)
+        fill_store(store)
+        assert_raises(ValidationConfigurationException, SQLiteFailureStore,
+                      path)
+        store.close()
+
+        # Other runs keep the failures; the same run replaces them
+        other = SQLiteFailureStore(path)
+        assert len(other) == 0 and not other
+        other.add('enum', 1, ValidationException('z'), EnumVal(), 'z')
+        assert list(other.iterfailures()) == [('enum', 1, ['z'])]
+        other.close()
+        assert runs() == {store.run: 36, other.run: 1}
+        SQLiteFailureStore(path, run=store.run).close()
+        assert runs() == {other.run: 1}
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_validation_with_sqlite_failure_store():
+    class InMemoryValidator(SimpleCSVFileValidator):
+        validators = VALIDATORS
+
+    class SQLiteValidator(SimpleCSVFileValidator):
+        validators = VALIDATORS
+        failure_store = functools.partial(SQLiteFailureStore, batch_size=2)
+
+    expected = InMemoryValidator(LocalFileLoader(BAD_VALIDATION_CSV_FILE))()
+    instance = SQLiteValidator(LocalFileLoader(BAD_VALIDATION_CSV_FILE))
+    result = instance()
+    assert not result.validation and not expected.validation
+    assert sorted(result.log[1:]) == sorted(expected.log[1:]), result.log
+    assert instance.failures.top_values('regex') == [('notfoobar', 1)]
+
+
+def test_sqlite_failure_store_logs_limited_failures():
+    class SQLiteValidator(SimpleCSVFileValidator):
+        validators = {'int': [IntVal()], 'enum': [EnumVal(['a'])]}
+        failure_store = functools.partial(SQLiteFailureStore, log_limit=2)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'ints.csv')
+        with open(path, 'w') as f:
+            f.write('int,enum\n')
+            for idx in range(10):
+                f.write('{},{}\n'.format('x' if idx % 2 else idx,
+                                         'b' if idx == 3 else 'a'))
+        instance = SQLiteValidator(LocalFileLoader(path))
+        log = instance().log
+        lines = [msg.rsplit(':', 1)[1] for msg in log
+                 if msg.startswith('  LocalFileLoader')]
+        assert lines == ['3', '1', '3'], log
+        assert "  (3 more line(s) with failures in {!r})".format(
+            instance.failures) in log, log
+        assert instance.failures.line_count('int') == 5
+    finally:
+        shutil.rmtree(workdir)
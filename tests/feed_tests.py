@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import time
+import threading
+
+
+from nose.tools import assert_raises
+from csv.validation.exceptions import LoaderException
+from csv.validation.feed import FeedSession
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import (
+    AnyVal,
+    EmptyVal,
+    EnumVal,
+    IntVal,
+    UniqueVal,
+)
+from csv.validation.loaders import LocalFileLoader, BinaryFileLoader
+
+
+BAD_VALIDATION_CSV_FILE = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.bad.validation.csv'
+)
+
+
+class FeedValidator(SimpleCSVFileValidator):
+    validators = {
+        'unique': [UniqueVal()],
+        'enum': [EnumVal(['WORLD', 'world'])],
+        'int': [IntVal()],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [EmptyVal()],
+        'any': [AnyVal()],
+        'regex': [AnyVal()],
+    }
+
+
+def test_feed_session_matches_file_validation():
+    with open(BAD_VALIDATION_CSV_FILE, 'rb') as f:
+        data = f.read()
+    data = data.replace(b'I\'M NOT EMPTY!', b'NOT\r\nEMPTY')  # Quoted lines
+    for loader, size in ((LocalFileLoader, 7), (BinaryFileLoader, 1),
+                         (BinaryFileLoader, 1 << 20)):
+        expected = FeedValidator(loader(BAD_VALIDATION_CSV_FILE))()
+        session = FeedSession(FeedValidator, name=BAD_VALIDATION_CSV_FILE)
+        chunks = [data[idx:idx + size] for idx in range(0, len(data), size)]
+        for chunk in chunks:
+            session.feed(chunk if loader.binary else chunk.decode('utf-8'))
+        result = session.close()
+        assert not result.validation and not expected.validation
+        logs = [log.replace('NOT\r\nEMPTY', "I'M NOT EMPTY!")
+                .replace('FeedLoader', loader.__name__)
+                for log in result.log[1:]]
+        assert logs == expected.log[1:], result.log
+
+
+class GatedVal(AnyVal):
+    gate = threading.Event()
+
+    def validate(self, field, row={}):
+        self.gate.wait()
+
+
+class GatedValidator(SimpleCSVFileValidator):
+    validators = {'id': [GatedVal(), IntVal()]}
+
+
+def test_feed_session_applies_backpressure():
+    session = FeedSession(GatedValidator, buffer_size=32)
+    lines = [b'id\n'] + [b'%d\n' % idx for idx in range(100)]
+
+    def produce():
+        for line in lines:
+            session.feed(line)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    time.sleep(0.2)
+    assert producer.is_alive()  # Waits for the validator
+    assert session.buffer.size <= 32, session.buffer.size
+    GatedVal.gate.set()
+    producer.join()
+    result = session.close()
+    assert result.validation, result.log
+    assert session.validator.rows == 100
+
+
+def test_feed_session_discards_rows_after_header_failure():
+    session = FeedSession(FeedValidator, buffer_size=16)
+    session.feed(b'id,other\n')
+    for idx in range(1000):
+        session.feed(b'1,2\n')
+    result = session.close()
+    assert not result.validation
+    assert 'Missing validators for:' in result.log, result.log
+
+
+def test_feed_session_bounds_partial_lines():
+    class NoteValidator(SimpleCSVFileValidator):
+        validators = {'id': [IntVal()], 'note': [AnyVal()]}
+
+    session = FeedSession(NoteValidator, buffer_size=64)
+    session.feed('id,note\n1,')
+    for _ in range(10):  # A line fed in pieces, as long as the buffer
+        session.feed('x' * 6)
+    session.feed('\n2,y')
+    result = session.close()
+    assert result.validation, result.log
+    assert session.validator.rows == 2
+
+    session = FeedSession(NoteValidator, buffer_size=64)
+    session.feed(b'id,note\n1,')
+    for _ in range(10):
+        session.feed(b'x' * 6)
+    assert_raises(LoaderException, session.feed, b'x' * 6)
+    assert session.close().validation
@@ -0,0 +1,148 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation.budgets import Budget
+from csv.validation.exceptions import ValidationConfigurationException
+from csv.validation.incremental import iterraw, RowAligner
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import IntVal, UniqueVal, AnyVal, RangeVal
+from csv.validation.loaders import LocalFileLoader, BinaryFileLoader
+
+
+ROWS = 1000
+
+
+class FullValidator(SimpleCSVFileValidator):
+    validators = {'id': [UniqueVal()], 'int': [IntVal()],
+                  'note': [AnyVal()]}
+
+
+class IncrementalValidator(FullValidator):
+    incremental = True
+    incremental_window = 100
+
+
+def write(path, rows):
+    with open(path, 'w') as f:
+        f.write('id,int,note\n')
+        for row in rows:
+            f.write(','.join(row) + '\n')
+
+
+def version_one():
+    rows = [[str(idx), str(idx), 'n'] for idx in range(ROWS)]
+    rows[5][1] = 'x'
+    rows[7][2] = '"multi\nline"'
+    return rows
+
+
+def outcome(instance):
+    validation = instance.validate()
+    failures = [(name, line, [str(error) for error in errors])
+                for name, line, errors in instance.failures.iterfailures()]
+    return (validation, failures,
+            [(name, validator.failure_count)
+             for name in sorted(instance.validators)
+             for validator in instance.validators[name]])
+
+
+def test_iterraw():
+    lines = ['a,b\n', '\n', '"c\n', 'd",e\n', 'f,"g"\n']
+    assert list(iterraw(lines)) == ['a,b\n', '"c\nd",e\n', 'f,"g"\n']
+    assert list(iterraw([b'a;"b\n'], b';', b'"')) == [b'a;"b\n']
+
+
+def test_row_aligner():
+    blocks = [([digest], None) for digest in range(10)]
+    aligner = RowAligner(blocks, window=3)
+    matches = aligner.align([0, 1, 42, 3, 4, 9])
+    assert matches == [0, 1, None, 3, 4, None], matches
+
+    # The window grows past long deletions
+    aligner = RowAligner(blocks, window=2)
+    matches = aligner.align([0] + [9] * 10)
+    assert matches == [0] + [None] * 9 + [9], matches
+
+
+def test_incremental_validation_matches_full_runs():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'ids.csv')
+        rows = version_one()
+        write(path, rows)
+        for loader in (BinaryFileLoader, LocalFileLoader):
+            instance = IncrementalValidator(loader(path))
+            assert outcome(instance) == outcome(FullValidator(loader(path)))
+            assert 'Validated 1000 changed row(s) of 1000' in \
+                instance.logger.logs, instance.logger.logs
+
+        rows[10][1] = 'y'                           # Changed
+        rows.insert(100, ['500', '100', 'n'])       # Duplicate id
+        del rows[700]                               # Deleted
+        rows[900:900] = [['a{}'.format(idx), '1', 'n'] for idx in range(150)]
+        write(path, rows)
+        instance = IncrementalValidator(LocalFileLoader(path))
+        expected = outcome(FullValidator(LocalFileLoader(path)))
+        assert outcome(instance) == expected
+        assert not expected[0]
+        assert sorted(line for _, line, _ in expected[1]) == [5, 10, 501]
+
+        # Changed and inserted rows, and the rows that failed last time
+        logs = instance.logger.logs
+        assert 'Validated 153 changed row(s) of 1150' in logs, logs
+
+        # Runs of another schema start over
+        class OtherValidator(IncrementalValidator):
+            validators = dict(FullValidator.validators, int=[AnyVal()])
+
+        instance = OtherValidator(LocalFileLoader(path))
+        assert not instance.validate()
+        assert 'Validated 1150 changed row(s) of 1150' in \
+            instance.logger.logs
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_incremental_runs_start_over_with_other_arguments():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'ids.csv')
+        write(path, [[str(idx), str(idx), 'n'] for idx in range(10)])
+
+        class WideValidator(IncrementalValidator):
+            validators = dict(FullValidator.validators, int=[RangeVal(0, 100)])
+
+        class NarrowValidator(IncrementalValidator):
+            validators = dict(FullValidator.validators, int=[RangeVal(0, 5)])
+
+        assert WideValidator(LocalFileLoader(path)).validate()
+        instance = NarrowValidator(LocalFileLoader(path))
+        assert not instance.validate()
+        assert 'Validated 10 changed row(s) of 10' in instance.logger.logs
+
+        # Unchanged arguments keep the signature
+        assert not NarrowValidator(LocalFileLoader(path)).validate()
+        assert WideValidator(LocalFileLoader(path)).state_signature(
+            ['id', 'int', 'note']) == WideValidator(
+            LocalFileLoader(path)).state_signature(['id', 'int', 'note'])
+
+        # Budgets and row indexes are not supported
+        for settings in ({'budget': Budget(max_bytes=10)},
+                         {'row_index_every': 10}):
+            instance = type('Limited', (IncrementalValidator,), settings)(
+                LocalFileLoader(path))
+            try:
+                instance.validate()
+            except ValidationConfigurationException:
+                pass
+            else:
+                assert False, settings
+    finally:
+        shutil.rmtree(workdir)
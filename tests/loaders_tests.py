@@ -4,14 +4,19 @@
 
 
 import os
+import re
+import threading
 
 
 from six import StringIO, BytesIO, string_types, binary_type
-from nose.tools import raises
+from six.moves import BaseHTTPServer, socketserver
+from nose.tools import raises, assert_raises
 from csv.toolkit.loaders import (
     Loader,
     StringLoader,
     LocalFileLoader,
+    HTTPLoader,
+    ConnectionPool,
     LoaderException,
 )
 
@@ -24,6 +29,10 @@ DUMMY_STRING_SOURCE = os.path.join(
     os.path.dirname(__file__),
     'examples/dummy.txt'
 )
+SIMPLE_CSV = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.csv'
+)
 DUMMY_STRING = "An example string."
 DUMMY_SOURCE = StringIO(DUMMY_STRING)
 
@@ -89,3 +98,137 @@ def test_success_local_file_loader_and_repr():
 def test_success_local_file_loader():
     instance = LocalFileLoader(DUMMY_STRING)
     assert isinstance(instance.open(), list), type(instance.open())
+
+
+def test_local_file_loader_readlines_at():
+    instance = LocalFileLoader(SIMPLE_CSV)
+    lines = instance.open()
+    assert instance.seekable
+    assert instance.size() == len(''.join(lines))
+    first, second = instance.readlines_at([0, 1])
+    assert first == (0, lines[0]), first
+    assert second == (len(lines[0]), lines[1]), second
+
+
+class RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves ``server.body``, honouring ``Range`` if ``server.ranges`` """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('Range'))
+        if self.path != '/simple.csv':
+            return self.reply(404, b'')
+        body, match = self.server.body, re.match(
+            r'bytes=(\d+)-(\d+)', self.headers.get('Range') or '')
+        if not self.server.ranges or match is None:
+            return self.reply(200, body)
+        start, stop = int(match.group(1)), int(match.group(2)) + 1
+        if start >= len(body):
+            return self.reply(416, b'')
+        if self.headers.get('If-Range') not in (None, self.server.etag):
+            return self.reply(200, body)
+        self.reply(206, body[start:stop], {
+            'Content-Range': 'bytes {}-{}/{}'.format(
+                start, min(stop, len(body)) - 1, len(body))})
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RangeServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve(ranges=True):
+    server = RangeServer(('127.0.0.1', 0), RangeHandler)
+    with open(SIMPLE_CSV, 'rb') as f:
+        server.body = f.read()
+    server.ranges, server.etag, server.requests = ranges, '"v1"', []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://{}:{}/simple.csv'.format(*server.server_address)
+    return server, url
+
+
+def test_http_loader_fetches_ranges_in_parallel():
+    server, url = serve()
+    try:
+        with open(SIMPLE_CSV, 'r') as f:
+            expected = f.readlines()
+        pool = ConnectionPool('http', url.split('/')[2])
+        instance = HTTPLoader(url, pool=pool)
+        instance.chunk_size = 16
+        assert list(instance.stream()) == expected
+        chunks = -(-len(server.body) // 16)
+        assert len(server.requests) == chunks, server.requests
+        assert pool.opened <= instance.max_workers + 1, pool.opened
+        assert instance.head(4) == expected[0][:4]
+
+        # Connections are kept alive across loads
+        opened = pool.opened
+        assert instance.open() == expected
+        assert pool.opened == opened
+
+        server.body = b''
+        assert instance.open() == []
+        assert repr(instance) == "HTTPLoader('" + url + "')"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_loader_streams_without_ranges():
+    server, url = serve(ranges=False)
+    try:
+        with open(SIMPLE_CSV, 'r') as f:
+            expected = f.readlines()
+        instance = HTTPLoader(url)
+        instance.chunk_size = 16
+        assert instance.open() == expected
+        assert len(server.requests) == 1, server.requests
+
+        # Lines spanning blocks are bounded
+        instance.chunk_size = 1
+        instance.max_line_size = max(map(len, expected)) + 1
+        assert instance.open() == expected
+        instance.max_line_size = 8
+        assert_raises(LoaderException, instance.open)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@raises(LoaderException)
+def test_http_loader_rejects_missing_urls():
+    server, url = serve()
+    try:
+        HTTPLoader(url.replace('simple', 'missing')).open()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@raises(LoaderException)
+def test_http_loader_rejects_changed_bodies():
+    server, url = serve()
+    try:
+        instance = HTTPLoader(url)
+        instance.chunk_size = 64
+        stream = instance.stream()
+        next(stream)  # The header, from the first chunk
+        server.etag = '"v2"'
+        list(stream)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import (
+    EnumVal,
+    ForeignKeyVal,
+    IntVal,
+    RegexVal,
+    UniqueVal,
+)
+from csv.validation.loaders import LocalFileLoader
+
+
+class ShortCircuitValidator(SimpleCSVFileValidator):
+    validators = {'id': [IntVal(), UniqueVal()],
+                  'code': [RegexVal(r'^[a-z]+$'), EnumVal(['a', 'b'])]}
+    short_circuit = True
+
+
+class OrderedValidator(ShortCircuitValidator):
+    order_warmup = 10
+
+
+def write(workdir):
+    path = os.path.join(workdir, 'codes.csv')
+    with open(path, 'w') as f:
+        f.write('id,code\n')
+        for idx in range(30):
+            code = 'a' if idx % 2 else 'zz'
+            f.write('{},{}\n'.format('x' if idx == 20 else idx, code))
+        f.write('x,ZZ\n')
+    return path
+
+
+def failed(instance):
+    return [(name, line, [str(error) for error in errors])
+            for name, line, errors in instance.failures.iterfailures()]
+
+
+def test_short_circuit_stops_at_first_failure():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir)
+        instance = ShortCircuitValidator(LocalFileLoader(path))
+        assert not instance.validate()
+        validators = instance.validators
+        assert validators['code'][0].failure_count == 1
+        assert validators['code'][1].failure_count == 15
+        # Stateful validators run after failures
+        assert validators['id'][0].failure_count == 2
+        assert validators['id'][1].failure_count == 1
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_validators_are_ordered_after_warmup():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir)
+        instance = OrderedValidator(LocalFileLoader(path))
+        assert not instance.validate()
+        logs = instance.logger.logs
+        assert "Ordered validators of 'code': EnumVal, RegexVal" in logs, logs
+        assert "Ordered validators of 'id': UniqueVal, IntVal" in logs, logs
+
+        # Warm-up rows run all validators; later rows stop at EnumVal
+        validators = instance.validators
+        assert validators['code'][0].failure_count == 0
+        assert validators['code'][1].failure_count == 16
+        assert instance.validator_order['code'][0] is validators['code'][1]
+
+        # Orders depend on the rows only
+        again = OrderedValidator(LocalFileLoader(path))
+        again.validate()
+        assert failed(again) == failed(instance)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_foreign_keys_are_ordered_by_cost():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir)
+        reference = os.path.join(workdir, 'codes.ref.csv')
+        with open(reference, 'w') as f:
+            f.write('code\na\nb\n')
+
+        class ForeignKeyValidator(OrderedValidator):
+            validators = {'id': [IntVal(), UniqueVal()],
+                          'code': [ForeignKeyVal(reference, 'code'),
+                                   EnumVal(['a', 'b'])]}
+
+        instance = ForeignKeyValidator(LocalFileLoader(path))
+        assert not instance.validate()
+        logs = instance.logger.logs
+        assert "Ordered validators of 'code': EnumVal, ForeignKeyVal" in \
+            logs, logs
+
+        # Foreign keys are not looked up after the enumeration failed
+        validators = instance.validators['code']
+        assert validators[0].failure_count == 5
+        assert validators[1].failure_count == 16
+    finally:
+        shutil.rmtree(workdir)
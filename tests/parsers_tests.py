@@ -0,0 +1,87 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+from nose.tools import assert_raises
+from csv.validation.exceptions import ValidationConfigurationException
+from csv.validation.parsers import (
+    binary_reader,
+    csv_parser,
+    split_parser,
+    arrow_parser,
+    get_parser,
+)
+
+
+def test_binary_reader_splits_unquoted_lines():
+    lines = [b'a,b\r\n', b'1,2\n', b'\n', b'3,4']
+    records = list(binary_reader(lines))
+    assert records == [[b'a', b'b'], [b'1', b'2'], [], [b'3', b'4']], \
+        records
+
+
+def test_binary_reader_parses_quoted_records():
+    lines = [b'"x,1",2\n', b'"multi\n', b'line",3\n']
+    records = list(binary_reader(lines, delimiter=','))
+    assert records == [[b'x,1', b'2'], [b'multi\nline', b'3']], records
+
+
+def test_binary_reader_reads_stray_quotes_literally():
+    lines = ['ab"c,1\n', 'd,2\n', 'x,"y"z"w\n', '"q""\n', 'r",5\n',
+             'e;f\n']
+    expected = [[field.encode('utf-8') for field in record]
+                for record in csv_parser(lines)]
+    records = list(binary_reader([line.encode('utf-8') for line in lines]))
+    assert records == expected, records
+    assert records[0] == [b'ab"c', b'1'], records
+
+
+def test_binary_reader_keeps_undecodable_quoted_bytes():
+    lines = [b'a,b\n', b'"x\xe9",1\n', b'"y\xff\n', b'z",2\n', b'w\xe9,3\n']
+    records = list(binary_reader(lines))
+    assert records == [[b'a', b'b'], [b'x\xe9', b'1'], [b'y\xff\nz', b'2'],
+                       [b'w\xe9', b'3']], records
+
+
+def test_split_parser_matches_csv_parser_on_unquoted_lines():
+    lines = ['a;b\r\n', '1;2\n', '\n', '3;']
+    expected = list(csv_parser(lines, delimiter=';'))
+    assert list(split_parser(lines, delimiter=';')) == expected, expected
+    binary = [line.encode('utf-8') for line in lines]
+    assert list(split_parser(binary, delimiter=';', binary=True)) == \
+        list(csv_parser(binary, delimiter=';', binary=True))
+
+
+def test_arrow_parser_matches_csv_parser():
+    lines = ['a,b\n', '1,"x,y"\n', '"multi\n', 'line",\n']
+    try:
+        import pyarrow  # noqa
+    except ImportError:
+        assert_raises(ValidationConfigurationException, arrow_parser, lines)
+        return
+    assert list(arrow_parser(lines)) == list(csv_parser(lines))
+    binary = [line.encode('utf-8') for line in lines]
+    assert list(arrow_parser(binary, binary=True)) == \
+        list(csv_parser(binary, binary=True))
+    assert list(arrow_parser(['a,b\n'])) == [['a', 'b']]
+    assert list(arrow_parser([b'a,b\n'], binary=True)) == [[b'a', b'b']]
+    assert list(arrow_parser([])) == []
+
+
+def test_get_parser():
+    assert get_parser('split') is split_parser
+    assert_raises(ValidationConfigurationException, get_parser, 'fast')
+
+
+def test_arrow_parser_parses_records_of_another_width():
+    lines = ['a,b\n', '1\n', '2,3\n', '4,5,6\n', '"7\n', '8",9,10\n',
+             '11,12\n', '13\n']
+    try:
+        import pyarrow  # noqa
+    except ImportError:
+        return
+    assert list(arrow_parser(lines)) == list(csv_parser(lines))
+    binary = [line.encode('utf-8') for line in lines]
+    assert list(arrow_parser(binary, binary=True)) == \
+        list(csv_parser(binary, binary=True))
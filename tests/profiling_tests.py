@@ -0,0 +1,106 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+
+from csv.validation.profiling import Profiler
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import AnyVal, IntVal
+from csv.validation.loaders import LocalFileLoader
+
+
+class SlowVal(AnyVal):
+
+    def validate(self, field, row={}):
+        end = time.time() + 0.002
+        while time.time() < end:
+            pass
+
+
+class SlowValidator(SimpleCSVFileValidator):
+    validators = {'id': [SlowVal(), IntVal()]}
+
+
+def write(workdir):
+    path = os.path.join(workdir, 'ids.csv')
+    with open(path, 'w') as f:
+        f.write('id\n')
+        for idx in range(100):
+            f.write('{}\n'.format(idx))
+    return path
+
+
+def check_profile(result):
+    profile = result.profile
+    assert profile.samples > 10, profile
+
+    # Stacks start at the run, and mostly end in the slow validator
+    lines = profile.collapsed()
+    assert all(line.startswith('__call__ (validation.py:')
+               for line in lines), lines
+    slow = sum(count for stack, count in profile.stacks.items()
+               if ';validate_row ' in stack and
+               stack.endswith(';validate (profiling_tests.py:21)'))
+    assert slow > profile.samples // 2, lines
+    return profile
+
+
+def test_profiled_run_has_collapsed_stacks():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir)
+
+        class ProfiledValidator(SlowValidator):
+            profiler = Profiler(interval=0.001, directory=workdir)
+
+        result = ProfiledValidator(LocalFileLoader(path))()
+        assert result.validation
+        profile = check_profile(result)
+        assert profile.clock == 'cpu'  # Sampled on a SIGPROF timer
+
+        with open(profile.path) as f:
+            assert f.read().splitlines() == profile.collapsed()
+        assert os.path.basename(profile.path).startswith('ProfiledValidator-')
+        assert 'Sampled {} stack(s) every 0.001s of cpu time to {}'.format(
+            profile.samples, profile.path) in result.log
+
+        # Other threads are sampled from a thread
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            ProfiledValidator(LocalFileLoader(path))()))
+        thread.start()
+        thread.join()
+        assert check_profile(results[0]).clock == 'wall'
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_profiler_samples_a_rate_of_runs():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = write(workdir)
+
+        class SampledValidator(SlowValidator):
+            profiler = Profiler(interval=0.001, rate=0.0)
+
+        result = SampledValidator(LocalFileLoader(path))()
+        assert result.validation and result.profile is None
+        assert SlowValidator(LocalFileLoader(path))().profile is None
+
+        profiler = Profiler(rate=0.5, seed=1)
+        profiled = 0
+        for _ in range(100):
+            sampler = profiler.start()
+            if sampler is not None:
+                profiled += 1
+                assert sampler.stop().samples >= 0
+        assert 30 < profiled < 70
+    finally:
+        shutil.rmtree(workdir)
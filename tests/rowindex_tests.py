@@ -0,0 +1,78 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation.rowindex import RowIndex
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import IntVal, AnyVal
+from csv.validation.loaders import LocalFileLoader, BinaryFileLoader
+
+
+ROWS = 95
+
+
+class IndexedValidator(SimpleCSVFileValidator):
+    validators = {'id': [IntVal()], 'note': [AnyVal()]}
+    row_index_every = 10
+
+
+def write(workdir):
+    """ Writes rows with CRLF endings, a blank line and multi-line fields """
+    path = os.path.join(workdir, 'ids.csv')
+    offsets = []
+    with open(path, 'wb') as f:
+        f.write(b'id,note\r\n')
+        for idx in range(ROWS):
+            offsets.append(f.tell())  # Blank lines belong to the next row
+            if idx == 30:
+                f.write(b'\r\n')
+            note = '"line\r\n{}"'.format(idx) if idx % 7 == 3 else 'n'
+            f.write('{},{}\r\n'.format('x' if idx == 42 else idx,
+                                       note).encode('utf-8'))
+    return path, offsets
+
+
+def test_validation_builds_row_index():
+    workdir = tempfile.mkdtemp()
+    try:
+        path, offsets = write(workdir)
+        for loader in (LocalFileLoader, BinaryFileLoader):
+            instance = IndexedValidator(loader(path))
+            assert not instance.validate()
+            failures = list(instance.failures.iterfailures())
+            assert [row for _, row, _ in failures] == [42], failures
+
+            index = RowIndex.load(path + '.rowidx')
+            assert index.rows == ROWS and index.every == 10
+            assert list(index.offsets) == offsets[::10], index.offsets
+            assert index.matches(path)
+
+            instance = IndexedValidator(loader(path))
+            rows = instance.read_rows(42, 45)
+            assert [line for line, _ in rows] == [42, 43, 44], rows
+            assert rows[0][1][0] in ('x', b'x'), rows
+            assert instance.row_index.locate(42) == (40, offsets[40])
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_stale_row_index_is_not_used():
+    workdir = tempfile.mkdtemp()
+    try:
+        path, offsets = write(workdir)
+        IndexedValidator(LocalFileLoader(path)).validate()
+        with open(path, 'ab') as f:
+            f.write(b'95,n\r\n')
+
+        instance = IndexedValidator(LocalFileLoader(path))
+        assert instance.load_row_index() is None
+        rows = instance.read_rows(93, 100)
+        assert [record[0] for _, record in rows] == ['93', '94', '95'], rows
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,254 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+
+from nose.tools import assert_raises
+from csv.validation.exceptions import ValidationConfigurationException
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import (
+    EnumVal,
+    IntVal,
+    UniqueVal,
+    RegexVal,
+    AnyVal,
+)
+from csv.validation.loaders import LocalFileLoader
+from csv.validation.schema import (
+    Schema,
+    validate_schemas,
+    compile_schema,
+    load_schema,
+    load_schemas,
+    VALIDATOR_MODULES,
+)
+from csv.validation.batch import validate_many
+
+
+SIMPLE_CSV_FILE = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.csv'
+)
+BAD_VALIDATION_CSV_FILE = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.bad.validation.csv'
+)
+
+
+class SchemaIntVal(IntVal):
+    pass
+
+
+class SchemaValidator(SimpleCSVFileValidator):
+    validators = {
+        'unique': [UniqueVal()],
+        'enum': [EnumVal(['WORLD', 'world'])],
+        'int': [IntVal()],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [],
+        'any': [AnyVal()],
+        'regex': [RegexVal(r'^foobar$')],
+    }
+
+
+def test_schema_runs_are_isolated():
+    schema = Schema(SchemaValidator)
+    for _ in range(3):
+        result = schema.run(LocalFileLoader(SIMPLE_CSV_FILE))
+        assert result.validation, result.log
+
+    validator = schema.validator(LocalFileLoader(BAD_VALIDATION_CSV_FILE))
+    assert not validator.validate()
+    assert validator.validators['int'][0].failure_count == 1
+    assert validator.validators['unique'][0].fails() == set([('hello0',)])
+
+    result = schema.run(LocalFileLoader(SIMPLE_CSV_FILE))
+    assert result.validation, result.log
+    assert SchemaValidator.validators['int'][0].failure_count == 0
+    assert SchemaValidator.validators['empty'] == []
+
+
+def test_schema_spawned_validators_share_configuration():
+    schema = Schema(SchemaValidator)
+    first = schema.validator(LocalFileLoader(SIMPLE_CSV_FILE))
+    second = schema.validator(LocalFileLoader(SIMPLE_CSV_FILE))
+    assert first.validators['regex'][0] is not second.validators['regex'][0]
+    assert first.validators['regex'][0].regex is \
+        second.validators['regex'][0].regex
+    assert first.logger is not second.logger
+
+
+def test_validate_many_isolates_concurrent_runs():
+    sources = [LocalFileLoader(SIMPLE_CSV_FILE),
+               LocalFileLoader(BAD_VALIDATION_CSV_FILE)] * 20
+    results = validate_many(SchemaValidator, sources, max_workers=8)
+    for source, result in zip(sources, results):
+        expected = source.source == SIMPLE_CSV_FILE
+        assert result.validation == expected, result.log
+        assert repr(source) in result.log[0], result.log
+    bad = results[1].log
+    assert "  IntVal failed 1 time(s) on field: 'int'" in bad, bad
+
+
+class CountingLoader(LocalFileLoader):
+    streams = 0
+
+    def stream(self):
+        CountingLoader.streams += 1
+        return super(CountingLoader, self).stream()
+
+
+class LegacyValidator(SchemaValidator):
+    validators = dict(SchemaValidator.validators, unique=[AnyVal()],
+                      enum=[AnyVal()], int=[AnyVal()], empty=[AnyVal()],
+                      regex=[AnyVal()])
+
+
+class PartnerValidator(SimpleCSVFileValidator):
+    validators = {'unique': [UniqueVal()], 'partner': [AnyVal()]}
+
+
+class SemicolonValidator(SchemaValidator):
+    delimiter = ';'
+
+
+def test_validate_schemas_parses_once():
+    schemas = [SchemaValidator, Schema(LegacyValidator), PartnerValidator]
+    CountingLoader.streams = 0
+    results = validate_schemas(schemas,
+                               CountingLoader(BAD_VALIDATION_CSV_FILE))
+    assert CountingLoader.streams == 1
+    assert [result.validation for result in results] == [False, True,
+                                                         False]
+    for schema, result in zip(schemas, results):
+        expected = Schema(schema) if not isinstance(schema, Schema) \
+            else schema
+        expected = expected.run(CountingLoader(BAD_VALIDATION_CSV_FILE))
+        assert result.validation == expected.validation
+        assert result.log[1:] == expected.log[1:], result.log
+    assert 'Missing validators for:' in results[2].log
+
+    # Schemas with another dialect need a parse of their own
+    CountingLoader.streams = 0
+    results = validate_schemas(
+        {'strict': SchemaValidator, 'semicolon': SemicolonValidator},
+        CountingLoader(SIMPLE_CSV_FILE))
+    assert CountingLoader.streams == 2
+    assert results['strict'].validation, results['strict'].log
+    assert not results['semicolon'].validation
+
+
+SCHEMA_SPEC = {
+    'name': 'SchemaValidator',
+    'columns': {
+        'unique': ['UniqueVal'],
+        'enum': [{'EnumVal': [['WORLD', 'world']]}],
+        'int': ['IntVal'],
+        'bool': ['AnyVal'],
+        'float': ['AnyVal'],
+        'empty': [],
+        'any': ['AnyVal'],
+        'regex': [{'RegexVal': {'pattern': '^foobar$'}}],
+    },
+}
+
+
+def test_load_schema_compiles_and_caches_schema_files():
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'contract.json')
+        with open(path, 'w') as f:
+            json.dump(SCHEMA_SPEC, f)
+        expected = Schema(SchemaValidator).run(
+            LocalFileLoader(BAD_VALIDATION_CSV_FILE))
+        for _ in range(2):  # Compiled, then loaded from the cache
+            result = load_schema(path).run(
+                LocalFileLoader(BAD_VALIDATION_CSV_FILE))
+            assert not result.validation and not expected.validation
+            assert result.log == expected.log, result.log
+        cache_path = path + '.compiled'
+        assert os.path.exists(cache_path)
+        compiled = os.path.getmtime(cache_path)
+
+        # Changed schema files are compiled again
+        spec = dict(SCHEMA_SPEC, delimiter=';', name='Semicolon')
+        with open(path, 'w') as f:
+            json.dump(spec, f)
+        schema = load_schema(path)
+        assert schema.validator_class.__name__ == 'Semicolon'
+        assert schema.validator_class.delimiter == ';'
+        assert isinstance(schema.validator_class.delimiter, str)
+        result = schema.run(LocalFileLoader(BAD_VALIDATION_CSV_FILE))
+        assert not result.validation
+        assert os.path.getmtime(cache_path) >= compiled
+        assert load_schemas(workdir)['contract'].validator_class.delimiter \
+            == ';'
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_load_schema_reads_yaml():
+    try:
+        import yaml  # noqa
+    except ImportError:
+        return
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'contract.yaml')
+        with open(path, 'w') as f:
+            f.write('short_circuit: true\n'
+                    'ignored_fields: [any]\n'
+                    'columns:\n'
+                    '  unique: [UniqueVal]\n'
+                    '  int:\n'
+                    '    - IntVal\n'
+                    '    - RangeVal: {min_value: 0, max_value: 3}\n')
+        schemas = load_schemas(workdir, cache_dir=workdir)
+        validator_class = schemas['contract'].validator_class
+        assert validator_class.__name__ == 'contract'
+        assert validator_class.short_circuit is True
+        assert validator_class.ignored_fields == frozenset(['any'])
+        assert [validator.__class__.__name__ for validator
+                in validator_class.validators['int']] == ['IntVal', 'RangeVal']
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_compile_schema_rejects_invalid_schemas():
+    assert_raises(ValidationConfigurationException, compile_schema, {})
+    for spec in ({'columns': {'id': ['NoSuchVal']}},
+                 {'columns': {'id': [{'IntVal': {'no_such': 1}}]}},
+                 {'columns': {}, 'validate': True},
+                 {'columns': {}, 'validators': {}},
+                 {'columns': {'id': [{'os.system': 'exit 1'}]}},
+                 {'columns': {'id': ['csv.validation.schema.Schema']}}):
+        assert_raises(ValidationConfigurationException, compile_schema, spec)
+    validator_class = compile_schema(
+        {'columns': {'id': ['csv.validation.validators.IntVal']}}, 'Ids')
+    assert validator_class.__name__ == 'Ids'
+
+
+def test_compile_schema_imports_only_validator_modules():
+    imported = 'this' in sys.modules  # Prints the Zen of Python
+    assert_raises(ValidationConfigurationException, compile_schema,
+                  {'columns': {'id': ['this.Val']}})
+    assert ('this' in sys.modules) == imported
+
+    # Other modules are added to VALIDATOR_MODULES
+    path = '{}.SchemaIntVal'.format(__name__)
+    assert_raises(ValidationConfigurationException, compile_schema,
+                  {'columns': {'id': [path]}})
+    VALIDATOR_MODULES.add(__name__)
+    try:
+        validator_class = compile_schema({'columns': {'id': [path]}})
+    finally:
+        VALIDATOR_MODULES.discard(__name__)
+    assert isinstance(validator_class.validators['id'][0], SchemaIntVal)
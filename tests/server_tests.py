@@ -0,0 +1,189 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import json
+import shutil
+import socket
+import tempfile
+import threading
+
+
+from six.moves import http_client
+
+
+from csv.validation.loaders import LocalFileLoader
+from csv.validation.server import make_server, ValidationService
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import (
+    EnumVal,
+    IntVal,
+    UniqueVal,
+    RegexVal,
+    EmptyVal,
+    AnyVal,
+)
+
+
+BAD_VALIDATION_CSV_FILE = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.bad.validation.csv'
+)
+
+
+class BadValidator(SimpleCSVFileValidator):
+    validators = {
+        'unique': [UniqueVal()],
+        'enum': [EnumVal(['WORLD', 'world'])],
+        'int': [IntVal()],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [EmptyVal()],
+        'any': [AnyVal()],
+        'regex': [RegexVal(r'^foobar$')],
+    }
+
+
+class UnixHTTPConnection(http_client.HTTPConnection):
+
+    def __init__(self, path):
+        http_client.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def start(address, **kwargs):
+    server = make_server({'bad': BadValidator}, address, **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def request(connection, method, url, body=None):
+    connection.request(method, url, body)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read().decode('utf-8'))
+
+
+def summary(log):
+    return sorted(line for line in log
+                  if 'time(s)' in line or 'Invalid fields' in line)
+
+
+def test_server_validates_paths_and_bodies():
+    server = start(('127.0.0.1', 0),
+                   root=os.path.dirname(BAD_VALIDATION_CSV_FILE))
+    try:
+        connection = http_client.HTTPConnection(*server.server_address)
+        expected = BadValidator(LocalFileLoader(BAD_VALIDATION_CSV_FILE))()
+
+        status, document = request(
+            connection, 'POST',
+            '/validate/bad?path=' + BAD_VALIDATION_CSV_FILE)
+        assert status == 200, document
+        assert not document['validation']
+        assert document['rows'] == 8, document
+        assert sorted(document['log'][1:]) == sorted(expected.log[1:])
+
+        # Same connection, CSV streamed in the request body
+        with open(BAD_VALIDATION_CSV_FILE, 'rb') as f:
+            status, document = request(connection, 'POST', '/validate/bad',
+                                       f.read())
+        assert status == 200, document
+        assert summary(document['log']) == summary(expected.log)
+
+        status, document = request(connection, 'POST', '/validate/nope',
+                                   b'a\n1\n')
+        assert status == 404, document
+        status, document = request(
+            connection, 'POST', '/validate/bad?path=' +
+            os.path.join(os.path.dirname(BAD_VALIDATION_CSV_FILE), 'nope'))
+        assert status == 400, document
+
+        status, document = request(connection, 'GET', '/health')
+        assert status == 200, document
+        assert document['schemas'] == ['bad'], document
+        assert document['stats']['completed'] == 2, document
+        assert document['stats']['invalid'] == 2, document
+        assert document['stats']['pending'] == 0, document
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_server_over_unix_socket():
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'validation.sock')
+    server = start(path, root=os.path.dirname(BAD_VALIDATION_CSV_FILE))
+    try:
+        connection = UnixHTTPConnection(path)
+        status, document = request(
+            connection, 'POST',
+            '/validate/bad?path=' + BAD_VALIDATION_CSV_FILE)
+        assert status == 200, document
+        assert not document['validation']
+
+        status, document = request(connection, 'POST',
+                                   '/validate/bad?path=/etc/hosts')
+        assert status == 400, document
+        status, document = request(connection, 'GET', '/health')
+        assert document['stats']['pending'] == 0, document
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir)
+
+
+def test_server_without_root_validates_bodies_only():
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'validation.sock')
+    with open(path, 'w') as f:
+        f.write('not a socket')
+    try:
+        try:
+            make_server({'bad': BadValidator}, path)
+        except socket.error:
+            pass
+        else:
+            raise AssertionError('Bound over a regular file')
+        with open(path) as f:
+            assert f.read() == 'not a socket'  # Left in place
+        os.remove(path)
+
+        server = start(path)
+        connection = UnixHTTPConnection(path)
+        status, document = request(
+            connection, 'POST',
+            '/validate/bad?path=' + BAD_VALIDATION_CSV_FILE)
+        assert status == 400, document
+        assert 'root' in document['error'], document
+        assert 'is not in' not in json.dumps(document)  # Values not echoed
+        status, document = request(connection, 'POST', '/validate/bad',
+                                   b'unique\n1\n')
+        assert status == 200, document
+        server.shutdown()
+        server.server_close()
+
+        # Stale sockets are replaced
+        server = start(path)
+        server.shutdown()
+        server.server_close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_service_rejects_jobs_when_queue_is_full():
+    service = ValidationService({'bad': BadValidator}, max_workers=1,
+                                queue_size=1)
+    assert service.acquire()
+    assert service.acquire()
+    assert not service.acquire()
+    assert service.health()['stats']['rejected'] == 1
+    assert service.health()['stats']['pending'] == 2
+    service.shutdown()
@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import EnumVal, UniqueVal
+from csv.validation.loaders import LocalFileLoader
+from csv.validation.sharding import (
+    ShardLoader,
+    shard_ranges,
+    validate_sharded,
+)
+
+
+ROWS = ['id,code'] + [
+    '{},{}'.format(idx % 150, 'bad' if idx % 70 == 0 else 'ok')
+    for idx in range(200)
+]
+
+
+class ShardedValidator(SimpleCSVFileValidator):
+    validators = {
+        'id': [UniqueVal()],
+        'code': [EnumVal(['ok'])],
+    }
+
+
+def failure_counts(log):
+    return sorted(msg.strip() for msg in log if 'time(s)' in msg)
+
+
+def failure_lines(log):
+    return [msg.strip() for msg in log if msg.startswith('  LocalFileLoader')]
+
+
+def write_csv(tmpdir):
+    path = os.path.join(tmpdir, 'sharded.csv')
+    with open(path, 'w') as f:
+        f.write('\n'.join(ROWS) + '\n')
+    return path
+
+
+def test_shard_loaders_cover_every_line_once():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = write_csv(tmpdir)
+        lines = []
+        for start, stop in shard_ranges(path, 7):
+            shard = ShardLoader(path, start, stop).open()
+            assert shard[0] == 'id,code\n', shard[0]
+            lines.extend(shard[1:])
+        assert [line.strip() for line in lines] == ROWS[1:]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_validate_sharded_matches_single_pass():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = write_csv(tmpdir)
+        single = ShardedValidator(LocalFileLoader(path))()
+        assert not single.validation
+
+        result = validate_sharded(ShardedValidator, path, shards=4)
+        assert not result.validation, result.log
+        assert failure_counts(result.log) == failure_counts(single.log)
+        assert failure_counts(result.log) == [
+            "EnumVal failed 3 time(s) on field: 'code'",
+            "UniqueVal failed 50 time(s) on field: 'id'",
+        ], result.log
+
+        # Duplicates across shards are reported on their rows
+        assert failure_lines(result.log) == failure_lines(single.log)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import json
+
+
+from csv.validation.sketches import (
+    SpaceSaving,
+    HyperLogLog,
+    BoundedValueTracker,
+)
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import (
+    EnumVal,
+    IntVal,
+    UniqueVal,
+    RegexVal,
+    EmptyVal,
+    AnyVal,
+)
+from csv.validation.loaders import LocalFileLoader
+
+
+BAD_VALIDATION_CSV_FILE = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.bad.validation.csv'
+)
+
+
+def skewed_stream():
+    # 'hot' is far above n / capacity; the tail is 5000 distinct values
+    for idx in range(5000):
+        yield 'hot'
+        yield 'warm' if idx % 2 else 'value-{}'.format(idx)
+
+
+def test_space_saving_keeps_heavy_hitters():
+    summary = SpaceSaving(10)
+    for value in skewed_stream():
+        summary.add(value)
+    assert len(summary) == 10, len(summary)
+    common = summary.most_common(2)
+    assert [value for value, _ in common] == ['hot', 'warm'], common
+    assert common[0][1] >= 5000, common
+
+
+def test_hyperloglog_estimate():
+    estimator = HyperLogLog()
+    for idx in range(20000):
+        estimator.add('value-{}'.format(idx % 10000))
+    assert abs(estimator.estimate() - 10000) < 500, estimator.estimate()
+
+    small = HyperLogLog()
+    for value in ('a', 'b', 'c', 'a'):
+        small.add(value)
+    assert round(small.estimate()) == 3, small.estimate()
+
+
+def test_bounded_value_tracker_merge():
+    first, second = BoundedValueTracker(5), BoundedValueTracker(5)
+    for idx in range(3000):
+        first.add('a{}'.format(idx))
+        second.add('b{}'.format(idx))
+        second.add('hot')
+    state = json.loads(json.dumps(second.serialize()))
+    first.merge(state)
+    assert first.total == 9000, first.total
+    assert list(first)[0] == 'hot', list(first)
+    assert abs(len(first) - 6001) < 300, len(first)
+    assert not BoundedValueTracker()
+
+
+def test_validator_bound_replaces_failed_value_set():
+    validator = IntVal()
+    validator.bound(2)
+    for value in ('x', 'y', 'x', 'z', 'x'):
+        try:
+            validator.validate(value)
+        except Exception:
+            pass
+    assert validator.fails().most_common(1) == [('x', 3)]
+    assert len(validator.fails()) == 3, len(validator.fails())
+    assert len(validator.fails().top) == 2
+
+
+def test_validation_with_bounded_failures():
+    class BoundedValidator(SimpleCSVFileValidator):
+        validators = {
+            'unique': [UniqueVal()],
+            'enum': [EnumVal(['WORLD', 'world'])],
+            'int': [IntVal()],
+            'bool': [AnyVal()],
+            'float': [AnyVal()],
+            'empty': [EmptyVal()],
+            'any': [AnyVal()],
+            'regex': [RegexVal(r'^foobar$')],
+        }
+        bounded_failures = 10
+
+    instance = BoundedValidator(LocalFileLoader(BAD_VALIDATION_CSV_FILE))
+    result = instance()
+    assert not result.validation
+    assert "    Invalid fields: ['notfoobar' (1)]" in result.log, result.log
+    assert "    (~1 distinct invalid fields)" in result.log, result.log
+    assert BoundedValidator.validators['int'][0].top_k is None
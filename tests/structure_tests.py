@@ -0,0 +1,116 @@
+#
+# Copyright (c) 2016, Michael Conroy
+#
+
+
+import os
+import shutil
+import tempfile
+
+
+from csv.validation import structure
+from csv.validation.structure import count_fields, scan_lines, scan_file
+from csv.validation.validation import SimpleCSVFileValidator
+from csv.validation.validators import IntVal, AnyVal
+from csv.validation.loaders import LocalFileLoader
+
+
+BROKEN_CSV = (
+    'id,name,note\n'
+    '0,a,x\n'
+    '1,b\n'                      # Truncated row
+    '2,"c, ""quoted""",y\n'
+    '3,d"e,z\n'                  # Stray quote in an unquoted field
+    '\n'
+    '4,"f\n'
+    'g",w\n'                     # Multi-line quoted field
+    '5,h,i,j\n'                  # Stray delimiter
+    '6,"k\n'                     # Never closed
+)
+
+
+def test_count_fields():
+    assert count_fields('a,b,c', ',', '"') == (3, None, None)
+    assert count_fields('"a,b",c', ',', '"') == (2, None, None)
+    assert count_fields('"a""b",', ',', '"') == (2, None, None)
+    assert count_fields('a,"b"c', ',', '"') == (2, 'quote', 4)
+    assert count_fields('a,b"c', ',', '"') == (2, 'quote', 3)
+    assert count_fields(b'a;"b', b';', b'"') == (2, 'unterminated', 2)
+
+
+def test_scan_lines():
+    scan = scan_lines(BROKEN_CSV.splitlines(True))
+    assert scan.rows == 6, scan
+    assert scan.error_count == 4, scan
+    assert [(error.row, error.kind) for error in scan.errors] == [
+        (1, 'width'), (3, 'quote'), (5, 'width'), (6, 'unterminated')
+    ], scan.errors
+    assert scan.errors[0].offset == BROKEN_CSV.index('1,b'), scan.errors
+    assert scan.errors[1].offset == BROKEN_CSV.index('d"e') + 1
+    assert scan.errors[0].message == '2 field(s), expected 3'
+    assert not scan.complete
+
+    scan = scan_lines(BROKEN_CSV.splitlines(True), limit=1)
+    assert scan.error_count == 4 and len(scan.errors) == 1, scan
+
+
+def test_scan_file_in_parallel_chunks():
+    workdir = tempfile.mkdtemp()
+    original = structure.MIN_CHUNK_SIZE
+    structure.MIN_CHUNK_SIZE = 64
+    try:
+        path = os.path.join(workdir, 'broken.csv')
+        with open(path, 'w') as f:
+            f.write('id,name,note\n')
+            for idx in range(200):
+                f.write('{},"a\nb",c\n'.format(idx) if idx % 50 == 7 else
+                        '{},b\n'.format(idx) if idx % 40 == 3 else
+                        '{},a,b\n'.format(idx))
+        serial = scan_file(path)
+        assert serial.error_count == 5, serial
+        assert [error.row for error in serial.errors] == [
+            3, 43, 83, 123, 163], serial.errors
+
+        # Chunks ending inside the multi-line fields are scanned again
+        assert scan_file(path, processes=4) == serial
+
+        with open(path, 'w') as f:
+            f.write('id,name,note\n')
+            for idx in range(200):
+                f.write('{},b\n'.format(idx) if idx % 40 == 3 else
+                        '{},a,b\n'.format(idx))
+        serial = scan_file(path)
+        assert serial.error_count == 5, serial
+        assert scan_file(path, processes=4) == serial
+    finally:
+        structure.MIN_CHUNK_SIZE = original
+        shutil.rmtree(workdir)
+
+
+def test_validator_rejects_broken_structure():
+    class StructureValidator(SimpleCSVFileValidator):
+        validators = {'id': [IntVal()], 'name': [AnyVal()],
+                      'note': [AnyVal()]}
+        check_structure = True
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'broken.csv')
+        with open(path, 'w') as f:
+            f.write(BROKEN_CSV)
+        instance = StructureValidator(LocalFileLoader(path))
+        validation, log = instance()
+        assert not validation
+        assert log[1:4] == [
+            'Failed structural validation: 4 error(s)',
+            '  Row 1 (byte 19): 2 field(s), expected 3',
+            '  Row 3 (byte 46): stray quote character',
+        ], log
+        assert len(instance.structural_errors) == 4
+        assert instance.rows == 0  # Validators never ran
+
+        with open(path, 'w') as f:
+            f.write('id,name,note\n1,"a\nb",c\n')
+        assert StructureValidator(LocalFileLoader(path))()[0]
+    finally:
+        shutil.rmtree(workdir)
@@ -5,14 +5,26 @@
 
 import os
 import re
+import shutil
+import tempfile
 
 
 from nose.tools import assert_raises
 from csv.toolkit.validation import (
     BaseFileValidator,
+    BaseValidator,
     SimpleCSVFileValidator,
+    UniqueVal,
+    EnumVal,
+    IntVal,
+    RangeVal,
+    AnyVal,
+    EmptyVal,
+    ValidationConfigurationException,
 )
-from csv.toolkit.loaders import LocalFileLoader
+from csv.validation.exceptions import ValidationException
+from csv.validation.sampling import wilson_interval
+from csv.toolkit.loaders import LocalFileLoader, BinaryFileLoader
 
 
 DUMMY_SOURCE = "A dummy source."
@@ -24,6 +36,10 @@ DUPLICATE_HEADERS_CSV = os.path.join(
     os.path.dirname(__file__),
     'examples/duplicate.headers.csv'
 )
+BAD_CSV = os.path.join(
+    os.path.dirname(__file__),
+    'examples/simple.bad.validation.csv'
+)
 
 
 def clean_string(string):
@@ -70,3 +86,265 @@ def test_simple_csv_validator_duplicate_headers():
     )
     assert clean_string(instance.log) == clean_string(expected_log), \
         instnace.log
+
+
+def test_simple_csv_validator_sample_estimates():
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        pass
+    SimpleCSVFileValidatorTest.validators = {
+        'unique': [UniqueVal()],
+        'enum': [EnumVal(['WORLD', 'world'])],
+        'int': [IntVal()],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [AnyVal()],
+        'any': [AnyVal()],
+        'regex': [AnyVal()],
+    }
+    instance = SimpleCSVFileValidatorTest(LocalFileLoader(BAD_CSV))
+    result = instance.sample(size=1000, seed=1)
+    assert result.rows > 0, result.rows
+    estimates = dict(((e.field, e.validator), e) for e in result.estimates)
+    enum = estimates[('enum', 'EnumVal')]
+    assert enum.sampled == result.rows, enum
+    assert enum.low <= enum.rate <= enum.high, enum
+    assert estimates[('bool', None)].failures == 0
+
+
+def test_simple_csv_validator_sample_has_size_distinct_rows():
+    class SampledValidator(SimpleCSVFileValidator):
+        validators = {'id': [UniqueVal()], 'note': [AnyVal()]}
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'ids.csv')
+        with open(path, 'w') as f:
+            f.write('id,note\n')
+            for idx in range(200):
+                f.write('{},{}\n'.format(idx, 'x' * (idx % 3) * 50))
+        for size, rows in ((150, 150), (200, 200), (1000, 200)):
+            instance = SampledValidator(LocalFileLoader(path))
+            result = instance.sample(size=size, seed=1)
+            assert result.rows == rows, (size, result.rows)
+            assert not instance.failures  # Rows are sampled once
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_simple_csv_validator_sample_requires_size_or_rate():
+    instance = SimpleCSVFileValidator(LocalFileLoader(BAD_CSV))
+    assert_raises(ValidationConfigurationException, instance.sample)
+    assert_raises(ValidationConfigurationException, instance.sample,
+                  size=10, rate=0.1)
+
+
+def test_wilson_interval():
+    rate, low, high = wilson_interval(10, 100)
+    assert rate == 0.1, rate
+    assert 0.05 < low < 0.1 < high < 0.18, (low, high)
+    assert wilson_interval(0, 0) == (0.0, 0.0, 1.0)
+
+
+class HeaderOnlyLoader(LocalFileLoader):
+    """ Fails if more than the header line is read """
+
+    def stream(self):
+        lines = super(HeaderOnlyLoader, self).stream()
+        yield next(lines)
+        raise AssertionError('Body was read')
+
+
+def test_simple_csv_validator_validate_headers():
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        pass
+    SimpleCSVFileValidatorTest.validators = {
+        'unique': [], 'enum': [], 'int': [], 'bool': [],
+        'float': [], 'empty': [], 'any': [], 'regex': [],
+    }
+    instance = SimpleCSVFileValidatorTest(HeaderOnlyLoader(BAD_CSV))
+    assert instance.validate_headers(), instance.log
+
+
+def test_simple_csv_validator_rejects_schema_before_body():
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        pass
+    SimpleCSVFileValidatorTest.validators = {'unique': []}
+    instance = SimpleCSVFileValidatorTest(HeaderOnlyLoader(BAD_CSV))
+    assert not instance.validate_headers()
+    assert not instance.validate()
+    assert instance.missing_validators, instance.missing_validators
+
+
+def test_simple_csv_validator_projects_validated_columns():
+    class RowRecorder(EmptyVal):
+        rows = []
+
+        def validate(self, field, row={}):
+            self.rows.append(row)
+
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        ignored_fields = frozenset(['empty'])
+    recorder = RowRecorder()
+    SimpleCSVFileValidatorTest.validators = {
+        'unique': [UniqueVal(['enum'])],
+        'enum': [AnyVal()],
+        'int': [AnyVal()],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [EmptyVal()],
+        'any': [AnyVal()],
+        'regex': [recorder],
+    }
+    instance = SimpleCSVFileValidatorTest(LocalFileLoader(BAD_CSV))
+    assert instance.validate(), instance.log
+    assert instance.fields == ['unique', 'regex'], instance.fields
+    assert len(recorder.rows) == 8, len(recorder.rows)
+    assert set(recorder.rows[0]) == set(['unique', 'enum', 'regex'])
+
+
+def test_simple_csv_validator_passes_rows_to_undeclared_validators():
+    class RowRecorder(BaseValidator):
+        rows = []
+
+        def validate(self, field, row={}):
+            self.rows.append(row['any'])
+
+        def fails(self):
+            return None
+
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        validators = {
+            'unique': [AnyVal()],
+            'enum': [AnyVal()],
+            'int': [AnyVal()],
+            'bool': [AnyVal()],
+            'float': [AnyVal()],
+            'empty': [AnyVal()],
+            'any': [AnyVal()],
+            'regex': [RowRecorder()],
+        }
+    instance = SimpleCSVFileValidatorTest(LocalFileLoader(BAD_CSV))
+    assert instance.validate(), instance.log
+    assert instance.fields == ['regex'], instance.fields
+    assert len(RowRecorder.rows) == 8, RowRecorder.rows
+
+
+def test_simple_csv_validator_binary_loader():
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        pass
+    SimpleCSVFileValidatorTest.validators = {
+        'unique': [UniqueVal()],
+        'enum': [EnumVal(['WORLD', 'world'])],
+        'int': [IntVal()],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [EmptyVal()],
+        'any': [AnyVal()],
+        'regex': [AnyVal()],
+    }
+    text = SimpleCSVFileValidatorTest(LocalFileLoader(BAD_CSV))()
+    binary = SimpleCSVFileValidatorTest(BinaryFileLoader(BAD_CSV))()
+    assert not binary.validation and not text.validation
+    assert binary.log[1:] == [msg.replace('LocalFileLoader',
+                                          'BinaryFileLoader')
+                              for msg in text.log[1:]], binary.log
+
+
+def test_simple_csv_validator_shares_conversions():
+    casts = []
+
+    def counting_int(field):
+        casts.append(field)
+        return int(field)
+
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        pass
+    int_val, low, high = IntVal(), RangeVal(0, cast=int), RangeVal(max_value=5)
+    int_val.cast = low.cast = counting_int
+    SimpleCSVFileValidatorTest.validators = {
+        'unique': [AnyVal()],
+        'enum': [AnyVal()],
+        'int': [int_val, UniqueVal(), low, high],
+        'bool': [AnyVal()],
+        'float': [AnyVal()],
+        'empty': [AnyVal()],
+        'any': [AnyVal()],
+        'regex': [AnyVal()],
+    }
+    instance = SimpleCSVFileValidatorTest(LocalFileLoader(BAD_CSV))
+    assert not instance.validate()
+    assert list(instance.conversions) == ['int']
+    assert len(casts) == 8, casts
+    validators = instance.validators['int']
+    assert [validator.failure_count for validator in validators] == \
+        [1, 0, 0, 2], instance.log
+
+
+def test_simple_csv_validator_runs_overridden_validate():
+    class EvenVal(IntVal):
+        def validate(self, field, row={}):
+            super(EvenVal, self).validate(field, row)
+            if int(field) % 2:
+                raise ValidationException('{} is odd'.format(field))
+
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        validators = {'id': [IntVal(), EvenVal()]}
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'ids.csv')
+        with open(path, 'w') as f:
+            f.write('id\n1\n2\n3\n')
+        instance = SimpleCSVFileValidatorTest(LocalFileLoader(path))
+        assert not instance.validate()
+        assert instance.conversions == {}
+        assert [validator.failure_count
+                for validator in instance.validators['id']] == [0, 2]
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_simple_csv_validator_parser_backends():
+    class SimpleCSVFileValidatorTest(SimpleCSVFileValidator):
+        validators = {'id': [IntVal(), UniqueVal()],
+                      'kind': [EnumVal(['a', 'b'])]}
+
+    class SplitValidator(SimpleCSVFileValidatorTest):
+        parser = 'split'
+
+    class ArrowValidator(SimpleCSVFileValidatorTest):
+        parser = 'pyarrow'
+
+    class UnknownValidator(SimpleCSVFileValidatorTest):
+        parser = 'fast'
+
+    try:
+        import pyarrow  # noqa
+        backends = (SplitValidator, ArrowValidator)
+    except ImportError:
+        backends = (SplitValidator,)
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'feed.csv')
+        with open(path, 'w') as f:
+            f.write('id,kind\n1,a\n2,c\n\nx,b\n2,a\n3\n4,a,x\n')
+        for loader in (LocalFileLoader, BinaryFileLoader):
+            expected = SimpleCSVFileValidatorTest(loader(path))()
+            for backend in backends:
+                result = backend(loader(path))()
+                assert not result.validation and not expected.validation
+                assert result.log[1:] == expected.log[1:], result.log
+
+        # Header-only files have no rows
+        with open(path, 'w') as f:
+            f.write('id,kind\n')
+        for loader in (LocalFileLoader, BinaryFileLoader):
+            for backend in backends:
+                instance = backend(loader(path))
+                assert instance.validate()
+                assert instance.rows == 0
+        instance = UnknownValidator(LocalFileLoader(path))
+        assert_raises(ValidationConfigurationException, instance.validate)
+    finally:
+        shutil.rmtree(workdir)
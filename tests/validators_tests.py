@@ -3,18 +3,29 @@
 #
 
 
-from nose.tools import raises
+import os
+import pickle
+import shutil
+import datetime
+import tempfile
+
+
+from nose.tools import assert_raises, raises
 from csv.toolkit.validation import (
     BaseValidator,
     BaseTypeValidator,
     IntVal,
     FloatVal,
     BoolVal,
+    RangeVal,
     EnumVal,
     UniqueVal,
     RegexVal,
     EmptyVal,
     AnyVal,
+    ForeignKeyVal,
+    DateTimeVal,
+    ValidationException,
     ValidationConfigurationException,
 )
 
@@ -35,3 +46,149 @@ def test_unique_val_validation_configuration_exception():
     instance = UniqueVal(['value1', 'value2',])
     validation_args = {'field': 'value1', 'row': {'value1': "",}}
     instance.validate(**validation_args)
+
+
+def test_foreign_key_val_index_reused_and_rebuilt():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        reference = os.path.join(tmpdir, 'customers.csv')
+        with open(reference, 'w') as f:
+            f.write('id,name\nc1,foo\nc2,bar\n')
+        instance = ForeignKeyVal(reference, 'id')
+        instance.validate('c1')
+        assert_raises(ValidationException, instance.validate, 'c3')
+        assert instance.fails() == set(['c3']), instance.fails()
+        assert os.path.exists(reference + '.idx.sqlite')
+        instance.index.close()
+
+        with open(reference, 'a') as f:
+            f.write('c3,baz\n')
+        instance = ForeignKeyVal(reference, 'id')
+        instance.validate('c3')
+        assert len(instance.index) == 3, len(instance.index)
+        instance.index.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_foreign_key_val_non_ascii_keys():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        reference = os.path.join(tmpdir, 'cities.csv')
+        with open(reference, 'wb') as f:
+            f.write(u'id,name\nz\u00fcrich,Z\u00fcrich\n'.encode('utf-8'))
+        instance = ForeignKeyVal(reference, 'id')
+        instance.validate(u'z\u00fcrich')
+        instance.validate(u'z\u00fcrich'.encode('utf-8'))
+        assert_raises(ValidationException, instance.validate,
+                      u'k\u00f6ln'.encode('utf-8'))
+        assert_raises(ValidationException, instance.validate, b'z\xfcrich')
+        assert len(instance.index) == 1, len(instance.index)
+        instance.index.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@raises(ValidationConfigurationException)
+def test_foreign_key_val_missing_reference_column():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        reference = os.path.join(tmpdir, 'customers.csv')
+        with open(reference, 'w') as f:
+            f.write('id,name\nc1,foo\n')
+        ForeignKeyVal(reference, 'sku').validate('c1')
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_spawn_resets_run_state():
+    instance = UniqueVal()
+    instance.validate('a', row={'a': 'a'})
+    assert_raises(ValidationException, instance.validate, 'a', {'a': 'a'})
+    instance.failure_count += 1
+    spawned = instance.spawn()
+    assert spawned.failure_count == 0, spawned.failure_count
+    assert spawned.fails() == set([]), spawned.fails()
+    spawned.validate('a', row={'a': 'a'})
+    assert instance.fails() == set([('a',)]), instance.fails()
+
+
+def test_validators_accept_bytes_fields():
+    EnumVal(['a', 'b']).validate(b'a')
+    RegexVal(r'^\d+$').validate(b'123')
+    RegexVal(b'^x$').validate('x')
+    EmptyVal().validate(b'')
+    IntVal().validate(b'42')
+    instance = EnumVal(['a'])
+    assert_raises(ValidationException, instance.validate, b'c')
+    assert instance.fails() == set([b'c']), instance.fails()
+    try:
+        RegexVal(r'^\d+$').validate(b'abc')
+    except ValidationException as exc:
+        assert str(exc) == "'abc' does not match pattern /^\\d+$/", str(exc)
+
+
+def test_date_time_val_fixed_width_formats():
+    instance = DateTimeVal('%Y-%m-%d')
+    instance.validate('2016-02-29')
+    instance.validate(b'2016-02-29')
+    for invalid in ('2015-02-29', '2016-2-29', '2016/02/29', '20160229',
+                    '2016-02-29 ', '', b'2016-13-01'):
+        assert_raises(ValidationException, instance.validate, invalid)
+    assert instance.failure_count == 0  # Counted by the file validator
+    assert len(instance.fails()) == 7
+
+    instance = DateTimeVal('%d/%m/%y %H%M', empty_ok=True)
+    instance.validate('')
+    assert instance.parse('31/12/68 2359') == \
+        datetime.datetime(2068, 12, 31, 23, 59)
+    assert instance.parse('01/01/69 0000') == datetime.datetime(1969, 1, 1)
+    assert_raises(ValidationException, instance.validate, '32/12/68 2359')
+
+    instance = DateTimeVal('%Y-%m-%dT%H:%M:%S')
+    assert instance.parse('2016-01-02T03:04:05') == \
+        datetime.datetime(2016, 1, 2, 3, 4, 5)
+    assert_raises(ValidationException, instance.validate,
+                  '2016-01-02T03:04:05.123')
+
+
+def test_date_time_val_strptime_fallback_and_bounds():
+    instance = DateTimeVal('%d %b %Y', min_value=datetime.date(2016, 1, 1),
+                           max_value='31 Dec 2016')
+    instance.validate('29 Feb 2016')
+    try:
+        instance.validate('31 Dec 2015')
+    except ValidationException as exc:
+        assert str(exc) == "'31 Dec 2015' is before 2016-01-01 00:00:00"
+    else:
+        assert False, 'Expected a ValidationException'
+    assert_raises(ValidationException, instance.validate, '1 Jan 2017')
+    assert_raises(ValidationException, instance.validate, '2016-01-01')
+    assert instance.parse_batch(['1 Jan 2016', 'x', '1 Jan 2016']) == [
+        datetime.datetime(2016, 1, 1), None, datetime.datetime(2016, 1, 1)]
+
+    spawned = instance.spawn()
+    assert spawned.cache is instance.cache
+    assert not spawned.fails() and instance.fails()
+
+
+def test_range_val_bounds():
+    instance = RangeVal(0, 10, cast=int, empty_ok=True)
+    for field in ('0', '10', b'7', ''):
+        instance.validate(field)
+    for field in ('-1', '11', 'x', '1.5'):
+        assert_raises(ValidationException, instance.validate, field)
+    assert instance.fails() == set(['-1', '11', 'x', '1.5'])
+    try:
+        RangeVal(max_value=1.5).validate('2')
+    except ValidationException as exc:
+        assert str(exc) == "'2' is greater than 1.5"
+    else:
+        assert False, 'Expected a ValidationException'
+
+
+def test_validators_pickle_configuration():
+    instance = pickle.loads(pickle.dumps(
+        DateTimeVal('%Y-%m-%d', max_value='2016-12-31')))
+    instance.validate('2016-02-29')
+    assert_raises(ValidationException, instance.validate, '2017-01-01')